@@ -8,7 +8,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_restful import Resource
 from directorofme.flask import versioned_api, directorofme_app, JWTManager
-from directorofme.flask.api import Spec
+from directorofme.flask.api import Spec, cached
 from directorofme.authorization import groups, orm
 from flask_marshmallow import Marshmallow
 from directorofme.flask import DOMSQLAlchemy
@@ -39,6 +39,7 @@ from . import resources
 
 @api.resource("/swagger.json", endpoint="spec_api")
 class Spec(Resource):
+    @cached()
     def get(self):
         return spec.to_dict()
 
@@ -57,12 +57,20 @@ class App(db.Model):
     #: Groups this app would like to add into the session
     requested_access_groups = relationship("Group", secondary=requested_access_groups, backref="requested_by")
 
+    #: relationships dumped with this :class:`.App` (part of its ETag)
+    etag_relationships = ("requested_access_groups",)
+
     listens_for = Column(ARRAY(String), nullable=False, default=tuple())
 
     @property
     def requested_scopes(self):
         return Group.scopes(self.requested_access_groups)
 
+    @property
+    def requested_scope_names(self):
+        '''display names of :attr:`requested_access_groups` (as dumped by the API)'''
+        return [ g.display_name for g in self.requested_access_groups ]
+
     def install_for_group(self, group, config=None, access_groups=None, **perms):
         if access_groups is None:
             access_groups = self.requested_access_groups
@@ -110,6 +118,9 @@ class InstalledApp(db.Model):
     #: Groups this app will mix into session
     access_groups = relationship("Group", secondary=granted_access_groups)
 
+    #: relationships dumped with this :class:`.InstalledApp` (part of its ETag)
+    etag_relationships = ("app", "access_groups")
+
     @property
     def app_slug(self):
         return self.app.slug
@@ -117,3 +128,8 @@ class InstalledApp(db.Model):
     @property
     def scopes(self):
         return Group.scopes(self.access_groups)
+
+    @property
+    def scope_names(self):
+        '''display names of :attr:`access_groups` (as dumped by the API)'''
+        return [ g.display_name for g in self.access_groups ]
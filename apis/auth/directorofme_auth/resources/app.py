@@ -2,6 +2,8 @@ import flask
 import copy
 import jsonschema
 
+from concurrent.futures import ThreadPoolExecutor
+
 from directorofme.authorization import groups as groups_module, requires, session
 from directorofme.client import DOM, ClientError
 
@@ -11,7 +13,10 @@ from sqlalchemy import and_, or_
 from . import api, schemas
 from .. import models, db, app as flask_app, spec, dom_events
 from directorofme.flask.api import dump_with_schema, load_with_schema, with_pagination_params, first_or_abort,\
-                                   load_query_params, Resource, uuid_or_abort
+                                   load_query_params, Resource, uuid_or_abort, cached_with_schema
+
+#: events are pushed to installed apps concurrently, on (at most) this many threads per worker
+push_executor = ThreadPoolExecutor(max_workers=8)
 
 @spec.register_resource
 @api.resource("/apps/<string:slug>", endpoint="apps_api")
@@ -23,9 +28,9 @@ class App(Resource):
     def validate(cls, data, _=None):
         """validate and transform a request to a `generic_(update|insert)`able dict."""
         data = copy.deepcopy(data)
-        if "requested_scopes" in data:
+        if "requested_scope_names" in data:
             requested_scopes = [ groups_module.Group(display_name=s, type=groups_module.GroupTypes.scope).name
-                                     for s in data.pop("requested_scopes") ]
+                                     for s in data.pop("requested_scope_names") ]
             data["requested_access_groups"] = models.Group.query.filter(and_(
                 models.Group.name.in_(requested_scopes),
                 models.Group.type == groups_module.GroupTypes.scope
@@ -49,7 +54,9 @@ class App(Resource):
 
         return data
 
-    @dump_with_schema(schemas.AppSchema)
+    # requested_scopes are dumped from the groups of the app, through its association table
+    @cached_with_schema(schemas.AppSchema, models.App, models.Group,
+                        models.App.requested_access_groups.property.secondary)
     def get(self, slug):
         """
         ---
@@ -61,11 +68,13 @@ class App(Resource):
             200:
                 description: Successfully retrieve an App
                 schema: AppSchema
+            304:
+                description: The App has not changed since the ETag passed with If-None-Match.
             404:
                 description: Could not find an App with current access level.
                 schema: ErrorSchema
         """
-        return first_or_abort(models.App.query.filter(models.App.slug == slug))
+        return first_or_abort(models.App.query.filter(models.App.slug == slug), Schema=schemas.AppSchema)
 
     @load_with_schema(schemas.AppSchema)
     @dump_with_schema(schemas.AppSchema)
@@ -243,7 +252,8 @@ class AppDecrypt(Resource):
 @api.resource("/apps/", endpoint="apps_collection_api")
 class Apps(Resource):
     ### TODO: Search
-    @dump_with_schema(schemas.AppCollectionSchema)
+    @cached_with_schema(schemas.AppCollectionSchema, models.App, models.Group,
+                        models.App.requested_access_groups.property.secondary)
     @with_pagination_params()
     def get(self, page=1, results_per_page=50):
         """
@@ -263,12 +273,12 @@ class Apps(Resource):
         """
         return self.paged(models.App.query, page, results_per_page, models.App.name)
 
-    @load_with_schema(schemas.AppSchema)
+    @load_with_schema(schemas.AppSchema, bulk=True)
     @dump_with_schema(schemas.AppSchema)
     def post(self, app_data):
         """
         ---
-        description: Apply a partial update to an App.
+        description: Create a new App, or a list of new Apps in one transaction.
         parameters:
             - api_version
             - slug
@@ -276,6 +286,9 @@ class Apps(Resource):
               in: body
               schema: AppSchema
         responses:
+            200:
+                description: Successfully created a list of new Apps.
+                schema: BulkResultsSchema
             201:
                 description: Successfully updated App.
                 headers:
@@ -296,6 +309,8 @@ class Apps(Resource):
                 description: Requested a scope that does not exist
                 schema: ErrorSchema
         """
+        if isinstance(app_data, list):
+            return self.bulk_insert(db, api, models.App, [ App.validate(d) for d in app_data ], "slug", url_cls=App)
         return self.generic_insert(db, api, models.App, App.validate(app_data), "slug", url_cls=App)
 
 
@@ -306,27 +321,27 @@ class PushEventToApps(Resource):
     @load_with_schema(schemas.Event)
     def post(self, event_data, group):
         push_client = DOM.from_request(flask.request, flask_app)
-        errors = []
-
-        for installed_app in models.InstalledApp.query.join(models.InstalledApp.app).filter(and_(
+        event = schemas.Event().dump(event_data)[0]
+        pushes = [
+            (installed_app.id, installed_app.app.event_url.url, {
+                "event": event,
+                "installed_app": schemas.InstalledAppSchema().dump(installed_app)[0]
+            }) for installed_app in models.InstalledApp.query.join(models.InstalledApp.app).filter(and_(
                 models.App.listens_for.any(event_data["event_type_slug"]),
                 models.App.event_url != None
             )).filter(or_(
                 models.InstalledApp._permissions_read_0 == group,
                 models.InstalledApp._permissions_read_1 == group
-            )
-        ):
+            ))
+        ]
+
+        def push(installed_app_id, url, data):
             try:
-                push_client.post(installed_app.app.event_url.url, data={
-                    "event": schemas.Event().dump(event_data)[0],
-                    "installed_app": schemas.InstalledAppSchema().dump(installed_app)[0]
-                })
+                push_client.post(url, data=data)
             except ClientError as e:
-                errors.append({
-                    "installed_app_id": str(installed_app.id),
-                    "message": str(e)
-                })
+                return { "installed_app_id": str(installed_app_id), "message": str(e) }
 
+        errors = [ error for error in push_executor.map(lambda p: push(*p), pushes) if error is not None ]
         if errors:
             return {
                 "message": "\n".join(["{}: {}".format(err["installed_app_id"], err["message"]) for err in errors])
@@ -412,9 +427,9 @@ class InstalledApp(Resource):
         else:
             data["app"] = first_or_abort(models.App.query.filter(models.App.slug == app_slug), 409)
 
-        if "scopes" in data:
+        if "scope_names" in data:
             scopes = [ groups_module.Group(display_name=s, type=groups_module.GroupTypes.scope).name
-                                           for s in data.pop("scopes") ]
+                                           for s in data.pop("scope_names") ]
 
             data["access_groups"] = models.Group.query.filter(and_(
                 models.Group.name.in_(scopes),
@@ -452,11 +467,14 @@ class InstalledApp(Resource):
             200:
                 description: Successfully retrieve an InstalledApp
                 schema: InstalledAppSchema
+            304:
+                description: The InstalledApp has not changed since the ETag passed with If-None-Match.
             404:
                 description: Could not find an InstalledApp with current access level.
                 schema: ErrorSchema
         """
-        return first_or_abort(models.InstalledApp.query.filter(models.InstalledApp.id == uuid_or_abort(id)))
+        return first_or_abort(models.InstalledApp.query.filter(models.InstalledApp.id == uuid_or_abort(id)),
+                              Schema=schemas.InstalledAppSchema)
 
     @load_with_schema(schemas.InstalledAppSchema)
     @dump_with_schema(schemas.InstalledAppSchema)
@@ -570,6 +588,7 @@ class InstalledApps(Resource):
         parameters:
             - api_version
             - page - results_per_page
+            - fields
             - name: app
               in: query
               description: slug of App to filter by.
@@ -34,7 +34,7 @@ class Group(Resource):
                 description: Could not find a Group with current access level.
                 schema: ErrorSchema
         """
-        return first_or_abort(models.Group.query.filter(models.Group.name == name))
+        return first_or_abort(models.Group.query.filter(models.Group.name == name), Schema=schemas.GroupSchema)
 
     @load_with_schema(schemas.GroupSchema)
     @dump_with_schema(schemas.GroupSchema)
@@ -370,19 +370,22 @@ class Groups(Resource):
         return self.paged(query, page, results_per_page, models.Group.created, type=type,
                           scope_name=scope_name)
 
-    @load_with_schema(schemas.GroupSchema)
+    @load_with_schema(schemas.GroupSchema, bulk=True)
     @dump_with_schema(schemas.GroupSchema)
     def post(self, group_data):
         """
         ---
-        description: Create a new event type.
+        description: Create a new group, or a list of new groups in one transaction.
         parameters:
             - api_version
             - in: body
               schema: GroupSchema
-              description: Data to create the group type with.
+              description: Data to create the group (or a list of groups) with.
               name: group_data
         responses:
+            200:
+                description: Successfully created a list of new objects.
+                schema: BulkResultsSchema
             201:
                 description: Successfully created the new object.
                 schema: GroupSchema
@@ -398,4 +401,59 @@ class Groups(Resource):
                 description: No permission to create a new Group object.
                 schema: ErrorSchema
         """
+        if isinstance(group_data, list):
+            return self.bulk_insert(db, api, models.Group, group_data, "name", url_cls=Group)
         return self.generic_insert(db, api, models.Group, group_data, "name", url_cls=Group)
+
+    @load_with_schema(schemas.GroupSchema, bulk_key="name", partial=True)
+    @dump_with_schema(schemas.GroupSchema)
+    def patch(self, groups_data):
+        """
+        ---
+        description: Partially update a list of groups (identified by `name`) in one transaction.
+        parameters:
+            - api_version
+            - in: body
+              schema: GroupSchema
+              description: List of group data to update, each including the `name` to update.
+              name: groups_data
+        responses:
+            200:
+                description: Per-Group results (200 or 301), when all of them succeeded.
+                schema: BulkResultsSchema
+            207:
+                description: Per-Group results, when only some of them succeeded. If none did, the response has their shared status (403 or 404).
+                schema: BulkResultsSchema
+            400:
+                description: Validation error on save or in request body.
+                schema: ErrorSchema
+        """
+        return self.bulk_update(db, api, models.Group, "name", groups_data, url_cls=Group)
+
+    @load_with_schema(schemas.GroupSchema, bulk_key="name", partial=True)
+    @dump_with_schema(schemas.GroupSchema)
+    def delete(self, groups_data):
+        """
+        ---
+        description: Delete a list of groups (identified by `name`) in one transaction.
+        parameters:
+            - api_version
+            - in: body
+              schema: GroupSchema
+              description: List of groups to delete, each including the `name` to delete.
+              name: groups_data
+        responses:
+            200:
+                description: Per-Group results (204), when all of them succeeded.
+                schema: BulkResultsSchema
+            207:
+                description: Per-Group results, when only some of them succeeded. If none did, the response has their shared status (403 or 404).
+                schema: BulkResultsSchema
+            400:
+                description: Invalid request body.
+                schema: ErrorSchema
+            409:
+                description: A Group to delete is still referenced.
+                schema: ErrorSchema
+        """
+        return self.bulk_delete(db, models.Group, "name", [ name for name,_ in groups_data ])
@@ -177,7 +177,8 @@ class AppSchema(marshmallow.Schema):
     slug = marshmallow.String(required=True, dump_only=True)
     created = marshmallow.DateTime(dump_only=True)
     updated = marshmallow.DateTime(dump_only=True)
-    requested_scopes = marshmallow.Method(serialize="dump_scopes", deserialize="load_scopes", required=True)
+    # a plain list (not a Method field) so the App can be ETag'd, see `App.etag_relationships`
+    requested_scopes = marshmallow.List(marshmallow.String, attribute="requested_scope_names", required=True)
     listens_for = marshmallow.List(marshmallow.String, required=True)
 
     _links = marshmallow.Hyperlinks({
@@ -187,14 +188,6 @@ class AppSchema(marshmallow.Schema):
         "install": marshmallow.URLFor("auth.apps_install_app_api", app="<slug>")
     }, dump_only=True)
 
-    def load_scopes(self, value):
-        return marshmallow.List(marshmallow.String)._deserialize(value, None, None)
-
-    def dump_scopes(self, obj):
-        return marshmallow.List(marshmallow.String)._serialize([
-            g.display_name for g in obj.requested_access_groups
-        ], None, None)
-
 
 @spec.register_schema("AppCollectionSchema")
 class AppCollectionSchema(spec.paginated_collection_schema(AppSchema, "auth.apps_collection_api")):
@@ -228,6 +221,7 @@ class AppDecryptSchema(AppEncryptSchema):
 class InstallAppSchema(InstalledAppRequest):
     # just basically remove stuff we don't care about
     app_slug = marshmallow.String(required=False)
+    scopes = marshmallow.List(marshmallow.String, attribute="scope_names")
 
 
 @spec.register_schema("InstalledAppSchema")
@@ -236,7 +230,7 @@ class InstalledAppSchema(InstalledAppRequest):
     created = marshmallow.DateTime(dump_only=True)
     updated = marshmallow.DateTime(dump_only=True)
 
-    scopes = marshmallow.Method(serialize="dump_scopes", deserialize="load_scopes", required=True)
+    scopes = marshmallow.List(marshmallow.String, attribute="scope_names", required=True)
 
     _links = marshmallow.Hyperlinks({
         "self": marshmallow.URLFor("auth.installed_apps_api", id="<id>"),
@@ -244,14 +238,6 @@ class InstalledAppSchema(InstalledAppRequest):
         "app": marshmallow.URLFor("auth.apps_api", slug="<app_slug>")
     }, dump_only=True)
 
-    def load_scopes(self, value):
-        return marshmallow.List(marshmallow.String)._deserialize(value, None, None)
-
-    def dump_scopes(self, obj):
-        return marshmallow.List(marshmallow.String)._serialize([
-            g.display_name for g in obj.access_groups
-        ], None, None)
-
 
 @spec.register_schema("InstalledAppCollectionSchema")
 class InstalledAppCollectionSchema(
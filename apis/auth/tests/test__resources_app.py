@@ -119,6 +119,38 @@ class TestApp:
 
         assert response == canned_app_response
 
+    def test__get_conditional(self, db, app, test_client):
+        url = "/api/-/auth/apps/{}".format(app.slug)
+        with token_mock(authorized_for_read_identity):
+            response = test_client.get(url)
+            assert response.status_code == 200 and response.headers.get("ETag"), "apps are ETag'd"
+            etag = response.headers["ETag"]
+            response = test_client.get(url, headers={ "If-None-Match": etag })
+            assert response.status_code == 304, "unchanged apps are not modified"
+
+        with real_db.Model.disable_permissions():
+            existing(app).desc = "Changed"
+            db.session.commit()
+
+        with token_mock(authorized_for_read_identity):
+            response = test_client.get(url, headers={ "If-None-Match": etag })
+            assert response.status_code == 200, "changed apps are sent"
+            assert response.headers["ETag"] != etag, "with a new ETag"
+
+    def test__get_renamed_scope(self, db, app, test_client):
+        url = "/api/-/auth/apps/{}".format(app.slug)
+        with token_mock(authorized_for_read_identity):
+            assert "test-read" in dict_from_response(test_client.get(url))["requested_scopes"], "scope dumped"
+
+        with real_db.Model.disable_permissions():
+            group = next(g for g in existing(app).requested_access_groups if g.display_name == "test-read")
+            group.display_name = "renamed"
+            db.session.commit()
+
+        with token_mock(authorized_for_read_identity):
+            scopes = dict_from_response(test_client.get(url))["requested_scopes"]
+            assert "renamed" in scopes and "test-read" not in scopes, "cached apps invalidated by renamed groups"
+
     def test__put(self, db, app, test_client, canned_app_response):
         url = "/api/-/auth/apps/{}".format(app.slug)
         put_obj = canned_app_response
@@ -362,6 +394,24 @@ class TestInstalledApp:
             response["scopes"].sort()
             assert response == canned_installed_app_response, "response is correct"
 
+    def test__get_conditional(self, db, request_context, test_client, installed_app):
+        url = "/api/-/auth/installed_apps/{}".format(str(installed_app.id))
+        with token_mock(authorized_for_read_identity):
+            response = test_client.get(url)
+            assert response.status_code == 200 and response.headers.get("ETag"), "installed apps are ETag'd"
+            etag = response.headers["ETag"]
+            response = test_client.get(url, headers={ "If-None-Match": etag })
+            assert response.status_code == 304, "unchanged installed apps are not modified"
+
+        with real_db.Model.disable_permissions():
+            existing(installed_app).access_groups[0].display_name = "renamed"
+            db.session.commit()
+
+        with token_mock(authorized_for_read_identity):
+            response = test_client.get(url, headers={ "If-None-Match": etag })
+            assert response.status_code == 200, "renamed scopes are sent"
+            assert "renamed" in dict_from_response(response)["scopes"], "with their new name"
+
     def test__put(self, db, request_context, test_client, installed_app, canned_installed_app_response):
         url = "/api/-/auth/installed_apps/{}".format(str(installed_app.id))
         put_obj = canned_installed_app_response
@@ -7,7 +7,7 @@ from flask_restful import Resource
 
 from directorofme.flask import directorofme_app
 from directorofme.client import DOM
-from directorofme.flask.api import Spec
+from directorofme.flask.api import Spec, cached
 from directorofme.authorization.orm import PermissionedQuery
 from directorofme.authorization.groups import Scope
 from directorofme.flask import versioned_api, DOMSQLAlchemy, JWTManager
@@ -37,6 +37,7 @@ from . import resources
 
 @api.resource("/swagger.json", endpoint="spec_api")
 class Spec(Resource):
+    @cached()
     def get(self):
         return spec.to_dict()
 
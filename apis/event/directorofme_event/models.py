@@ -44,6 +44,9 @@ class Event(db.Model):
     #: type of :class:`.EventType` this :class:`.Event` is.
     event_type = relationship(EventType)
 
+    #: relationships dumped with this :class:`.Event` (part of its ETag)
+    etag_relationships = ("event_type",)
+
     #: time the :class:`.Event` occured
     event_time = Column(DateTime, nullable=False, default=func.now())
 
@@ -1,11 +1,16 @@
 from furl import furl
 from flask_restful import abort
+from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
 
 from directorofme.schemas import Event
 from directorofme.authorization.exceptions import PermissionDeniedError
 from directorofme.flask.api import dump_with_schema, load_with_schema, with_pagination_params, \
-                                   uuid_or_abort, first_or_abort, load_query_params, with_cursor_params, Resource
+                                   uuid_or_abort, first_or_abort, load_query_params, with_cursor_params, \
+                                   dump_cursor, stream_with_schema, cached_with_schema, Resource
+from directorofme.flask.queries import query_budget
+from directorofme.flask.replicas import replica_reads
 
 from . import models, db, marshmallow, spec, api, push_client
 
@@ -46,7 +51,8 @@ class EventType(Resource):
                 description: Could not find an EventType with current access level.
                 schema: ErrorSchema
         """
-        return first_or_abort(models.EventType.query.filter(models.EventType.slug == slug))
+        return first_or_abort(models.EventType.query.filter(models.EventType.slug == slug),
+                              Schema=self.EventTypeSchema)
 
 
     @load_with_schema(EventTypeSchema)
@@ -155,7 +161,7 @@ class EventTypes(Resource):
     ):
         pass
 
-    @dump_with_schema(EventTypeCollectionSchema)
+    @cached_with_schema(EventTypeCollectionSchema, models.EventType)
     @with_pagination_params()
     def get(self, page=1, results_per_page=50):
         """
@@ -176,19 +182,22 @@ class EventTypes(Resource):
         return self.paged(models.EventType.query, page, results_per_page, models.EventType.created)
 
 
-    @load_with_schema(EventType.EventTypeSchema)
+    @load_with_schema(EventType.EventTypeSchema, bulk=True)
     @dump_with_schema(EventType.EventTypeSchema)
     def post(self, event_type_data):
         """
         ---
-        description: Create a new event type.
+        description: Create a new event type, or a list of new event types in one transaction.
         parameters:
             - api_version
             - in: body
               schema: EventTypeSchema
-              description: Data to create the event type with.
+              description: Data to create the event type (or a list of event types) with.
               name: event_type
         responses:
+            200:
+                description: Successfully created a list of new objects.
+                schema: BulkResultsSchema
             201:
                 description: Successfully created the new object.
                 schema: EventTypeSchema
@@ -198,14 +207,81 @@ class EventTypes(Resource):
                         type: string
                         format: url
             400:
-                description: Validation Error when creating the new object.
+                description: Validation Error when creating the new object(s).
                 schema: ErrorSchema
             403:
                 description: No permission to create a new EventType object.
                 schema: ErrorSchema
         """
+        if isinstance(event_type_data, list):
+            return self.bulk_insert(db, api, models.EventType, event_type_data, "slug", url_cls=EventType)
         return self.generic_insert(db, api, models.EventType, event_type_data, "slug", url_cls=EventType)
 
+    @load_with_schema(EventType.EventTypeSchema, bulk_key="slug", partial=True)
+    @dump_with_schema(EventType.EventTypeSchema)
+    def patch(self, event_types_data):
+        """
+        ---
+        description: Partially update a list of event types (identified by `slug`) in one transaction.
+        parameters:
+            - api_version
+            - in: body
+              schema: EventTypeSchema
+              description: List of event type data to update, each including the `slug` to update.
+              name: event_types
+        responses:
+            200:
+                description: Per-EventType results (200 or 301), when all of them succeeded.
+                schema: BulkResultsSchema
+            207:
+                description: Per-EventType results, when only some of them succeeded. If none did, the response has their shared status (403 or 404).
+                schema: BulkResultsSchema
+            400:
+                description: Validation error on save or in request body.
+                schema: ErrorSchema
+        """
+        return self.bulk_update(db, api, models.EventType, "slug", event_types_data, url_cls=EventType)
+
+    @load_with_schema(EventType.EventTypeSchema, bulk_key="slug", partial=True)
+    @dump_with_schema(EventType.EventTypeSchema)
+    def delete(self, event_types_data):
+        """
+        ---
+        description: Delete a list of event types (identified by `slug`) in one transaction.
+        parameters:
+            - api_version
+            - in: body
+              schema: EventTypeSchema
+              description: List of event types to delete, each including the `slug` to delete.
+              name: event_types
+        responses:
+            200:
+                description: Per-EventType results (204), when all of them succeeded.
+                schema: BulkResultsSchema
+            207:
+                description: Per-EventType results, when only some of them succeeded. If none did, the response has their shared status (403 or 404).
+                schema: BulkResultsSchema
+            400:
+                description: Invalid request body.
+                schema: ErrorSchema
+            409:
+                description: A EventType to delete is still referenced.
+                schema: ErrorSchema
+        """
+        return self.bulk_delete(db, models.EventType, "slug", [ slug for slug,_ in event_types_data ])
+
+
+def with_event_types(query):
+    """
+    Load each event's :class:`.EventType` in the same query. Only the primary entity of a permissioned query
+    is filtered, so EventType's select permissions are applied to the join: events of types the session
+    can't read are left out, as they can't be dumped without their type.
+    """
+    on = models.Event.event_type_id == models.EventType.id
+    if models.EventType.permissions_enabled():
+        on = and_(on, models.EventType.permissions_criterion("select"))
+    return query.join(models.EventType, on).options(contains_eager(models.Event.event_type))
+
 
 @api.resource("/events/<string:id>", endpoint="events_api")
 class Event(Resource):
@@ -245,7 +321,8 @@ class Event(Resource):
                 description: Could not find an EventType with current access level.
                 schema: ErrorSchema
         """
-        return first_or_abort(models.Event.query.filter(models.Event.id == uuid_or_abort(id)))
+        return first_or_abort(models.Event.query.filter(models.Event.id == uuid_or_abort(id)),
+                              Schema=self.EventSchema)
 
     def delete(self, id):
         """
@@ -274,17 +351,11 @@ class Events(Resource):
         collection = marshmallow.Nested(Event.EventSchema, many=True)
 
         _links = marshmallow.Hyperlinks({
-            "self": marshmallow.URLFor("event.events_collection_api",
-                                       event_type_slug="<event_type_slug>",
-                                       since_id="<since_id>", max_id="<max_id>",
+            "self": marshmallow.URLFor("event.events_collection_api", cursor="<cursor>",
                                        results_per_page="<results_per_page>"),
-            "next": marshmallow.URLFor("event.events_collection_api",
-                                       event_type_slug="<event_type_slug>",
-                                       since_id="<next_since_id>", max_id="<next_max_id>",
+            "next": marshmallow.URLFor("event.events_collection_api", cursor="<next_cursor>",
                                        results_per_page="<results_per_page>"),
-            "prev": marshmallow.URLFor("event.events_collection_api",
-                                       event_type_slug="<event_type_slug>",
-                                       since_id="<prev_since_id>", max_id="<prev_max_id>",
+            "prev": marshmallow.URLFor("event.events_collection_api", cursor="<prev_cursor>",
                                        results_per_page="<results_per_page>"),
         })
 
@@ -292,16 +363,29 @@ class Events(Resource):
     class EventCollectionQuerySchema(marshmallow.Schema):
         event_type_slug = marshmallow.String()
 
+    class EventCursorSchema(marshmallow.Schema):
+        since = marshmallow.Integer()
+        max = marshmallow.Integer()
+        event_type_slug = marshmallow.String()
+
+    @classmethod
+    def cursor_from_id(cls, id_):
+        """Look up the internal cursor for an event id (only used by the since_id/max_id parameters)"""
+        return first_or_abort(models.Event.query.filter(models.Event.id == id_), 409).cursor
+
+    @replica_reads
+    @query_budget(2)
     @dump_with_schema(EventCollectionSchema)
-    @with_cursor_params()
+    @with_cursor_params(CursorSchema=EventCursorSchema)
     @load_query_params(EventCollectionQuerySchema)
-    def get(self, results_per_page=50, event_type_slug=None, since_id=None, max_id=None):
+    def get(self, results_per_page=50, event_type_slug=None, since_id=None, max_id=None, cursor=None):
         """
         ---
         description: Retrieve a collection of event types.
         parameters:
             - api_version
             - results_per_page
+            - cursor
             - in: query
               name: event_type_slug
               type: string
@@ -310,12 +394,12 @@ class Events(Resource):
               name: since_id
               type: string
               format: uuid
-              description: get all events since this event
+              description: get all events since this event (deprecated, prefer `cursor`)
             - in: query
               name: max_id
               type: string
               format: uuid
-              description: get all events prior to and including this event
+              description: get all events prior to and including this event (deprecated, prefer `cursor`)
         responses:
             200:
                 description: Successfully retrieved a collection of Event objects.
@@ -329,46 +413,47 @@ class Events(Resource):
         """
         results_per_page = min(max(results_per_page, 1), 50)
 
-        query = models.Event.query
-        if since_id:
-            #factor down to one query
-            after = first_or_abort(models.Event.query.filter(models.Event.id == since_id), 409)
-            query = query.filter(models.Event.cursor > after.cursor)
-        elif max_id:
-            before = first_or_abort(models.Event.query.filter(models.Event.id == max_id), 409)
-            query = query.filter(models.Event.cursor <= before.cursor)
+        # cursors carry the position and filters, since_id/max_id cost an extra lookup
+        if cursor is not None:
+            event_type_slug = cursor.get("event_type_slug")
+            since, max_ = cursor.get("since"), cursor.get("max")
+        else:
+            since = self.cursor_from_id(since_id) if since_id else None
+            max_ = self.cursor_from_id(max_id) if max_id and not since_id else None
+
+        # event types are needed for every event's links, load them with the events rather than one by one
+        query = self.sparse(with_event_types(models.Event.query), include=("cursor",))
+        if since is not None:
+            query = query.filter(models.Event.cursor > since)
+        elif max_ is not None:
+            query = query.filter(models.Event.cursor <= max_)
         if event_type_slug:
-            query = query.join(models.Event.event_type).filter(models.EventType.slug == event_type_slug)
+            query = query.filter(models.EventType.slug == event_type_slug)
 
         order_by = models.Event.cursor
         step = 1
         extra = 0
-        if max_id and not since_id:
+        if max_ is not None and since is None:
             order_by = order_by.desc()
             step = -1
             extra = 1
 
-
         objs = query.order_by(order_by).limit(results_per_page + extra).all()[::step]
 
-        if max_id and not since_id and len(objs) == results_per_page + extra:
-            since_id = objs[0].id
+        if max_ is not None and since is None and len(objs) == results_per_page + extra:
+            since = objs[0].cursor
             objs = objs[1:]
 
+        next_since = objs[-1].cursor if objs else since
         return {
-            # self query params
-            "event_type_slug": event_type_slug,
-            "since_id": since_id,
-            "max_id": max_id,
             "results_per_page": results_per_page,
 
-            # next query params
-            "next_since_id": objs[-1].id if objs else since_id,
-            "next_max_id": None,
-
-            # prev query params
-            "prev_since_id": None,
-            "prev_max_id": since_id,
+            # opaque cursors for self, next and prev
+            "cursor": dump_cursor(since=since, max=max_, event_type_slug=event_type_slug) \
+                          if since is not None or max_ is not None or event_type_slug else None,
+            "next_cursor": dump_cursor(since=next_since, event_type_slug=event_type_slug) \
+                               if next_since is not None or event_type_slug else None,
+            "prev_cursor": None if since is None else dump_cursor(max=since, event_type_slug=event_type_slug),
 
             # results
             "collection": objs,
@@ -414,8 +499,6 @@ class Events(Resource):
             ev = event[0] if isinstance(event, tuple) else event
             api_url = furl("auth/apps/push-event")
             api_url.path.segments.append(ev.read[0])
-            ###: TODO: only refresh on 401 in base library ... need to fix 401 first
-            push_client.refresh()
             ### START HERE -- THIS IS NOT SENDING A VALID ACCESS TOKEN
             push_client.post(api_url.url, data=Event.EventSchema().dump(ev)[0])
             ### GETTING EMTPY SESSION ON REQUEST, NOT PUSH SESSION
@@ -425,3 +508,55 @@ class Events(Resource):
             print("Error processing event: {}".format(e))
         finally:
             return event
+
+
+@api.resource("/events/export", endpoint="events_export_api")
+class EventsExport(Resource):
+    @spec.register_schema("EventExportQuery")
+    class EventExportQuerySchema(marshmallow.Schema):
+        event_type_slug = marshmallow.String()
+        start = marshmallow.DateTime()
+        end = marshmallow.DateTime()
+
+    @replica_reads
+    @stream_with_schema(Event.EventSchema)
+    @load_query_params(EventExportQuerySchema)
+    def get(self, event_type_slug=None, start=None, end=None):
+        """
+        ---
+        description: Stream all events in a time range as newline delimited JSON.
+        produces:
+            - application/x-ndjson
+        parameters:
+            - api_version
+            - in: query
+              name: event_type_slug
+              type: string
+              description: slug of event_type to export events for.
+            - in: query
+              name: start
+              type: string
+              format: date-time
+              description: export events which occured at or after this time.
+            - in: query
+              name: end
+              type: string
+              format: date-time
+              description: export events which occured before this time.
+        responses:
+            200:
+                description: One EventSchema object per line, gzipped if accepted by the client.
+                schema: EventSchema
+            400:
+                description: An invalid value was sent for a parameter.
+                schema: ErrorSchema
+        """
+        query = with_event_types(models.Event.query)
+        if event_type_slug:
+            query = query.filter(models.EventType.slug == event_type_slug)
+        if start is not None:
+            query = query.filter(models.Event.event_time >= start)
+        if end is not None:
+            query = query.filter(models.Event.event_time < end)
+
+        return query.order_by(models.Event.cursor)
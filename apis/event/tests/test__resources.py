@@ -1,9 +1,10 @@
 import uuid
 import json
 import copy
+import gzip
 
 from urllib.parse import urlparse
-from datetime import timezone
+from datetime import timezone, timedelta
 
 import pytest
 
@@ -14,6 +15,8 @@ from directorofme_event import app, spec, db as real_db
 from directorofme_event.models import Event, EventType
 from directorofme.testing import dict_from_response, token_mock, existing, dump_and_load, comparable_links,\
                                  scoped_identity, group_of_one, json_request
+from directorofme.flask.api import dump_cursor
+from directorofme_event.resources import EventTypes
 
 unscoped_identity = scoped_identity(app)
 authorized_for_read_identity = scoped_identity(app, real_db.Model.__scope__.read)
@@ -305,6 +308,94 @@ class TestEventTypes:
             assert mock_token.called, "mock used"
             assert response.status_code == 400, "duplicate slug returns 400"
 
+    def test__post_bulk(self, test_client):
+        url = "/api/-/event/event_types/"
+        data = [{"name": "A", "desc": "B", "data_schema": {}}, {"name": "C", "desc": "D"}]
+
+        with token_mock(authorized_for_all_identity) as mock_token:
+            response = json_request(test_client, "post", url, data=[{"name": "A"}])
+            assert mock_token.called, "mock used"
+            assert response.status_code == 400, "invalid objects return a 400"
+
+        with token_mock(unscoped_identity) as mock_token:
+            response = json_request(test_client, "post", url, data=data)
+            assert mock_token.called, "mock used"
+            assert response.status_code == 403, "valid post without permission returns 403"
+
+        with token_mock(authorized_for_all_identity) as mock_token:
+            response = json_request(test_client, "post", url, data=data)
+            assert mock_token.called, "mock used"
+            assert response.status_code == 200, "bulk results returned"
+
+            results = dict_from_response(response)["results"]
+            assert [r["status"] for r in results] == [201, 201], "every object created"
+            assert [r["body"]["slug"] for r in results] == ["a", "c"], "objects returned in order"
+            assert results[1]["headers"]["Location"].endswith("/api/-/event/event_types/c"), "location set"
+
+            response = json_request(test_client, "post", url, data=[{"name": "E", "desc": "F"}] + data)
+            assert response.status_code == 400, "duplicate slug returns 400"
+            assert test_client.get(url + "e").status_code == 404, "nothing created if any insert fails"
+
+    def test__patch_bulk(self, test_client, event_type):
+        url = "/api/-/event/event_types/"
+        data = [{"slug": event_type.slug, "desc": "Updated"}, {"slug": "missing", "desc": "Updated"},
+                {"slug": "test-conflict", "name": "Renamed"}]
+
+        with token_mock(authorized_for_read_identity) as mock_token:
+            response = json_request(test_client, "patch", url, data=data)
+            assert mock_token.called, "mock used"
+            assert [r["status"] for r in dict_from_response(response)["results"]] == [403, 404, 403], \
+                   "no permission returns a 403 per object"
+            assert response.status_code == 400, "every object failed, in different ways"
+
+        with token_mock(authorized_for_all_identity) as mock_token:
+            response = json_request(test_client, "patch", url, data={"desc": "Updated"})
+            assert mock_token.called, "mock used"
+            assert response.status_code == 400, "a list is required"
+
+            response = json_request(test_client, "patch", url, data=data)
+            assert response.status_code == 207, "bulk results returned, some of them failures"
+
+            results = dict_from_response(response)["results"]
+            assert [r["status"] for r in results] == [200, 404, 301], "per object results returned"
+            assert results[0]["body"]["desc"] == "Updated", "object updated"
+            assert results[2]["headers"]["Location"].endswith("/api/-/event/event_types/renamed"), \
+                   "renamed objects redirect"
+
+    def test__delete_bulk(self, test_client, event_type):
+        url = "/api/-/event/event_types/"
+        data = [{"slug": event_type.slug}, {"slug": "missing"}]
+
+        with token_mock(authorized_for_read_identity) as mock_token:
+            response = json_request(test_client, "delete", url, data=data)
+            assert mock_token.called, "mock used"
+            assert [r["status"] for r in dict_from_response(response)["results"]] == [403, 404], \
+                   "no permission returns a 403 per object"
+
+        with token_mock(authorized_for_all_identity) as mock_token:
+            response = json_request(test_client, "delete", url, data=data)
+            assert mock_token.called, "mock used"
+            assert [r["status"] for r in dict_from_response(response)["results"]] == [204, 404], \
+                   "per object results returned"
+            assert response.status_code == 207, "some objects deleted"
+            assert test_client.get(url + event_type.slug).status_code == 404, "object deleted"
+
+    def test__get_is_cached(self, test_client):
+        url = "/api/-/event/event_types/"
+        with token_mock(authorized_for_all_identity) as mock_token:
+            assert dict_from_response(test_client.get(url))["collection"] == [], "empty collection"
+            assert mock_token.called, "mock used"
+
+            with mock.patch.object(EventTypes, "paged") as mock_paged:
+                assert dict_from_response(test_client.get(url))["collection"] == [], "same collection returned"
+                assert not mock_paged.called, "cached response used"
+
+            response = json_request(test_client, "post", url, data={"name": "A", "desc": "B", "data_schema": {}})
+            assert response.status_code == 201, "entity created"
+
+            collection = dict_from_response(test_client.get(url))["collection"]
+            assert [e["slug"] for e in collection] == ["a"], "cache invalidated by write to the table"
+
 class TestEvent:
     def test__get(self, test_client, event):
         url = "/api/-/event/events/{}".format(str(event.id))
@@ -337,6 +428,36 @@ class TestEvent:
                 }
             }, "response well formed"
 
+    def test__get_conditional(self, test_client, db, event):
+        url = "/api/-/event/events/{}".format(str(event.id))
+        with token_mock(authorized_for_read_identity) as mock_token:
+            response = test_client.get(url)
+            assert mock_token.called, "mock used"
+            etag = response.headers["ETag"]
+            assert etag.startswith('W/"'), "weak etag returned"
+
+            response = test_client.get(url, headers={ "If-None-Match": etag })
+            assert response.status_code == 304, "unchanged event returns a 304"
+            assert response.headers["ETag"] == etag, "etag returned with 304"
+            assert response.data == b"", "304 has no body"
+
+            response = test_client.get(url, headers={ "If-None-Match": 'W/"other"' })
+            assert response.status_code == 200, "stale etag returns a 200"
+
+        with app.test_request_context(), real_db.Model.disable_permissions():
+            EventType.query.filter(EventType.id == event.event_type_id).one().name = "Renamed Event Type"
+            db.session.commit()
+
+        with token_mock(authorized_for_read_identity) as mock_token:
+            response = test_client.get(url, headers={ "If-None-Match": etag })
+            assert response.status_code == 200, "changes to the event type are not 304s"
+            assert response.json["_links"]["event_type"] == "/api/-/event/event_types/renamed-event-type", \
+                   "event type slug updated"
+
+        with token_mock(unscoped_identity) as mock_token:
+            response = test_client.get(url, headers={ "If-None-Match": etag })
+            assert response.status_code == 404, "etag does not bypass permissions"
+
     def test__delete(self, test_client, event):
         url = "/api/-/event/events/{}".format(event.id)
         with token_mock(unscoped_identity) as mock_token:
@@ -394,7 +515,45 @@ def event_collection(db):
     yield objs
 
 
+@pytest.fixture
+def event_of_hidden_type(db):
+    with app.test_request_context():
+        event_type = EventType(name="Hidden Event Type",
+                               desc="Only admins can read this",
+                               data_schema={ "a": "schema" },
+                               read=(groups.admin.name,),
+                               write=(groups.admin.name,),
+                               delete=(groups.admin.name,))
+        event = Event(event_type=event_type,
+                      data={ "data": "test" },
+                      read=(groups.user.name,),
+                      write=(groups.admin.name,),
+                      delete=(group_of_one.name,))
+
+        db.session.add(event_type)
+        db.session.add(event)
+        with real_db.Model.disable_permissions():
+            db.session.commit()
+            obj = existing(event)
+
+    yield obj
+
 class TestEvents:
+    def test__get_event_type_permissions(self, test_client, event_of_hidden_type):
+        with token_mock(authorized_for_read_identity) as mock_token:
+            response = test_client.get("/api/-/event/events/")
+            assert mock_token.called, "mock used"
+            assert response.status_code == 200, "readable events returned"
+            assert dict_from_response(response)["collection"] == [], "events of unreadable types left out"
+
+            response = test_client.get("/api/-/event/events/export")
+            assert response.get_data() == b"", "events of unreadable types aren't exported"
+
+        with real_db.Model.disable_permissions(), token_mock(authorized_for_read_identity) as mock_token:
+            response = test_client.get("/api/-/event/events/")
+            assert [e["id"] for e in dict_from_response(response)["collection"]] == \
+                   [str(event_of_hidden_type.id)], "listed when event types can be read"
+
     def test__get(self, test_client, event_collection):
         url = "/api/-/event/events/"
         with token_mock(unscoped_identity) as mock_token:
@@ -435,10 +594,17 @@ class TestEvents:
 
             response_dict = dict_from_response(response)
             assert len(response_dict["collection"]) == 1, "one result returned"
+            with app.test_request_context():
+                cursors = {
+                    "self": dump_cursor(since=event_collection[-2].cursor),
+                    "prev": dump_cursor(max=event_collection[-2].cursor),
+                    "next": dump_cursor(since=event_collection[-1].cursor),
+                }
+
             assert comparable_links(response_dict["_links"]) == {
-                "self": (url, "results_per_page=50", "since_id={}".format(str(event_collection[-2].id))),
-                "prev": (url, "max_id={}".format(str(event_collection[-2].id)), "results_per_page=50"),
-                "next": (url, "results_per_page=50", "since_id={}".format(str(event_collection[-1].id))),
+                "self": (url, "cursor={}".format(cursors["self"]), "results_per_page=50"),
+                "prev": (url, "cursor={}".format(cursors["prev"]), "results_per_page=50"),
+                "next": (url, "cursor={}".format(cursors["next"]), "results_per_page=50"),
             }, "links correct for last page"
 
             ids |= {x["id"] for x in response_dict["collection"]}
@@ -471,6 +637,49 @@ class TestEvents:
             assert mock_token.called, "mock used"
             assert len(dict_from_response(response)["collection"]) == 1, "filtered down to one event"
 
+            response = test_client.get("{}?event_type_slug=test-event-type&results_per_page=40".format(url))
+            response = test_client.get(dict_from_response(response)["_links"]["next"])
+            assert len(dict_from_response(response)["collection"]) == 10, "cursor carries the event_type filter"
+
+    def test__get_with_cursor(self, test_client, event_collection):
+        url = "/api/-/event/events/"
+        with app.test_request_context():
+            cursor = dump_cursor(since=event_collection[-11].cursor)
+            bad_cursor = dump_cursor(since="not a cursor")
+
+        with token_mock(authorized_for_read_identity) as mock_token:
+            response = test_client.get("{}?cursor={}".format(url, cursor))
+            assert mock_token.called, "mock used"
+            assert response.status_code == 200, "cursor returns a 200"
+
+            ids = [i["id"] for i in dict_from_response(response)["collection"]]
+            assert ids == [str(i.id) for i in event_collection[-10:]], "cursor position is respected"
+
+            response = test_client.get("{}?cursor={}".format(url, cursor[:-2]))
+            assert response.status_code == 400, "tampered cursor returns a 400"
+
+            response = test_client.get("{}?cursor={}".format(url, bad_cursor))
+            assert response.status_code == 400, "cursor of the wrong shape returns a 400"
+
+            response = test_client.get("{}?cursor={}&since_id={}".format(url, cursor, event_collection[0].id))
+            assert response.status_code == 400, "cursor and since_id may not be combined"
+
+    def test__get_with_fields(self, test_client, event_collection):
+        with token_mock(authorized_for_read_identity) as mock_token:
+            response = test_client.get("/api/-/event/events/?fields=id,event_type_slug&results_per_page=5")
+            assert mock_token.called, "mock used"
+            assert response.status_code == 200, "fields returns a 200"
+
+            response_dict = dict_from_response(response)
+            assert [set(i) for i in response_dict["collection"]] == [{ "id", "event_type_slug" }] * 5, \
+                   "only requested fields are returned"
+            assert [i["id"] for i in response_dict["collection"]] == [str(i.id) for i in event_collection[:5]], \
+                   "collection still ordered by cursor"
+            assert "next" in response_dict["_links"], "collection metadata is returned"
+
+            response = test_client.get("/api/-/event/events/?fields=id,nope")
+            assert response.status_code == 400, "unknown field returns a 400"
+
     def test__get_with_bad_max_id_or_since_id(self, test_client):
         with token_mock(authorized_for_read_identity) as mock_token:
             response = test_client.get("/api/-/event/events/?since_id={}".format(str(uuid.uuid1())))
@@ -512,6 +721,44 @@ class TestEvents:
                    )), "location header correctly set"
 
 
+class TestEventsExport:
+    def test__get(self, test_client, event_collection):
+        url = "/api/-/event/events/export"
+        with token_mock(unscoped_identity) as mock_token:
+            response = test_client.get(url)
+            assert mock_token.called, "mock used"
+            assert response.status_code == 200, "with no access a 200 is returned"
+            assert response.mimetype == "application/x-ndjson", "response is ndjson"
+            assert response.get_data() == b"", "nothing is exported without access"
+
+        with token_mock(authorized_for_read_identity) as mock_token:
+            response = test_client.get(url)
+            lines = response.get_data().decode("utf-8").splitlines()
+            assert [json.loads(l)["id"] for l in lines] == [str(e.id) for e in event_collection], \
+                   "one event per line, in cursor order"
+
+            response = test_client.get("{}?event_type_slug=test-event-type-1".format(url))
+            lines = response.get_data().decode("utf-8").splitlines()
+            assert len(lines) == 1, "filtered down to one event"
+            assert json.loads(lines[0])["event_type_slug"] == "test-event-type-1", "event type is dumped"
+
+            yesterday = (event_collection[0].event_time - timedelta(days=1)).isoformat()
+            response = test_client.get("{}?end={}".format(url, yesterday))
+            assert response.get_data() == b"", "nothing exported before the range ends"
+
+            response = test_client.get("{}?start={}".format(url, yesterday))
+            assert len(response.get_data().splitlines()) == len(event_collection), "everything after start"
+
+            response = test_client.get(url, headers={ "Accept-Encoding": "gzip" })
+            assert response.headers["Content-Encoding"] == "gzip", "gzipped when accepted"
+            assert len(gzip.decompress(response.get_data()).splitlines()) == len(event_collection), \
+                   "gzipped export is complete"
+
+        with token_mock(authorized_for_read_identity) as mock_token:
+            response = test_client.get("{}?start=abc".format(url))
+            assert response.status_code == 400, "if args are malformed, 400 is returned"
+
+
 def test__Spec_get(test_client):
     response = test_client.get("/api/-/event/swagger.json")
     assert response.status_code == 200, "swagger endpoint returns 200"
@@ -9,7 +9,7 @@ from directorofme import DOMEventRegistry
 from directorofme.oauth import Client
 from directorofme.crypto import RSACipher
 from directorofme.flask import versioned_api, directorofme_app, JWTManager
-from directorofme.flask.api import Spec
+from directorofme.flask.api import Spec, cached
 
 from .config import config
 
@@ -31,6 +31,7 @@ from . import resources
 
 @api.resource("/swagger.json", endpoint="spec_api")
 class Spec(Resource):
+    @cached()
     def get(self):
         return spec.to_dict()
 
@@ -44,7 +44,11 @@ class Install(Resource):
 
     @load_query_params(InstallQuerySchema)
     def get(self, ts=None):
-        apps = DOM.from_request(flask.request, app).get("auth/installed_apps/", params={ "app": "calendar" })
+        apps = DOM.from_request(flask.request, app).get("auth/installed_apps/", params={
+            "app": "calendar",
+            "results_per_page": 1,
+            "fields": "id,app_slug",
+        })
         if apps.get("collection"):
             return apps.get("collection")[0], 302, { "Location": Slack(config).app_url() }
 
@@ -71,24 +75,25 @@ class OAuthCallback(Resource):
         refresh_token = oauth_client.fetch_token(flask.request.url)["refresh_token"]
         client = DOM.from_request(flask.request, app)
 
-        cal_app = client.get("auth/apps/calendar")
-        installed = client.post("auth/apps/calendar/install/", data={
-            "scopes": cal_app["requested_scopes"],
-            "config": {
-                "installed_from_message": state,
-                "scopes": ["https://www.googleapis.com/auth/calendar",],
-                "integrations": {
-                    "google": {
-                        "refresh_token": {
-                            "encryption": "RSA",
-                            "value": client.post("auth/apps/calendar/encrypt/", data={
+        # one round trip: fetch the app, encrypt the token and install
+        _, _, installed = client.batch([
+            ("get", "auth/apps/calendar"),
+            ("post", "auth/apps/calendar/encrypt/", { "encryption": "RSA", "value": refresh_token }),
+            ("post", "auth/apps/calendar/install/", {
+                "scopes": "${0.body.requested_scopes}",
+                "config": {
+                    "installed_from_message": state,
+                    "scopes": ["https://www.googleapis.com/auth/calendar",],
+                    "integrations": {
+                        "google": {
+                            "refresh_token": {
                                 "encryption": "RSA",
-                                "value": refresh_token
-                            })["value"]
+                                "value": "${1.body.value}"
+                            }
                         }
                     }
                 }
-            }
-        })
+            }),
+        ])
 
         return installed, 302, { "Location": Slack(config).app_url() }
@@ -8,7 +8,7 @@ from flask_marshmallow import Marshmallow
 from directorofme.oauth import Client
 from directorofme.crypto import RSACipher
 from directorofme.flask import versioned_api, directorofme_app, JWTManager
-from directorofme.flask.api import Spec
+from directorofme.flask.api import Spec, cached
 
 from .config import config
 
@@ -32,6 +32,7 @@ from . import resources
 
 @api.resource("/swagger.json", endpoint="spec_api")
 class Spec(Resource):
+    @cached()
     def get(self):
         return spec.to_dict()
 
@@ -8,6 +8,7 @@ class AppInstallHandler:
         self.bot = bot
         self.event_data = event_data
         self.installed_app = installed_app
+        self._client = None
 
         try:
             method = getattr(self, event_data.get("data", {}).get("app_slug"))
@@ -18,7 +19,10 @@ class AppInstallHandler:
 
     @property
     def client(self):
-        return DOM.from_installed_app(app.config["SERVER_NAME"], cipher, self.installed_app)
+        # one client per handler, so its access token is only fetched once
+        if self._client is None:
+            self._client = DOM.from_installed_app(app.config["SERVER_NAME"], cipher, self.installed_app)
+        return self._client
 
     def welcome_message(self, skip_calendar=False, skip_jira=False, **message):
         actions = []
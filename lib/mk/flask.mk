@@ -13,7 +13,9 @@ AUTH_API_DIR           ?= $(API_DIR)/auth
 
 SERVER_ADDR            ?=
 SERVER_PORT            ?=
+SERVER_SOCKET          ?=
 SERVER_FORKS           ?=
+CACHE_PATH             ?=
 SERVICE_OWNER          ?=
 SERVICE_NAME           ?=
 SERVICE_OWNER_GROUPS   ?= $(FLASK_GROUP)
@@ -48,12 +50,16 @@ WEB_LOCATION           ?=
 WEB_SERVER_NAME        ?=
 
 FLASK_EXTRA_VARS       ?=
+DOM_CLIENT_UPSTREAMS   ?=
 FLASK_ENV_VARS         ?= $(FLASK_EXTRA_VARS) \
 		                  FLASK_APP="$(FLASK_APP)" \
 				          APP_DB_ENGINE="$(APP_DB_ENGINE)" \
 				     	  API_NAME="$(API_NAME)" \
 					      SERVER_NAME="$(WEB_SERVER_NAME)" \
+					      DOM_CLIENT_UPSTREAMS="$(DOM_CLIENT_UPSTREAMS)" \
+					      CACHE_PATH="$(CACHE_PATH)" \
 					      JWT_PUBLIC_KEY_FILE=$(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/jwt_ec512_pub.pem \
+					      CURSOR_SECRET_KEY_FILE=$(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/cursor_secret_key \
 						  PUSH_REFRESH_TOKEN_FILE=/etc/push_tokens/push_refresh_token \
 						  PUSH_REFRESH_CSRF_TOKEN_FILE=/etc/push_tokens/push_refresh_csrf_token
 FLASK                  ?= $(FLASK_ENV_VARS) PYTHONPATH=".:$(EXTRA_PYTHONPATH):$$PYTHONPATH" flask
@@ -65,7 +71,9 @@ RUN_FILE_EXPORTS       ?= FLASK_APP="$(FLASK_APP)" \
 				          FLASK_ENV_VARS='$(FLASK_ENV_VARS)' \
 				          SERVER_ADDR="$(SERVER_ADDR)" \
 				   	      SERVER_PORT="$(SERVER_PORT)" \
+				   	      SERVER_SOCKET="$(SERVER_SOCKET)" \
 					      SERVER_FORKS="$(SERVER_FORKS)" \
+					      CACHE_PATH="$(CACHE_PATH)" \
 					      DAEMON_USER="$(SERVICE_OWNER)" \
 		  			      PSQL_HOST="$(PSQL_HOST)" \
 		  			      PSQL_DB="$(PSQL_DB)" \
@@ -120,6 +128,12 @@ flask-command:
 		$(FLASK) $(FLASK_COMMAND); \
     fi
 
+# the environment of this app prefixed by its package, for running it in a monolith (see monolith/Makefile)
+MONOLITH_PREFIX        ?= $(shell echo "$(PKG_NAME)" | tr a-z A-Z)__
+.PHONY: monolith-env
+monolith-env:
+	@env -i $(FLASK_ENV_VARS) env | sed 's/^\([^=]*\)=\(.*\)$$/$(MONOLITH_PREFIX)\1="\2"/' | tr '\n' ' '
+
 .PHONY: run-flask-test
 run-flask-test:
 	$(FLASK_ENV_VARS) $(MAKE) run-py-test
@@ -147,6 +161,9 @@ $(SHARE_DIR)/$(JWT_KEY_DIR)/jwt_ec512.pem: $(SHARE_DIR)/$(JWT_KEY_DIR)/.d
 $(SHARE_DIR)/$(JWT_KEY_DIR)/jwt_ec512_pub.pem: $(SHARE_DIR)/$(JWT_KEY_DIR)/jwt_ec512.pem
 	[ -f $@ ] || openssl ec -in $< -outform PEM -pubout -out $@
 
+$(SHARE_DIR)/$(JWT_KEY_DIR)/cursor_secret_key: $(SHARE_DIR)/$(JWT_KEY_DIR)/.d
+	[ -f $@ ] || { umask 077 && openssl rand -hex 32 > $@; }
+
 
 $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/jwt_ec512.pem: $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/.d \
 											     $(SHARE_DIR)/$(JWT_KEY_DIR)/jwt_ec512.pem
@@ -156,15 +173,20 @@ $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/jwt_ec512_pub.pem: $(JWT_INSTALL_DIR)/$(JWT_KE
 												     $(SHARE_DIR)/$(JWT_KEY_DIR)/jwt_ec512_pub.pem
 	sudo install -o root -g $(JWT_PUBLIC_GROUP) -m 0640 $(SHARE_DIR)/$(JWT_KEY_DIR)/jwt_ec512_pub.pem $@
 
+$(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/cursor_secret_key: $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/.d \
+												       $(SHARE_DIR)/$(JWT_KEY_DIR)/cursor_secret_key
+	sudo install -o root -g $(FLASK_GROUP) -m 0640 $(SHARE_DIR)/$(JWT_KEY_DIR)/cursor_secret_key $@
+
 $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/.d:
 	sudo install -g root -o root -m 0755 -d $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR) && sudo touch $@
 
 .PHONY: jwt_keys
-jwt_keys: $(SHARE_DIR)/$(JWT_KEY_DIR)/jwt_ec512_pub.pem
+jwt_keys: $(SHARE_DIR)/$(JWT_KEY_DIR)/jwt_ec512_pub.pem $(SHARE_DIR)/$(JWT_KEY_DIR)/cursor_secret_key
 
 .PHONY: install-jwt_keys
 install-jwt_keys: $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/jwt_ec512.pem \
-				  $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/jwt_ec512_pub.pem
+				  $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/jwt_ec512_pub.pem \
+				  $(JWT_INSTALL_DIR)/$(JWT_KEY_DIR)/cursor_secret_key
 
 # NOTE: This is not hooked up to the generic clean intentionally. Replacing these keys has big consequences.
 .PHONY: clean-jwt_keys
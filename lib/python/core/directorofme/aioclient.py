@@ -0,0 +1,99 @@
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import DOM, installed_app_clients
+
+__all__ = [ "AsyncDOM", "run" ]
+
+def run(coroutine):
+    """Run coroutine to completion in a new event loop (for calling async clients from sync code)"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class AsyncDOM:
+    """
+    An asyncio interface to :class:`DOM`. Requests are made by a DOM client, with its url building, CSRF
+    and cookie handling, error mapping, token refresh and transport (see :class:`.Transport` for pooled
+    keep-alive connections, timeouts, retries and circuit breaking), on a small pool of threads, so up to
+    `max_workers` of them can be in flight at once, e.g. with `asyncio.gather`.
+    """
+    #: how many requests may be in flight at once
+    max_workers = 8
+
+    def __init__(self, domain, version="-", access_token=None, access_csrf_token=None,
+                 refresh_token=None, refresh_csrf_token=None, scheme="https", transport=None,
+                 max_workers=None, dom=None):
+        self.dom = dom or DOM(domain, version, access_token=access_token, access_csrf_token=access_csrf_token,
+                              refresh_token=refresh_token, refresh_csrf_token=refresh_csrf_token,
+                              scheme=scheme, transport=transport)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or self.max_workers)
+
+    @classmethod
+    def from_request(cls, request, app=None):
+        return cls(request.host, dom=DOM.from_request(request, app))
+
+    @classmethod
+    def from_installed_app(cls, domain, cipher, installed_app, cache=installed_app_clients):
+        """An async client acting as installed_app, sharing the cached DOM client for it (see :meth:`DOM.from_installed_app`)"""
+        return cls(domain, dom=DOM.from_installed_app(domain, cipher, installed_app, cache=cache))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        # the DOM client is left open, it may be cached and its transport is usually shared
+        self.executor.shutdown(wait=False)
+
+    @property
+    def headers(self):
+        return self.dom.headers
+
+    @property
+    def cookies(self):
+        return self.dom.cookies
+
+    @property
+    def refreshes(self):
+        return self.dom.refreshes
+
+    def url(self, url):
+        return self.dom.url(url)
+
+    def token(self, name):
+        return self.dom.token(name)
+
+    def access_expires(self):
+        return self.dom.access_expires()
+
+    async def call(self, method, *args, **kwargs):
+        """Call method of the DOM client in a worker thread"""
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, functools.partial(getattr(self.dom, method), *args, **kwargs))
+
+    async def get(self, url, params=None, headers=None):
+        return await self.call("get", url, params=params, headers=headers)
+
+    async def post(self, url, data=None, **kwargs):
+        return await self.call("post", url, data, **kwargs)
+
+    async def put(self, url, data=None, **kwargs):
+        return await self.call("put", url, data, **kwargs)
+
+    async def delete(self, url, data=None, **kwargs):
+        return await self.call("delete", url, data, **kwargs)
+
+    async def patch(self, url, data=None, **kwargs):
+        return await self.call("patch", url, data, **kwargs)
+
+    async def refresh(self, seen=None):
+        """Refresh the access token, sharing a refresh already in flight (see :meth:`DOM.refresh`)"""
+        return await self.call("refresh", seen)
@@ -19,7 +19,7 @@ from . import standard_permissions, groups, exceptions
 ###: TODO soft-deletes
 
 __all__ = [ "Permission", "GroupBasedPermission", "PermissionedModelMeta", "PrefixedModel",
-            "PermissionedModel", "Model", "PermissionedQuery" ]
+            "PermissionedModel", "Model", "PermissionedQuery", "model_handlers" ]
 
 class Permission:
     col_type = UUIDType
@@ -357,8 +357,14 @@ def _dispatch(classmethod_):
 
 listen(PermissionedQuery, "before_compile", _dispatch(PermissionedQuery.compile_handler),
        retval=True, propagate=True)
-listen(PermissionedModel, "before_insert", _dispatch(PermissionedModel.insert_handler), propagate=True)
-listen(PermissionedModel, "before_update", _dispatch(PermissionedModel.update_handler), propagate=True)
-listen(PermissionedModel, "before_delete", _dispatch(PermissionedModel.delete_handler), propagate=True)
-listen(PermissionedModel, "after_insert", _dispatch(PermissionedModel.after_save_handler), propagate=True)
-listen(PermissionedModel, "after_update", _dispatch(PermissionedModel.after_save_handler), propagate=True)
+
+#: mapper event handlers of every :class:`PermissionedModel`, by event name
+model_handlers = {
+    "before_insert": _dispatch(PermissionedModel.insert_handler),
+    "before_update": _dispatch(PermissionedModel.update_handler),
+    "before_delete": _dispatch(PermissionedModel.delete_handler),
+    "after_insert": _dispatch(PermissionedModel.after_save_handler),
+    "after_update": _dispatch(PermissionedModel.after_save_handler),
+}
+for identifier, handler in model_handlers.items():
+    listen(PermissionedModel, identifier, handler, propagate=True)
@@ -1,11 +1,24 @@
-from requests import Session
+import json
+import time
+import base64
+import hashlib
+import threading
+
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from requests import Session, Response
+from requests.exceptions import ConnectionError, Timeout
 from furl import furl
 
 from json.decoder import JSONDecodeError
 
 import flask_jwt_extended as flask_jwt
 
-__all__ = [ "Unauthorized", "PermissionDenied", "BadRequest", "NotFound", "ServerError", "ClientError", "DOM" ]
+from .timing import timed
+from .transport import default_transport
+
+__all__ = [ "Unauthorized", "PermissionDenied", "BadRequest", "NotFound", "ServerError", "Unavailable",
+            "ClientError", "DOM", "ClientCache", "installed_app_clients" ]
 
 class ClientError(Exception):
     pass
@@ -28,14 +41,80 @@ class Conflict(ClientError):
 class ServerError(ClientError):
     pass
 
+class Unavailable(ClientError):
+    """The request could not be completed: its host was unreachable, too slow or its breaker was open"""
+    pass
+
+def token_expires(token):
+    """The `exp` claim of a JWT, read without verifying it, or None if it can't be read"""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)).decode("utf-8"))
+        return float(claims["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class ClientCache:
+    """
+    A process-wide LRU of ready to use clients, each expiring with the token it was built from.
+    """
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                client, expires = self.entries[key]
+            except KeyError:
+                return None
+
+            if expires is not None and expires < time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return client
+
+    def set(self, key, client, expires=None):
+        with self.lock:
+            self.entries[key] = (client, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+#: clients built by :meth:`DOM.from_installed_app`
+installed_app_clients = ClientCache()
+
+
 class DOM(Session):
+    #: access tokens expiring within this many seconds are refreshed before the next request
+    refresh_margin = 30
+    #: default results per page and pages fetched ahead for :meth:`iter_collection`
+    page_size = 50
+    pages_in_flight = 2
+
     def __init__(self, domain, version="-", access_token=None, access_csrf_token=None,
-                 refresh_token=None, refresh_csrf_token=None):
-        self.__url = furl("https://")
-        self.__url.host = domain
+                 refresh_token=None, refresh_csrf_token=None, transport=None, scheme="https"):
+        self.refresh_lock = threading.Lock()
+        self.refreshes = 0
+        self.__refreshed = None
+        self.__local = threading.local()
+        self.__url = furl("{}://{}".format(scheme, domain))
         self.__url.path.segments = [ "api", version ]
         super().__init__()
 
+        # see :class:`.transport.Transport` for pooling, timeouts, retries and circuit breaking
+        self.transport = transport or default_transport
+        self.mount("https://", self.transport)
+        self.mount("http://", self.transport)
+
         if access_csrf_token is not None:
             self.headers["X-CSRF-TOKEN"] = access_csrf_token
         if refresh_csrf_token is not None:
@@ -46,6 +125,64 @@ class DOM(Session):
         if refresh_token is not None:
             self.cookies["refresh_token_cookie"] = refresh_token
 
+    def send(self, request, **kwargs):
+        """
+        Send request, first refreshing the access token if it is close to expiring, and refreshing and
+        resending it once if it is rejected with a 401.
+        """
+        if getattr(self.__local, "refreshing", False) or self.token("refresh_token_cookie") is None:
+            return self.__send(request, **kwargs)
+
+        if self.access_expires() is not None and self.access_expires() - self.refresh_margin < time.time():
+            self.refresh()
+            self.prepare_auth(request)
+
+        refreshes = self.refreshes
+        response = self.__send(request, **kwargs)
+
+        # streamed bodies can't be resent
+        if response.status_code == 401 and (request.body is None or isinstance(request.body, (bytes, str))):
+            response.close()
+            self.refresh(seen=refreshes)
+            self.prepare_auth(request)
+            response = self.__send(request, **kwargs)
+
+        return response
+
+    def __send(self, request, **kwargs):
+        with timed("dom"):
+            try:
+                return super().send(request, **kwargs)
+            except (ConnectionError, Timeout) as e:
+                raise Unavailable(str(e)) from e
+
+    def prepare_auth(self, request):
+        """Update the cookies and CSRF headers of a prepared request, after a refresh"""
+        request.headers.pop("Cookie", None)
+        request.prepare_cookies(self.cookies)
+        for header in ("X-CSRF-TOKEN", "X-CSRF-REFRESH-TOKEN"):
+            if header in self.headers:
+                request.headers[header] = self.headers[header]
+
+    def token(self, name):
+        """The value of cookie name, preferring the latest expiring JWT if more than one was set"""
+        values = [ cookie.value for cookie in self.cookies if cookie.name == name ]
+        return max(values, key=lambda v: token_expires(v) or 0) if values else None
+
+    def access_expires(self):
+        """
+        When the access token expires, from its claims (or its cookie), or 0 if there is no access token
+        and None if its expiry is unknown.
+        """
+        cookies = [ cookie for cookie in self.cookies if cookie.name == "access_token_cookie" ]
+        if not cookies:
+            return 0
+
+        expires = token_expires(self.token("access_token_cookie"))
+        if expires is None:
+            expires = max((cookie.expires or 0) for cookie in cookies) or None
+        return expires
+
     def url(self, url):
         url_ = self.__url.copy()
         url_.path.segments.extend(url.split("/"))
@@ -87,14 +224,116 @@ class DOM(Session):
     def patch(self, url, data=None, *args, **kwargs):
         return self.check(super().patch(url=self.url(url), json=data, *args, **kwargs))
 
-    def refresh(self):
-        resp = self.put("auth/session")
-        if self.cookies.get("csrf_access_token") is not None:
-            self.headers["X-CSRF-TOKEN"] = self.cookies["csrf_access_token"]
-        if self.cookies.get("csrf_refresh_token") is not None:
-            self.headers["X-CSRF-REFRESH-TOKEN"] = self.cookies["csrf_refresh_token"]
-
-        return resp
+    def iter_collection(self, url, page_size=None, pages_in_flight=None, **params):
+        """
+        Yield the objects of the collection at url lazily, fetching up to `pages_in_flight` pages ahead in
+        the background while earlier ones are consumed. Paginated collections are fetched by page number,
+        others (e.g. cursored ones) by following their `_links.next` url, one page ahead. Iteration stops
+        at the first short page. Pages are fetched by worker threads, outside of the request context, so
+        they are not part of its `dom` timing.
+        """
+        page_size = page_size or self.page_size
+        pages_in_flight = max(pages_in_flight or self.pages_in_flight, 1)
+        params = dict(params, results_per_page=page_size)
+        page = params.get("page")
+
+        with ThreadPoolExecutor(max_workers=pages_in_flight) as executor:
+            pending = deque([ executor.submit(self.get, url, params=params) ])
+            try:
+                while pending:
+                    body = pending.popleft().result()
+
+                    objs = body.get("collection") or []
+                    links = body.get("_links") or {}
+                    if len(objs) < body.get("results_per_page", page_size) \
+                            or links.get("next") in (None, links.get("self")):
+                        for future in pending:
+                            future.cancel()
+                        pending.clear()
+                    elif "page" in body:
+                        page = max(page or 1, body["page"])
+                        while len(pending) < pages_in_flight:
+                            page += 1
+                            pending.append(executor.submit(self.get, url, params=dict(params, page=page)))
+                    else:
+                        next_url, next_params = self.link_path(links["next"])
+                        pending.append(executor.submit(self.get, next_url, params=next_params))
+
+                    yield from objs
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def link_path(self, link):
+        """The api path (as passed to :meth:`get`) and query params of a `_links` url"""
+        link = furl(link)
+        segments = list(link.path.segments)
+        if segments[:1] == [ "api" ]:
+            segments = segments[2:]
+        return "/".join(segments), dict(link.args)
+
+    def batch(self, requests, stop_on_error=True):
+        """
+        Run many requests to one api in a single round trip, returning a list of results (as from
+        :meth:`check`) and raising the error for the first failed request, if any. Requests are
+        `(method, url[, data])` tuples, where strings in url or data may refer to the results of earlier
+        requests as `${<index>.body.<path>}`, e.g. `("get", "auth/apps/${0.body.slug}")`.
+        """
+        api_names = { url.split("/")[0] for _, url, *_ in requests }
+        if len(api_names) != 1:
+            raise ValueError("batched requests must all be to the same api, not: {}".format(api_names))
+
+        batch = self.post("{}/batch".format(api_names.pop()), {
+            "stop_on_error": stop_on_error,
+            "requests": [{
+                "method": method.upper(),
+                "url": "/".join([""] + list(self.__url.path.segments) + [url]),
+                "body": data[0] if data else None,
+            } for method, url, *data in requests]
+        })
+
+        results = []
+        for result in batch["responses"]:
+            response = Response()
+            response.status_code = result["status"]
+            response.headers.update(result["headers"])
+            response._content = b"" if result["body"] is None else json.dumps(result["body"]).encode("utf-8")
+            results.append(self.check(response))
+
+        return results
+
+    def refresh(self, seen=None):
+        """
+        Refresh the access token. Callers waiting on a refresh already in flight share its result, as
+        do callers that pass the count of refreshes they `seen` when it has since changed.
+        """
+        seen = self.refreshes if seen is None else seen
+        with self.refresh_lock:
+            if self.refreshes != seen:
+                return self.__refreshed
+
+            self.__local.refreshing = True
+            try:
+                resp = self.put("auth/session")
+            finally:
+                self.__local.refreshing = False
+
+            for name in ("access_token_cookie", "refresh_token_cookie"):
+                self.prune_cookies(name)
+            if self.token("csrf_access_token") is not None:
+                self.headers["X-CSRF-TOKEN"] = self.token("csrf_access_token")
+            if self.token("csrf_refresh_token") is not None:
+                self.headers["X-CSRF-REFRESH-TOKEN"] = self.token("csrf_refresh_token")
+
+            self.__refreshed = resp
+            self.refreshes += 1
+            return resp
+
+    def prune_cookies(self, name):
+        # tokens set by the constructor and by the server (with a domain and path) would both be sent
+        keep = self.token(name)
+        for cookie in [ c for c in self.cookies if c.name == name and c.value != keep ]:
+            self.cookies.clear(cookie.domain, cookie.path, cookie.name)
 
     @classmethod
     def from_request(cls, request, app=None):
@@ -122,19 +361,35 @@ class DOM(Session):
         )
 
     @classmethod
-    def from_installed_app(cls, domain, cipher, installed_app):
+    def from_installed_app(cls, domain, cipher, installed_app, cache=installed_app_clients):
+        """
+        A client acting as installed_app, from the refresh tokens in its `directorofme` integration.
+        Clients are kept in cache, keyed by installed app id and token ciphertexts, until their refresh
+        token expires, so the tokens are only decrypted (and refreshed) once.
+        """
         try:
             dom_integration = installed_app["config"]["integrations"]["directorofme"]
         except KeyError:
             raise ValueError("InstalledApp must have `directorofme` integration in config")
 
         try:
-            refresh_token = cipher.decrypt(dom_integration["refresh_token"]["value"])
-            refresh_csrf_token = cipher.decrypt(dom_integration["refresh_csrf_token"]["value"])
+            ciphertexts = (dom_integration["refresh_token"]["value"], dom_integration["refresh_csrf_token"]["value"])
         except KeyError as e:
             raise ValueError("Missing token: {}".format(e))
 
-        client = DOM(domain, refresh_token=refresh_token, refresh_csrf_token=refresh_csrf_token)
-        client.refresh()
-
+        key = None
+        if cache is not None and installed_app.get("id") is not None:
+            digest = hashlib.sha256("\0".join(ciphertexts).encode("utf-8")).hexdigest()
+            key = (cls, domain, str(installed_app["id"]), digest)
+            client = cache.get(key)
+            if client is not None:
+                return client
+
+        refresh_token, refresh_csrf_token = (cipher.decrypt(ciphertext) for ciphertext in ciphertexts)
+
+        # the access token is fetched by the first request made
+        client = cls(domain, refresh_token=refresh_token, refresh_csrf_token=refresh_csrf_token)
+        if key is not None:
+            expires = token_expires(refresh_token)
+            cache.set(key, client, None if expires is None else expires - cls.refresh_margin)
         return client
@@ -1,66 +1,323 @@
-from base64 import b64encode, b64decode
+import io
+import os
+import time
+import struct
+import hashlib
+import threading
 
+from base64 import b64decode, urlsafe_b64encode, urlsafe_b64decode
+from collections import OrderedDict, namedtuple
+
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives.asymmetric.padding import OAEP, MGF1
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.hashes import SHA256
 
+#: prefix of the compact text form of binary envelopes (see :meth:`RSACipher.encrypt_stream`): the envelope,
+#: urlsafe base64 encoded without padding. This is what :meth:`RSACipher.encrypt` returns.
+TEXT_PREFIX = "v3:"
+
+#: prefix of values in the wrapped key envelope format: `v2:<key id>:<wrapped data key>;<fernet token>`. Values
+#: without either prefix are in the original `<wrapped data key>;<fernet token>` format, with a data key per
+#: value. Both are still decrypted, but no longer written.
+ENVELOPE_PREFIX = "v2:"
+
+#: leading bytes of binary envelopes, the last of which is the format version
+MAGIC = b"DOM\x03"
+
+#: plaintext bytes in each authenticated chunk of a binary envelope
+CHUNK_SIZE = 64 * 1024
+
+#: binary envelope layout, after `MAGIC`: the key id, the length of and then the RSA-OAEP wrapped AES-256 data key
+#: (shared by values encrypted with the same data key), then the chunk size and a random nonce prefix for this
+#: value. Chunks follow, each AES-GCM encrypted with the whole header as associated data.
+KEY_HEADER = struct.Struct(">8sH")
+VALUE_HEADER = struct.Struct(">I7s")
+TAG_SIZE = 16
+
+#: a binary envelope's header, as read by :func:`read_header`
+Header = namedtuple("Header", [ "key_id", "wrapped_key", "chunk_size", "nonce_prefix", "raw" ])
+
+def key_id(key):
+    """A short, stable id for an RSA key (public or private): a digest of its DER encoded public key"""
+    public_key = key.public_key() if hasattr(key, "private_bytes") else key
+    der = public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return hashlib.sha256(der).hexdigest()[:16]
+
+def read_exactly(stream, size):
+    """Read size bytes from stream, or fewer only if it ends first"""
+    data = stream.read(size)
+    while data and len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+def read_header(stream):
+    """Read the :class:`Header` of a binary envelope from stream, raising ValueError if it isn't one"""
+    def read(size):
+        data = read_exactly(stream, size)
+        if len(data) != size:
+            raise ValueError("Encrypted value is truncated")
+        return data
+
+    if read(len(MAGIC)) != MAGIC:
+        raise ValueError("Encrypted value is not a binary envelope")
+
+    key_header = read(KEY_HEADER.size)
+    encrypted_for, wrapped_length = KEY_HEADER.unpack(key_header)
+    wrapped_key = read(wrapped_length)
+    value_header = read(VALUE_HEADER.size)
+    chunk_size, nonce_prefix = VALUE_HEADER.unpack(value_header)
+    if chunk_size == 0:
+        raise ValueError("Encrypted value has no chunk size")
+
+    return Header(encrypted_for.hex(), wrapped_key, chunk_size, nonce_prefix,
+                  MAGIC + key_header + wrapped_key + value_header)
+
+def chunks(stream, size):
+    """(index, chunk, is last chunk) for each size byte chunk of stream, including one empty chunk if it's empty"""
+    index, chunk = 0, read_exactly(stream, size)
+    while True:
+        following = read_exactly(stream, size) if len(chunk) == size else b""
+        yield index, chunk, not following
+        if not following:
+            return
+        index, chunk = index + 1, following
+
+def nonce(prefix, index, last):
+    """The AES-GCM nonce of chunk index: the value's nonce prefix, the chunk index and whether it's the last one"""
+    if index > 0xffffffff:
+        raise ValueError("Too many chunks to encrypt in one value")
+    return prefix + struct.pack(">IB", index, last)
+
+
+class KeyCache:
+    """
+    A bounded, thread safe LRU of keys. Unwrapped data keys are kept by the id of the private key that unwrapped
+    them and a digest of the wrapped key, so each wrapped key costs one RSA operation per process.
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self.entries[key]
+
+    def set(self, key, data_key):
+        with self.lock:
+            self.entries[key] = data_key
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+#: data keys unwrapped by any :class:`RSACipher`
+unwrapped_keys = KeyCache()
+
+#: the data key currently used to encrypt for each public key, as `(data key, key header, uses left)`, so
+#: ciphers for the same key share it (e.g. all the tokens of one installed app)
+data_keys = KeyCache(max_size=256)
+
+#: parsed public RSA keys and their ids, by a fingerprint of their PEM, so ciphers made per use (e.g. by
+#: :meth:`App.cipher`) don't re-parse and re-check the same keys. Private keys are only kept in a registry
+#: passed for them (see :class:`RSACipher`), as they are often supplied by callers, e.g. to `AppDecrypt`.
+parsed_keys = KeyCache(max_size=128)
+
+def load_key(pem, private=False, keys=parsed_keys):
+    """The parsed public (or private) RSA key in pem and its :func:`key_id`, from keys when it has been loaded"""
+    pem = pem.encode("utf-8") if isinstance(pem, str) else pem
+    fingerprint = ("private" if private else "public", hashlib.sha256(pem).hexdigest())
+    loaded = None if keys is None else keys.get(fingerprint)
+    if loaded is None:
+        if private:
+            key = serialization.load_pem_private_key(pem, password=None, backend=default_backend())
+        else:
+            key = serialization.load_pem_public_key(pem, backend=default_backend())
+
+        loaded = (key, key_id(key))
+        if keys is not None:
+            keys.set(fingerprint, loaded)
+
+    return loaded
+
+
 class RSACipher:
-    def __init__(self, public_key=None, private_key=None):
+    #: how many values are encrypted with one data key (and so one RSA operation) before a new one is made
+    data_key_uses = 1024
+
+    def __init__(self, public_key=None, private_key=None, cache=unwrapped_keys, data_keys=data_keys,
+                 keys=parsed_keys, private_keys=None):
         if public_key is None and private_key is None:
             raise ValueError("One of `public_key` or `private_key` must be provided")
 
-        self.public_key = None if public_key is None else serialization.load_pem_public_key(
-            public_key.encode("utf-8") if isinstance(public_key, str) else public_key,
-            backend=default_backend()
-        )
-        self.private_key = None if private_key is None else serialization.load_pem_private_key(
-            private_key.encode("utf-8") if isinstance(private_key, str) else private_key,
-            password=None,
-            backend=default_backend()
-        )
+        self.public_key, public_key_id = (None, None) if public_key is None else load_key(public_key, keys=keys)
+        self.private_key, self.private_key_id = (None, None) if private_key is None else \
+                                                load_key(private_key, private=True, keys=private_keys)
 
-    def encrypt(self, data):
-        if isinstance(data, str):
-            data = data.encode("utf-8")
+        self.key_id = public_key_id or self.private_key_id
+        self.cache = cache
+        self.data_keys = data_keys
 
-        fernet_key = self.__generate_fernet()
-        return ";".join([self.__encrypt_key(fernet_key), self.__encrypt_data(fernet_key, data)])
+    def encrypt(self, data):
+        """Encrypt data (str or bytes) to the compact text form of a binary envelope, for use in JSON"""
+        return TEXT_PREFIX + urlsafe_b64encode(self.encrypt_bytes(data)).decode("ascii").rstrip("=")
 
     def decrypt(self, string):
+        """Decrypt a value made by :meth:`encrypt` (in this or an earlier format) to str"""
+        if string.startswith(TEXT_PREFIX):
+            encoded = string[len(TEXT_PREFIX):]
+            return self.decrypt_bytes(urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))).decode("utf-8")
+
+        if string.startswith(ENVELOPE_PREFIX):
+            encrypted_for, _, envelope = string[len(ENVELOPE_PREFIX):].partition(":")
+            encrypted_key, _, encrypted_data = envelope.partition(";")
+            return self.__decrypt_data(self.__unwrap_key(encrypted_for, b64decode(encrypted_key)), encrypted_data)
+
         encrypted_key, _, encrypted_data = string.partition(";")
-        return self.__decrypt_data(self.__decrypt_key(encrypted_key), encrypted_data)
+        return self.__decrypt_data(self.__unwrap(b64decode(encrypted_key)), encrypted_data)
+
+    def encrypt_bytes(self, data):
+        """Encrypt data (str or bytes) to a binary envelope"""
+        data = data.encode("utf-8") if isinstance(data, str) else data
+        encrypted = io.BytesIO()
+        self.encrypt_stream(io.BytesIO(data), encrypted)
+        return encrypted.getvalue()
+
+    def decrypt_bytes(self, data):
+        """Decrypt a binary envelope to bytes"""
+        decrypted = io.BytesIO()
+        self.decrypt_stream(io.BytesIO(data), decrypted)
+        return decrypted.getvalue()
+
+    def encrypt_stream(self, source, destination, chunk_size=CHUNK_SIZE):
+        """
+        Encrypt everything read from the binary file-like source to a binary envelope written to destination,
+        chunk_size bytes at a time, so large values needn't fit in memory. Returns the number of bytes written.
+        """
+        data_key, key_header = self.__next_data_key()
+        header = key_header + VALUE_HEADER.pack(chunk_size, os.urandom(VALUE_HEADER.size - 4))
+        nonce_prefix = header[-(VALUE_HEADER.size - 4):]
+
+        destination.write(header)
+        written, aesgcm = len(header), AESGCM(data_key)
+        for index, chunk, last in chunks(source, chunk_size):
+            encrypted = aesgcm.encrypt(nonce(nonce_prefix, index, last), chunk, header)
+            destination.write(encrypted)
+            written += len(encrypted)
+
+        return written
+
+    def decrypt_stream(self, source, destination):
+        """
+        Decrypt a binary envelope read from the binary file-like source, writing the plaintext to destination a
+        chunk at a time. Each chunk is authenticated before it is written, but truncated or corrupted envelopes
+        only raise ValueError once reached, so destination should be discarded if this raises.
+        """
+        header = read_header(source)
+        aesgcm = AESGCM(self.__unwrap_key(header.key_id, header.wrapped_key))
+        for index, chunk, last in chunks(source, header.chunk_size + TAG_SIZE):
+            try:
+                destination.write(aesgcm.decrypt(nonce(header.nonce_prefix, index, last), chunk, header.raw))
+            except InvalidTag:
+                raise ValueError("Encrypted value is corrupt or truncated")
+
+    def __next_data_key(self):
+        data_key = self.data_keys.get(self.key_id)
+        if data_key is None or data_key[2] <= 0:
+            aes_key = AESGCM.generate_key(bit_length=256)
+            wrapped_key = self.__wrap(aes_key)
+            if self.private_key_id == self.key_id and self.cache is not None:
+                # values we encrypt can be read back without unwrapping their key
+                self.cache.set((self.key_id, self.__digest(wrapped_key)), aes_key)
+            key_header = MAGIC + KEY_HEADER.pack(bytes.fromhex(self.key_id), len(wrapped_key)) + wrapped_key
+            data_key = (aes_key, key_header, self.data_key_uses)
+
+        self.data_keys.set(self.key_id, (data_key[0], data_key[1], data_key[2] - 1))
+        return data_key[0], data_key[1]
 
-    def __generate_fernet(self):
-        return Fernet.generate_key()
+    def __unwrap_key(self, encrypted_for, wrapped_key):
+        if self.private_key is None:
+            raise AttributeError("A `private_key` is required to decrypt")
+        if encrypted_for != self.private_key_id:
+            raise ValueError("Value was encrypted for key {}, not {}".format(encrypted_for, self.private_key_id))
 
-    def __encrypt_key(self, fernet_key):
-        fernet_key = fernet_key.encode("utf-8") if isinstance(fernet_key, str) else fernet_key
-        return b64encode((self.public_key or self.private_key).encrypt(
-            fernet_key,
+        if self.cache is None:
+            return self.__unwrap(wrapped_key)
+
+        cache_key = (self.private_key_id, self.__digest(wrapped_key))
+        data_key = self.cache.get(cache_key)
+        if data_key is None:
+            data_key = self.__unwrap(wrapped_key)
+            self.cache.set(cache_key, data_key)
+        return data_key
+
+    def __digest(self, wrapped_key):
+        return hashlib.sha256(wrapped_key).hexdigest()
+
+    def __wrap(self, data_key):
+        return (self.public_key or self.private_key).encrypt(
+            data_key,
             OAEP(
                 mgf=MGF1(algorithm=SHA256()),
                 algorithm=SHA256(),
                 label=None
             )
-        )).decode("utf-8")
+        )
 
-    def __decrypt_key(self, encrypted_key):
-        encrypted_key = encrypted_key.encode("utf-8") if isinstance(encrypted_key, str) else encrypted_key
+    def __unwrap(self, wrapped_key):
         return self.private_key.decrypt(
-            b64decode(encrypted_key),
+            wrapped_key,
             OAEP(
                 mgf=MGF1(algorithm=SHA256()),
                 algorithm=SHA256(),
                 label=None
             )
-        ).decode("utf-8")
-
-    def __encrypt_data(self, fernet_key, data):
-        data = data.encode("utf-8") if isinstance(data, str) else data
-        return Fernet(fernet_key).encrypt(data).decode("utf-8")
+        )
 
     def __decrypt_data(self, fernet_key, encrypted_data):
         encrypted_data = encrypted_data.encode("utf-8") if isinstance(encrypted_data, str) else encrypted_data
         return Fernet(fernet_key).decrypt(encrypted_data).decode("utf-8")
+
+
+def benchmark(values=200, key_size=2048, value="x" * 64):
+    """
+    Encrypt and decrypt throughput, in values per second, of ciphers made per value from PEMs (as
+    :meth:`App.cipher` does), with and without the parsed key registry. Run with `make bench-crypto`.
+    """
+    private_key = rsa.generate_private_key(65537, key_size, default_backend())
+    private_pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                            serialization.NoEncryption())
+    public_pem = private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                       serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    results = {}
+    for name, keys in (("without_registry", None), ("with_registry", KeyCache())):
+        options = { "keys": keys, "private_keys": keys, "cache": KeyCache(), "data_keys": KeyCache() }
+
+        start = time.perf_counter()
+        encrypted = [ RSACipher(public_pem, **options).encrypt(value) for _ in range(values) ]
+        encrypt = values / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for ciphertext in encrypted:
+            RSACipher(private_key=private_pem, **options).decrypt(ciphertext)
+        decrypt = values / (time.perf_counter() - start)
+
+        results[name] = { "encrypt": round(encrypt), "decrypt": round(decrypt) }
+
+    return results
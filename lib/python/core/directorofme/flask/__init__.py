@@ -3,7 +3,17 @@ from .json import JSONEncoder
 from .app_utils import directorofme_app, default_config, versioned_api
 from .orm import Model, DOMSQLAlchemy
 from .jwt import JWTSessionInterface, JWTManager
+from . import cache
+from . import timing
+from . import queries
+from . import profiling
+from . import memory
+from . import workers
+from . import replicas
+from . import monolith
 from . import api
 
-__all__ = [ "api", "directorofme_app", "default_config", "JSONEncoder", "versioned_api",
-            "Model", "JWTSessionInterface", "JWTManager", "DOMSQLAlchemy" ]
+__all__ = [ "api", "cache", "timing", "queries", "profiling", "memory", "workers", "replicas", "monolith",
+            "directorofme_app",
+            "default_config", "JSONEncoder", "versioned_api", "Model", "JWTSessionInterface", "JWTManager",
+            "DOMSQLAlchemy" ]
@@ -1,16 +1,42 @@
+import os
+import re
+import sys
+import json
 import uuid
+import zlib
+import hashlib
+import tempfile
 import functools
 import flask
+
 import marshmallow
 
 from flask_restful import Resource as FlaskResource, abort
+from sqlalchemy import Table, inspect, event
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import quote_etag, unquote_etag
+from itsdangerous import URLSafeSerializer, BadSignature
+from flask_marshmallow.fields import Hyperlinks
+from slugify import slugify
+from sqlalchemy_utils import Timestamp
+from sqlalchemy_utils.models import timestamp_before_update
 
+from datetime import datetime
 from collections import namedtuple
 from apispec import APISpec
 
-__all__ = [ "abort_if_errors", "first_or_abort", "uuid_or_abort", "load_with_schema", "dump_with_schema",
-            "with_pagination_params", "with_cursor_params", "Spec", "Resource" ]
+from ..authorization.orm import Permission, PermissionedModel, model_handlers
+from ..authorization.exceptions import PermissionDeniedError, MisconfiguredAuthError
+from .cache import cache_backend, watch_tables, generations, mark_written
+from .timing import timed
+
+__all__ = [ "NotModified", "BulkResult", "BulkResults", "abort_if_errors", "first_or_abort", "uuid_or_abort",
+            "load_with_schema", "dump_with_schema", "cached", "cached_with_schema", "requested_fields",
+            "sparse_schema", "stream_with_schema", "with_pagination_params", "with_cursor_params",
+            "dump_cursor", "load_cursor", "Spec", "Resource" ]
 
 def abort_if_errors(result):
     if result.errors:
@@ -18,7 +44,134 @@ def abort_if_errors(result):
         abort(400, message="Validation failed: {}".format(", ".join(messages)))
     return result.data
 
-def first_or_abort(query, status=404):
+class NotModified(HTTPException):
+    """Response to a conditional GET for a representation the client already has"""
+    code = 304
+    description = "Not Modified"
+
+    def __init__(self, etag):
+        super().__init__()
+        self.etag = etag
+
+    def get_headers(self, environ=None):
+        return [("ETag", quote_etag(self.etag, weak=True))]
+
+def _groups_key():
+    return sorted(g.name for g in getattr(flask.session, "groups", ()))
+
+def _etag(Schema, rows, metadata=None):
+    # weak, as it only tracks `updated` timestamps, and varies by the groups of the caller
+    key = repr((Schema.__module__, Schema.__qualname__, _groups_key(), requested_fields(), metadata, rows))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def _etag_stamp(obj):
+    updated = getattr(obj, "updated", None)
+    return None if updated is None else (str(getattr(obj, "id", None)), updated.isoformat())
+
+def _etag_row(obj):
+    # rows dumping fields from related rows (e.g. through a property) name them in `etag_relationships`
+    row = _etag_stamp(obj)
+    for name in getattr(type(obj), "etag_relationships", ()):
+        if row is None:
+            break
+
+        related = getattr(obj, name)
+        related = [] if related is None else related if isinstance(related, (list, tuple, set)) else [related]
+        stamps = sorted(_etag_stamp(r) or ("", "") for r in related)
+        if ("", "") in stamps:
+            return None
+        row += (name, tuple(stamps))
+    return row
+
+def _etag_for(Schema, obj, many=False):
+    # None unless `updated` timestamps cover everything Schema dumps from obj
+    objs = obj if many else [obj]
+    metadata = None
+    collection = Schema._declared_fields.get("collection")
+    if isinstance(collection, marshmallow.fields.Nested) and collection.attribute in (None, "collection") \
+            and isinstance(obj, dict):
+        Schema, objs = collection.nested, obj.get("collection", [])
+        metadata = sorted((k, repr(v)) for k,v in obj.items() if k != "collection")
+
+    if not _etag_schema(Schema):
+        return None
+
+    rows = [_etag_row(o) for o in objs]
+    return None if None in rows else _etag(Schema, rows, metadata)
+
+def _etag_schema(Schema):
+    # nested, method and function fields may dump anything, not just the columns of the row
+    return isinstance(Schema, type) and not any(
+        isinstance(f, (marshmallow.fields.Nested, marshmallow.fields.Method, marshmallow.fields.Function))
+            for f in Schema._declared_fields.values()
+    )
+
+def _abort_if_fresh(query, Schema):
+    # cheap check of `updated` for a conditional GET, before the full row is loaded (see dump_with_schema)
+    if not (flask.has_request_context() and flask.request.method in ("GET", "HEAD")
+                and flask.request.if_none_match and _etag_schema(Schema)):
+        return
+
+    Model = query.column_descriptions[0].get("entity")
+    if not hasattr(Model, "updated") or getattr(Model, "etag_relationships", ()):
+        return
+
+    fresh = query.with_entities(Model.id, Model.updated)
+    if issubclass(Model, PermissionedModel) and Model.permissions_enabled():
+        # permissions are only applied automatically to entity queries
+        fresh = fresh.filter(Model.permissions_criterion("select"))
+
+    row = fresh.first()
+    if row is not None and row.updated is not None:
+        etag = _etag(Schema, [(str(row.id), row.updated.isoformat())])
+        if flask.request.if_none_match.contains_weak(etag):
+            raise NotModified(etag)
+
+#: outcome of a bulk helper for one object: the status, headers and body (an object to dump on success)
+BulkResult = namedtuple("BulkResult", ("status", "headers", "body"))
+
+class BulkResults(list):
+    """
+    BulkResult objects, in request order. Dumped by :func:`dump_with_schema` as `{"results": [...]}`,
+    with the :attr:`status` of the whole.
+    """
+    @property
+    def status(self):
+        """200 if every result succeeded, 207 if only some did and the common 4xx if none did (or 400)."""
+        failed = { r.status for r in self if r.status >= 400 }
+        if not failed:
+            return 200
+        elif any(r.status < 400 for r in self):
+            return 207
+        return failed.pop() if len(failed) == 1 else 400
+
+def _known_listeners_only(Model, *identifiers):
+    """
+    True if the mapper events identifiers of Model are only listened for by the :class:`PermissionedModel`
+    handlers and `Timestamp`, which helpers bypassing the unit of work do the work of themselves.
+    """
+    mapper = inspect(Model)
+    for identifier in identifiers:
+        known = []
+        if issubclass(Model, PermissionedModel) and identifier in model_handlers:
+            known.append((PermissionedModel, model_handlers[identifier]))
+        if issubclass(Model, Timestamp) and identifier == "before_update":
+            known.append((Timestamp, timestamp_before_update))
+
+        registered = sum(event.contains(base, identifier, fn) for base, fn in known)
+        if len(getattr(mapper.dispatch, identifier)) != registered:
+            return False
+    return True
+
+def first_or_abort(query, status=404, Schema=None):
+    """
+    The first result of query, or abort with status if there is none. Pass the Schema the result will
+    be dumped with (see :func:`dump_with_schema`) to answer a conditional GET with a 304 after querying
+    only its `updated` timestamp.
+    """
+    if status == 404 and Schema is not None:
+        _abort_if_fresh(query, Schema)
+
     obj = query.first()
     if obj is None:
         abort(status, message="Could not find object")
@@ -30,29 +183,111 @@ def uuid_or_abort(uuid_):
     except ValueError:
         abort(400, message="Cannot convert to UUID: {}".format(uuid_))
 
-def load_with_schema(Schema, **load_kwargs):
+def load_with_schema(Schema, bulk=False, bulk_key=None, **load_kwargs):
     """
-    Validate request body (JSON) and load it into a dictionary
+    Validate request body (JSON) and load it into a dictionary. With `bulk`, a JSON array is validated
+    with Schema in many-mode and loaded into a list of dictionaries instead. With `bulk_key`, the body
+    must be an array of objects carrying `bulk_key`, and is loaded into a list of `(key, data)` pairs.
     """
     @functools.wraps(load_with_schema)
     def inner(fn):
         @functools.wraps(fn)
         def inner_inner(*args, **kwargs):
-            data = abort_if_errors(Schema().load(flask.request.get_json() or {}, **load_kwargs))
+            body = flask.request.get_json() or {}
+            if (bulk or bulk_key) and isinstance(body, list):
+                data = _load_bulk(Schema, body, bulk_key, **load_kwargs)
+            elif bulk_key:
+                abort(400, message="Expected a list of objects")
+            else:
+                with timed("marshmallow"):
+                    data = abort_if_errors(Schema().load(body, **load_kwargs))
             return fn(*args, data, **kwargs)
 
         return inner_inner
 
     return inner
 
-def dump_with_schema(Schema, **dump_kwargs):
+def _load_bulk(Schema, body, key=None, **load_kwargs):
+    max_objects = flask.current_app.config.get("BULK_MAX_OBJECTS", 500)
+    if len(body) > max_objects:
+        abort(400, message="At most {} objects may be sent at once".format(max_objects))
+
+    keys = None
+    if key is not None:
+        if not all(isinstance(item, dict) and item.get(key) is not None for item in body):
+            abort(400, message="Every object must include `{}`".format(key))
+        keys = [ item[key] for item in body ]
+        body = [ { k: v for k,v in item.items() if k != key } for item in body ]
+
+    with timed("marshmallow"):
+        data = abort_if_errors(Schema(many=True).load(body, **load_kwargs))
+    return data if keys is None else list(zip(keys, data))
+
+_template_pattern = re.compile(r"\s*<\s*(\S*)\s*>\s*")
+
+def requested_fields():
     """
-    Validate output and encode to a JSON serializable format via a marshmellow.Schema object.
+    Return the field names requested via the `fields` query parameter, or None if all fields are wanted.
+    """
+    if not flask.has_request_context() or not flask.request.args.get("fields"):
+        return None
+    return tuple(f for f in (f.strip() for f in flask.request.args["fields"].split(",")) if f)
+
+def _attributes_for(Schema, fields):
+    # object attributes read while dumping `fields`, including those interpolated into `_links` urls
+    attributes = set()
+    for name in fields:
+        field = Schema._declared_fields[name]
+        attributes.add(field.attribute or name)
+        links = field.schema if isinstance(field, Hyperlinks) else {}
+        for url_for in links.values():
+            for param in getattr(url_for, "params", {}).values():
+                match = _template_pattern.match(str(param))
+                if match:
+                    attributes.add(match.group(1))
+    return attributes
+
+def sparse_schema(Schema, fields):
+    """
+    Instantiate Schema restricted to `fields` (for collection schemas, restricted per object in
+    `collection`). Returns the schema and the set of object attributes needed to dump it, which is None
+    when all fields are wanted.
+    """
+    if fields is None:
+        return Schema(), None
+
+    collection = Schema._declared_fields.get("collection")
+    Target = getattr(collection, "nested", Schema) if isinstance(collection, marshmallow.fields.Nested) else Schema
+    unknown = set(fields) - set(Target._declared_fields)
+    if unknown:
+        abort(400, message="Unknown fields: {}".format(", ".join(sorted(unknown))))
+
+    if Target is Schema:
+        return Schema(only=fields), _attributes_for(Schema, fields)
+
+    only = tuple(f for f in Schema._declared_fields if f != "collection")
+    return Schema(only=only + tuple("collection.{}".format(f) for f in fields)), _attributes_for(Target, fields)
+
+def dump_with_schema(Schema, etag=True, **dump_kwargs):
+    """
+    Validate output and encode to a JSON serializable format via a marshmellow.Schema object. A
+    comma-separated `fields` query parameter restricts the output to those fields.
+
+    GET responses carry a weak ETag when the objects dumped have `updated` timestamps, and a matching
+    `If-None-Match` is answered with a 304 before serializing. Models dumping fields from related rows
+    must name those relationships in `etag_relationships`, so their timestamps are part of the ETag.
+    For single objects loaded with :func:`first_or_abort` passed Schema, only `updated` is queried to
+    check this.
     """
     @functools.wraps(dump_with_schema)
     def inner(fn):
         @functools.wraps(fn)
         def inner_inner(*args, **kwargs):
+            schema, attributes = sparse_schema(Schema, requested_fields())
+            conditional = etag and flask.has_request_context() and flask.request.method in ("GET", "HEAD")
+            if flask.has_request_context():
+                flask.g.sparse_attributes = attributes
+
             obj = fn(*args, **kwargs)
             response_tuple = None
 
@@ -63,7 +298,26 @@ def dump_with_schema(Schema, **dump_kwargs):
             if obj is None:
                 abort(404, message="No object found")
 
-            obj = abort_if_errors(Schema().dump(obj, **dump_kwargs))
+            if isinstance(obj, BulkResults):
+                with timed("marshmallow"):
+                    return { "results": [
+                        { "status": r.status, "headers": r.headers,
+                          "body": r.body if r.status >= 400 or r.body is None else abort_if_errors(schema.dump(r.body)) }
+                        for r in obj
+                    ]}, obj.status
+
+            etag_ = None
+            if conditional and (response_tuple is None or response_tuple[0] == 200):
+                etag_ = _etag_for(Schema, obj, dump_kwargs.get("many", False))
+                if etag_ is not None and flask.request.if_none_match.contains_weak(etag_):
+                    raise NotModified(etag_)
+
+            with timed("marshmallow"):
+                obj = abort_if_errors(schema.dump(obj, **dump_kwargs))
+            if etag_ is not None:
+                headers = dict(response_tuple[1]) if response_tuple and len(response_tuple) > 1 else {}
+                headers["ETag"] = quote_etag(etag_, weak=True)
+                return obj, 200, headers
             if response_tuple is None:
                 return obj
             return (obj,) + response_tuple
@@ -72,6 +326,107 @@ def dump_with_schema(Schema, **dump_kwargs):
 
     return inner
 
+def cached(*models, ttl=None, backend=None):
+    """
+    Cache the JSON serializable response of a decorated GET method, for every caller with the same
+    permission groups. Responses are keyed by endpoint, view and query args, api version and groups,
+    and are invalidated when a write to the table of any of `models` (mapped classes, or Tables such as
+    the association tables of relationships the response dumps) is committed. Entries expire after
+    `ttl` seconds (default: the `CACHE_TTL` config) and the least recently used are evicted first.
+    """
+    tables = { t.name for Model in models
+                   for t in ([Model] if isinstance(Model, Table) else inspect(Model).tables) }
+    watch_tables(*tables)
+
+    @functools.wraps(cached)
+    def inner(fn):
+        @functools.wraps(fn)
+        def inner_inner(*args, **kwargs):
+            if flask.request.method not in ("GET", "HEAD"):
+                return fn(*args, **kwargs)
+
+            backend_ = backend or cache_backend()
+            key = "response:{}".format(hashlib.sha1(repr((
+                flask.request.endpoint,
+                flask.g.get("api_version", "-"),
+                sorted(kwargs.items()),
+                sorted(flask.request.args.items(multi=True)),
+                _groups_key(),
+                generations(tables, backend_)
+            )).encode("utf-8")).hexdigest())
+
+            hit = backend_.get(key)
+            if hit is not None:
+                body, headers = hit
+                if headers.get("ETag"):
+                    etag = unquote_etag(headers["ETag"])[0]
+                    if flask.request.if_none_match.contains_weak(etag):
+                        raise NotModified(etag)
+                return body, 200, headers
+
+            response = fn(*args, **kwargs)
+            body, status, headers = response, 200, {}
+            if isinstance(response, tuple):
+                body, status, headers = (response + (200, {}))[:3]
+
+            if status == 200:
+                ttl_ = ttl if ttl is not None else flask.current_app.config.get("CACHE_TTL", 300)
+                backend_.set(key, [body, dict(headers)], ttl_)
+            return response
+
+        return inner_inner
+
+    return inner
+
+def cached_with_schema(Schema, *models, ttl=None, backend=None, **dump_kwargs):
+    """
+    :func:`dump_with_schema`, with the serialized output cached via :func:`cached`.
+    """
+    @functools.wraps(cached_with_schema)
+    def inner(fn):
+        return cached(*models, ttl=ttl, backend=backend)(dump_with_schema(Schema, **dump_kwargs)(fn))
+
+    return inner
+
+def stream_with_schema(Schema, yield_per=500, **dump_kwargs):
+    """
+    Stream the query returned by the decorated function as newline delimited JSON, encoding each row
+    via a marshmallow.Schema object. Rows are fetched `yield_per` at a time from a server-side cursor,
+    so memory use stays constant no matter how large the result is. The body is gzipped for clients
+    that accept it.
+    """
+    @functools.wraps(stream_with_schema)
+    def inner(fn):
+        @functools.wraps(fn)
+        def inner_inner(*args, **kwargs):
+            query = fn(*args, **kwargs)
+            schema = Schema(**dump_kwargs)
+            encoder = flask.current_app.json_encoder
+            gzip = "gzip" in flask.request.accept_encodings
+
+            def generate():
+                compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16) if gzip else None
+                for obj in query.yield_per(yield_per):
+                    line = "{}\n".format(json.dumps(schema.dump(obj).data, cls=encoder)).encode("utf-8")
+                    if compressor is not None:
+                        line = compressor.compress(line)
+                    if line:
+                        yield line
+
+                if compressor is not None:
+                    yield compressor.flush()
+
+            headers = { "Vary": "Accept-Encoding" }
+            if gzip:
+                headers["Content-Encoding"] = "gzip"
+
+            return flask.Response(flask.stream_with_context(generate()), mimetype="application/x-ndjson",
+                                  headers=headers)
+
+        return inner_inner
+
+    return inner
+
 
 def load_query_params(Schema):
     """
@@ -116,14 +471,49 @@ def with_pagination_params(default_results_per_page=50):
 
     return inner
 
-def with_cursor_params(default_results_per_page=50):
+def _cursor_serializer():
+    # cursors are signed to keep their format private, permissions are always re-applied on read
+    config = flask.current_app.config
+    secret = config.get("CURSOR_SECRET_KEY") or config.get("SECRET_KEY")
+    if not secret:
+        raise MisconfiguredAuthError("CURSOR_SECRET_KEY or SECRET_KEY must be set to sign cursors")
+    return URLSafeSerializer(secret, salt="dom-cursor")
+
+def dump_cursor(**position):
+    """
+    Encode a cursor position (and any filters it was built with) as an opaque, signed token.
+    """
+    return _cursor_serializer().dumps({k: v for k,v in position.items() if v is not None})
+
+def load_cursor(token, Schema=None):
+    """
+    Decode a token created by :func:`dump_cursor`, aborting if it has been tampered with or, if a
+    Schema is passed, does not validate against it. Without a Schema values must be strings or numbers.
+    """
+    try:
+        position = _cursor_serializer().loads(token)
+    except BadSignature:
+        abort(400, message="Invalid cursor: {}".format(token))
+
+    if not isinstance(position, dict):
+        abort(400, message="Invalid cursor: {}".format(token))
+    if Schema is not None:
+        return abort_if_errors(Schema().load(position))
+
+    if any(isinstance(v, bool) or not isinstance(v, (str, int, float)) for v in position.values()):
+        abort(400, message="Invalid cursor: {}".format(token))
+    return position
+
+def with_cursor_params(default_results_per_page=50, CursorSchema=None):
     """
     Validate and pass the standard parameters for cursor-paginated collections endpoints into a decorated
-    MethodView method.
+    MethodView method. An opaque `cursor` (see :func:`dump_cursor`) is decoded, and validated against
+    CursorSchema if passed, before it is passed along.
     """
     class CursorParams(marshmallow.Schema):
         max_id = marshmallow.fields.UUID()
         since_id = marshmallow.fields.UUID()
+        cursor = marshmallow.fields.String()
         results_per_page = marshmallow.fields.Integer()
 
     @functools.wraps(with_cursor_params)
@@ -137,6 +527,10 @@ def with_cursor_params(default_results_per_page=50):
             )
             if kwargs.get("max_id") and kwargs.get("since_id"):
                 abort(400, message="either of max_id and since_id may be passed, but not both")
+            if kwargs.get("cursor") is not None:
+                if kwargs.get("max_id") or kwargs.get("since_id"):
+                    abort(400, message="cursor may not be passed with either of max_id or since_id")
+                kwargs["cursor"] = load_cursor(kwargs["cursor"], CursorSchema)
             return fn(*args, **kwargs)
 
         return inner_inner
@@ -147,8 +541,30 @@ def with_cursor_params(default_results_per_page=50):
 class Resource(FlaskResource):
     """Base DOM Resource"""
     @classmethod
-    def paged(cls, query, page, results_per_page, order_by, **kwargs):
-        """Return a collection-like dict for a paginated (not cursored) collection results set"""
+    def sparse(cls, query, fields=None, include=()):
+        """
+        Defer loading of columns not needed for the requested fields (see :func:`dump_with_schema`).
+        Primary keys, foreign keys, permissions columns, `updated` (for ETags) and any attributes in `include`
+        are always loaded.
+        """
+        if fields is None:
+            fields = flask.g.get("sparse_attributes") if flask.has_request_context() else None
+        if fields is None:
+            return query
+
+        mapper = inspect(query.column_descriptions[0]["entity"])
+        keys = [attr.key for attr in mapper.column_attrs if attr.key in fields or attr.key in include
+                    or attr.key == "updated" or attr.key.startswith(Permission.permissions_prefix)
+                    or any(c.primary_key or c.foreign_keys for c in attr.columns)]
+        return query.options(load_only(*keys))
+
+    @classmethod
+    def paged(cls, query, page, results_per_page, order_by, fields=None, **kwargs):
+        """
+        Return a collection-like dict for a paginated (not cursored) collection results set, loading
+        only the columns needed for `fields` (or the fields requested for this request).
+        """
+        query = cls.sparse(query, fields)
         objs = query.order_by(order_by).limit(results_per_page + 1).offset((page - 1) * results_per_page).all()
         extra = objs.pop() if len(objs) > results_per_page else None
 
@@ -176,11 +592,21 @@ class Resource(FlaskResource):
 
     @classmethod
     def generic_update(cls, db, api, Model, url_field, url_value, data, url_cls=None, processor=None):
-        """Patch/Put helper method"""
+        """
+        Patch/Put helper method. Updates which only set plain columns are done with a single UPDATE (see
+        :meth:`returning_update`), anything else loads, updates and saves the object via the session.
+        """
+        processed = False
+        if cls.is_simple_update(Model, data):
+            if processor:
+                data, processed = processor(data, url_value), True
+            if cls.is_simple_update(Model, data):
+                return cls.returning_update(db, api, Model, url_field, url_value, data, url_cls)
+
         obj = first_or_abort(db.session.query(Model).filter(getattr(Model, url_field) == url_value))
         url_value = getattr(obj, url_field)
 
-        if processor:
+        if processor and not processed:
             data = processor(data, url_value)
 
         for k,v in data.items():
@@ -197,6 +623,81 @@ class Resource(FlaskResource):
             return obj, 301, { "Location": api.url_for(url_cls or cls, **{ url_field: getattr(obj, url_field) }) }
         return obj
 
+    @classmethod
+    def is_simple_update(cls, Model, data):
+        """
+        True if data only sets columns with no attribute events (other than :func:`slugify_on_change`),
+        and Model has no update events but those :meth:`returning_update` does the work of, so it can be
+        written without loading the object.
+        """
+        columns = inspect(Model).column_attrs
+        slugified = getattr(Model, "__slugified__", {})
+        return bool(data) and _known_listeners_only(Model, "before_update", "after_update") and \
+               all(k in columns and (k in slugified or not getattr(Model, k).dispatch.set) for k in data)
+
+    @classmethod
+    def returning_update(cls, db, api, Model, url_field, url_value, data, url_cls=None):
+        """
+        Update an object with a single `UPDATE ... WHERE <update permissions> RETURNING *`, aborting with
+        a 404 or raising PermissionDeniedError if no row was updated. The update events of the
+        :class:`PermissionedModel` handlers and `Timestamp` are done here instead, see :meth:`is_simple_update`.
+        """
+        mapper = inspect(Model)
+        values = dict(data)
+        for src, target in getattr(Model, "__slugified__", {}).items():
+            if values.get(src) is not None:
+                values[target] = slugify(values[src])
+        if "updated" in mapper.column_attrs:
+            # normally set by sqlalchemy_utils.Timestamp in before_update
+            values["updated"] = datetime.utcnow()
+
+        criterion = getattr(Model, url_field) == url_value
+        statement = Model.__table__.update().where(criterion).values({
+            mapper.column_attrs[k].columns[0]: v for k,v in values.items()
+        })
+        if issubclass(Model, PermissionedModel) and Model.permissions_enabled():
+            statement = statement.where(Model.permissions_criterion("update"))
+
+        connection = db.session.connection(mapper=mapper)
+        returning = connection.dialect.implicit_returning
+        if returning:
+            statement = statement.returning(*Model.__table__.c)
+
+        try:
+            result = db.session.execute(statement, mapper=mapper)
+            if returning:
+                objs = list(db.session.query(Model).populate_existing().instances(result))
+            elif result.rowcount:
+                new_criterion = getattr(Model, url_field) == values.get(url_field, url_value)
+                objs = db.session.query(Model).populate_existing().filter(new_criterion).all()
+            else:
+                objs = []
+
+            if not objs:
+                db.session.rollback()
+                if db.session.query(Model).filter(criterion).first() is None:
+                    abort(404, message="Could not find object")
+                raise PermissionDeniedError("Cannot update {}".format(Model))
+
+            obj = objs[0]
+            if isinstance(obj, PermissionedModel):
+                # normally done by PermissionedModel.after_save_handler in after_update
+                obj.update_initial_perms()
+            loaded = { attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs }
+            mark_written(db.session, mapper)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            abort(400, message="Please choose a unique name or slug")
+
+        # nothing has changed since the UPDATE, so don't let the commit expire what it returned
+        for key, value in loaded.items():
+            set_committed_value(obj, key, value)
+
+        if url_field in values and getattr(obj, url_field) != url_value:
+            return obj, 301, { "Location": api.url_for(url_cls or cls, **{ url_field: getattr(obj, url_field) }) }
+        return obj
+
     @classmethod
     def generic_delete(cls, db, Model, url_field, url_value):
         """Delete helper"""
@@ -204,10 +705,210 @@ class Resource(FlaskResource):
         db.session.commit()
         return None, 204
 
+    @classmethod
+    def bulk_insert(cls, db, api, Model, data, url_field, url_cls=None):
+        """
+        Bulk post helper. Inserts an object for every dictionary in data in one transaction, with a single
+        multi-row INSERT unless the objects have relationships set, and returns their BulkResults.
+        """
+        objs = [ Model(**d) for d in data ]
+        # insert permissions are checked against the type, not the object, so one check covers them all
+        if objs and issubclass(Model, PermissionedModel) and Model.permissions_enabled() \
+                and not objs[0].permissions_check("insert"):
+            raise PermissionDeniedError("Cannot insert type: {}".format(Model))
+
+        try:
+            if objs and cls.is_simple_insert(Model, objs):
+                objs = cls.multi_row_insert(db, Model, objs)
+            else:
+                db.session.add_all(objs)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            abort(400, message="Please choose a unique name or slug")
+
+        return BulkResults(
+            BulkResult(201, { "Location": api.url_for(url_cls or cls, **{url_field: getattr(obj, url_field)}) }, obj)
+            for obj in objs
+        )
+
+    @classmethod
+    def is_simple_insert(cls, Model, objs):
+        """
+        True if objs (not yet added) can be inserted into the table of Model without the unit of work: no
+        relationships are set, no insert events are listened for beyond the :class:`PermissionedModel`
+        handlers and every python-side default can be computed without an execution context.
+        """
+        mapper = inspect(Model)
+        if len(mapper.tables) != 1 or len(mapper.primary_key) != 1:
+            return False
+        if not _known_listeners_only(Model, "before_insert", "after_insert"):
+            return False
+        for column in Model.__table__.c:
+            default = column.default
+            # callables taking no context are wrapped by sqlalchemy, those wanting one need a real INSERT
+            if default is not None and default.is_callable and getattr(default.arg, "__wrapped__", None) is None:
+                return False
+        return not any(inspect(obj).attrs[r.key].history.has_changes() for obj in objs for r in mapper.relationships)
+
+    @classmethod
+    def multi_row_insert(cls, db, Model, objs):
+        """
+        Insert objs with a single `INSERT ... VALUES (...), (...) RETURNING *`, returning the inserted
+        objects loaded into the session in the same order (when primary keys are generated by the
+        database, in the order rows are returned by it).
+        """
+        mapper = inspect(Model)
+        table = Model.__table__
+        rows = [ cls._insert_row(mapper, table, obj) for obj in objs ]
+        # columns left to the database must be missing from every row
+        for column in table.c:
+            if column.server_default is not None and all(row[column.key] is None for row in rows):
+                for row in rows:
+                    del row[column.key]
+
+        statement = table.insert().values(rows)
+        connection = db.session.connection(mapper=mapper)
+        returning = connection.dialect.implicit_returning
+        primary_key = mapper.primary_key[0]
+        ids = [ row[primary_key.key] for row in rows ]
+        if returning:
+            statement = statement.returning(*table.c)
+        elif None in ids:
+            # without RETURNING the inserted rows can only be found by (python-side) primary key
+            db.session.add_all(objs)
+            return objs
+
+        result = db.session.execute(statement, mapper=mapper)
+        if not returning:
+            # a core SELECT, as the objects are returned whether or not they are readable (like generic_insert)
+            result = db.session.execute(table.select().where(primary_key.in_(ids)), mapper=mapper)
+
+        by_id = { mapper.primary_key_from_instance(obj)[0]: obj
+                    for obj in db.session.query(Model).populate_existing().instances(result) }
+        # RETURNING needn't follow the order of VALUES, so objects are ordered by their keys where we have them
+        inserted = [ by_id[id_] for id_ in ids ] if None not in ids else list(by_id.values())
+        # the work of PermissionedModel.after_save_handler, which only runs for unit of work inserts
+        for obj in inserted:
+            obj.update_initial_perms()
+
+        mark_written(db.session, mapper)
+        return inserted
+
+    @classmethod
+    def _insert_row(cls, mapper, table, obj):
+        row = {}
+        for column in table.c:
+            value = getattr(obj, mapper.get_property_by_column(column).key)
+            default = column.default
+            if value is None and default is not None:
+                # python-side defaults are normally executed per-row by the INSERT
+                if default.is_sequence:
+                    value = default.next_value()
+                elif default.is_callable:
+                    # only context-free callables get here (see is_simple_insert), they ignore the context
+                    value = default.arg(None)
+                else:
+                    value = default.arg
+            row[column.key] = value
+        return row
+
+    @classmethod
+    def bulk_update(cls, db, api, Model, url_field, data, url_cls=None, processor=None):
+        """
+        Bulk patch/put helper. data is a list of `(url_value, data)` pairs, as loaded with `bulk_key`
+        by :func:`load_with_schema`. Objects are loaded with one query, checked for update permission
+        and saved in one transaction, with one UPDATE statement per set of columns changed.
+        """
+        Field = getattr(Model, url_field)
+        objs = { getattr(obj, url_field): obj
+                    for obj in db.session.query(Model).filter(Field.in_({ v for v,_ in data })) }
+        permissioned = issubclass(Model, PermissionedModel) and Model.permissions_enabled()
+
+        updated = []
+        for url_value, obj_data in data:
+            obj = objs.get(url_value)
+            if obj is None:
+                updated.append((url_value, 404, None))
+            elif permissioned and not obj.permissions_check("update"):
+                updated.append((url_value, 403, None))
+            else:
+                if processor:
+                    obj_data = processor(obj_data, url_value)
+                for k,v in obj_data.items():
+                    setattr(obj, k, v)
+                updated.append((url_value, 200, obj))
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            abort(400, message="Please choose a unique name or slug")
+
+        # refresh everything the commit expired in one query
+        ids = [ obj.id for _,status,obj in updated if status == 200 ]
+        if ids:
+            db.session.query(Model).filter(Model.id.in_(ids)).all()
+
+        results = BulkResults()
+        for url_value, status, obj in updated:
+            if status == 404:
+                results.append(BulkResult(404, {}, { "message": "Could not find object" }))
+            elif status == 403:
+                results.append(BulkResult(403, {}, { "message": "Cannot update {}".format(url_value) }))
+            elif getattr(obj, url_field) != url_value:
+                location = api.url_for(url_cls or cls, **{ url_field: getattr(obj, url_field) })
+                results.append(BulkResult(301, { "Location": location }, obj))
+            else:
+                results.append(BulkResult(200, {}, obj))
+        return results
+
+    @classmethod
+    def bulk_delete(cls, db, Model, url_field, url_values):
+        """
+        Bulk delete helper. Objects are loaded with one query, checked for delete permission and deleted
+        in one transaction, with a single DELETE unless Model has relationships to clean up.
+        """
+        Field = getattr(Model, url_field)
+        objs = { getattr(obj, url_field): obj for obj in db.session.query(Model).filter(Field.in_(set(url_values))) }
+        permissioned = issubclass(Model, PermissionedModel) and Model.permissions_enabled()
+
+        results = BulkResults()
+        deleted = {}
+        for url_value in url_values:
+            obj = objs.get(url_value)
+            if obj is None:
+                results.append(BulkResult(404, {}, { "message": "Could not find object" }))
+            elif permissioned and not obj.permissions_check("delete"):
+                results.append(BulkResult(403, {}, { "message": "Cannot delete {}".format(url_value) }))
+            else:
+                deleted[obj.id] = obj
+                results.append(BulkResult(204, {}, None))
+
+        if deleted:
+            if inspect(Model).relationships:
+                for obj in deleted.values():
+                    db.session.delete(obj)
+            else:
+                db.session.query(Model).filter(Model.id.in_(list(deleted))).delete(synchronize_session=False)
+                for obj in deleted.values():
+                    db.session.expunge(obj)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                abort(409, message="Cannot delete objects which are still referenced")
+        return results
+
 
 Path = namedtuple("Path", ("args", "kwargs"))
+Definition = namedtuple("Definition", ("name", "schema"))
 
 class Spec:
+    """
+    An apispec document for a DOM api. Paths and schemas are recorded as they are registered and added
+    to the document on first use (see :meth:`to_dict`), rather than on import.
+    """
     name = "dom-apispec"
     def __init__(self, ma, app=None, **spec_kwargs):
         spec_kwargs.setdefault("plugins", [
@@ -216,9 +917,14 @@ class Spec:
         ])
 
         self.ma = ma
+        self.spec_kwargs = spec_kwargs
         self.spec = APISpec(**spec_kwargs)
         self.app = None
         self.paths = []
+        self.definitions = []
+        self._added = (0, 0)
+        self._dict = None
+        self._views = (None, None)
         self._setup_shared()
 
         if app is not None:
@@ -232,21 +938,19 @@ class Spec:
     def init_app(self, app):
         if app.extensions.get(Spec.name) is None:
             app.extensions[Spec.name] = self
-            with app.app_context():
-                for path in self.paths:
-                    self.real_add_path(*path.args, **path.kwargs)
 
     def add_path(self, *args, **kwargs):
         self.paths.append(Path(args, kwargs))
-        self.real_add_path(*args, **kwargs)
+        self._dict = None
 
     def real_add_path(self, *args, **kwargs):
         # single app env
-        if self.app:
+        if self.app and not (flask.has_app_context() and flask.current_app._get_current_object() is self.app):
             with self.app.app_context():
                 self.__add_path_from_current_app(*args, **kwargs)
-
-        self.__add_path_from_current_app(*args, **kwargs)
+        else:
+            self.__add_path_from_current_app(*args, **kwargs)
+        self._dict = None
 
     def __add_path_from_current_app(self, *args, **kwargs):
         do_add_path = False
@@ -258,13 +962,20 @@ class Spec:
 
         if do_add_path:
             view_class = kwargs.pop("view_class", None)
-            if view_class is not None:
-                for view_func in flask.current_app.view_functions.values():
-                    if hasattr(view_func, "view_class") and view_func.view_class is view_class:
-                        kwargs["view"] = view_func
+            if view_class is not None and view_class in self.__views():
+                kwargs["view"] = self.__views()[view_class]
 
             self.spec.add_path(*args, **kwargs)
 
+    def __views(self):
+        # view functions by view class, rebuilt only when the app's views change
+        app = flask.current_app._get_current_object()
+        key = (app, len(app.view_functions))
+        if self._views[0] != key:
+            self._views = (key, { view_func.view_class: view_func for view_func in app.view_functions.values()
+                                                                    if hasattr(view_func, "view_class") })
+        return self._views[1]
+
     def register_resource(self, resource_class):
         self.add_path(view_class=resource_class)
         return resource_class
@@ -272,11 +983,90 @@ class Spec:
     def register_schema(self, name):
         @functools.wraps(self.register_schema)
         def inner(schema_class):
-            self.spec.definition(name, schema=schema_class)
+            self.definitions.append(Definition(name, schema_class))
+            self._dict = None
             return schema_class
 
         return inner
 
+    def to_dict(self):
+        """
+        Return the spec as a dictionary, adding any paths and schemas registered since the last call.
+        Built specs are kept in memory and, if the `SPEC_CACHE_PATH` config is set, in a file keyed by
+        the `CODE_VERSION` config (or a digest of the code registered) so that workers can share them.
+        """
+        app = self.__app()
+        if self._dict is not None and app is not None:
+            return self._dict
+
+        cache_file = None
+        if app is not None and app.config.get("SPEC_CACHE_PATH") and self._added == (0, 0):
+            cache_file = os.path.join(app.config["SPEC_CACHE_PATH"], "spec-{}.json".format(self.code_version(app)))
+            try:
+                with open(cache_file) as spec_file:
+                    self._dict = json.load(spec_file)
+                    return self._dict
+            except (OSError, ValueError):
+                pass
+
+        definitions, paths = self._added
+        for definition in self.definitions[definitions:]:
+            self.spec.definition(definition.name, schema=definition.schema)
+
+        # paths can only be resolved against the app they are installed to
+        if app is not None:
+            for path in self.paths[paths:]:
+                self.real_add_path(*path.args, **path.kwargs)
+            paths = len(self.paths)
+
+        self._added = (len(self.definitions), paths)
+        spec = self.spec.to_dict()
+        if app is None:
+            return spec
+
+        self._dict = spec
+        if cache_file is not None:
+            try:
+                # written to a temporary file first, so other workers never read a partial spec
+                with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(cache_file), delete=False) as spec_file:
+                    json.dump(spec, spec_file, cls=app.json_encoder)
+                os.replace(spec_file.name, cache_file)
+            except OSError:
+                pass
+        return spec
+
+    def code_version(self, app):
+        """
+        The `CODE_VERSION` config, or a digest of the spec arguments, registered names and the source of
+        every module registered paths and schemas are defined in.
+        """
+        if app.config.get("CODE_VERSION"):
+            return app.config["CODE_VERSION"]
+
+        digest = hashlib.sha1(repr(sorted(self.spec_kwargs.items())).encode("utf-8"))
+        modules = { __name__ }
+        for path in self.paths:
+            view = path.kwargs.get("view_class") or path.kwargs.get("view")
+            digest.update(repr((path.args, getattr(view, "__qualname__", None))).encode("utf-8"))
+            modules.add(getattr(view, "__module__", None))
+        for definition in self.definitions:
+            digest.update(repr((definition.name, definition.schema.__qualname__)).encode("utf-8"))
+            modules.add(definition.schema.__module__)
+
+        for module in sorted(filter(None, modules)):
+            source = getattr(sys.modules.get(module), "__file__", None)
+            if source:
+                with open(source, "rb") as source_file:
+                    digest.update(source_file.read())
+        return digest.hexdigest()
+
+    def __app(self):
+        if self.app is not None:
+            return self.app
+        if flask.has_app_context() and flask.current_app.extensions.get(Spec.name) is self:
+            return flask.current_app._get_current_object()
+        return None
+
     def paginated_collection_schema(self, Nested, url, **kwargs):
         class PaginatedCollectionSchema(marshmallow.Schema):
             page = marshmallow.fields.Integer()
@@ -317,6 +1107,13 @@ class Spec:
                            example="1")
         self.add_parameter("results_per_page", "query", description="how many results to return per page",
                            type="int", example="25", minimum=1, maximum=50)
+        self.add_parameter("cursor", "query",
+                           description="opaque position in a cursor-paginated api, from a `_links` url",
+                           type="string")
+        self.add_parameter("fields", "query",
+                           description="comma-separated list of fields to return",
+                           type="string",
+                           example="id,name")
         self.add_parameter("service", "path",
                            description="name of 3rd party service to authenticate against",
                            required=True,
@@ -326,3 +1123,12 @@ class Spec:
         @self.register_schema("Error")
         class ErrorSchema(marshmallow.Schema):
             message = marshmallow.fields.String(required=True)
+
+        class BulkResultSchema(marshmallow.Schema):
+            status = marshmallow.fields.Integer(required=True)
+            headers = marshmallow.fields.Dict()
+            body = marshmallow.fields.Raw(description="the object, or an Error")
+
+        @self.register_schema("BulkResults")
+        class BulkResultsSchema(marshmallow.Schema):
+            results = marshmallow.fields.Nested(BulkResultSchema, many=True)
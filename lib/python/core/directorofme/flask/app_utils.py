@@ -5,8 +5,11 @@ import flask_restful
 
 from werkzeug.contrib.fixers import ProxyFix
 
-from . import JSONEncoder
+from . import JSONEncoder, timing, profiling, memory
+from .batch import Batch
+from .diagnostics import Timing, Memory, Profiles, Profile, Transport
 from ..authorization.exceptions import MisconfiguredAuthError
+from ..transport import configure_transport
 
 __all__ = [ "directorofme_app", "default_config", "rest_errors_map", "versioned_api" ]
 
@@ -25,6 +28,10 @@ def directorofme_app(app_name, user_config):
     app.wsgi_app = ProxyFix(app.wsgi_app)
     app.json_encoder = JSONEncoder
     app.config["RESTFUL_JSON"] = { "cls": app.json_encoder }
+    timing.init_app(app)
+    profiling.init_app(app)
+    memory.init_app(app)
+    configure_transport(app.config)
 
     try:
         with open(app.config["JWT_PUBLIC_KEY_FILE"]) as pub_key:
@@ -64,9 +71,27 @@ def directorofme_app(app_name, user_config):
             raise MisconfiguredAuthError("JWT_PRIVATE_KEY_FILE not found: "\
                                          "{}".format(app.config["JWT_PRIVATE_KEY_FILE"]))
 
+    if app.config.get("CURSOR_SECRET_KEY_FILE"):
+        try:
+            with open(app.config["CURSOR_SECRET_KEY_FILE"]) as cursor_secret_key:
+                app.config["CURSOR_SECRET_KEY"] = cursor_secret_key.read().strip()
+        except FileNotFoundError:
+            raise MisconfiguredAuthError(
+                "CURSOR_SECRET_KEY_FILE not found: {}".format(app.config["CURSOR_SECRET_KEY_FILE"]))
+
+    # cursors (see :func:`.api.dump_cursor`) must be signed with a secret, never a published key
+    if not (app.config.get("CURSOR_SECRET_KEY") or app.config.get("SECRET_KEY")):
+        raise MisconfiguredAuthError("CURSOR_SECRET_KEY_FILE, CURSOR_SECRET_KEY or SECRET_KEY must be set")
+
     return app
 
 
+def _int_from_env(name):
+    return int(os.environ[name]) if os.environ.get(name) else None
+
+def _float_from_env(name):
+    return float(os.environ[name]) if os.environ.get(name) else None
+
 def default_config(name=None):
     '''Standard config for DOM flask apps'''
     try:
@@ -76,12 +101,46 @@ def default_config(name=None):
                 "DEBUG": os.environ.get("APP_DEBUG", False),
                 "SQLALCHEMY_DATABASE_URI": os.environ.get("APP_DB_ENGINE"),
                 "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+                "SQLALCHEMY_POOL_SIZE": _int_from_env("APP_DB_POOL_SIZE"),
+                "SQLALCHEMY_MAX_OVERFLOW": _int_from_env("APP_DB_MAX_OVERFLOW"),
+                "SQLALCHEMY_POOL_TIMEOUT": _int_from_env("APP_DB_POOL_TIMEOUT"),
+                "SQLALCHEMY_POOL_RECYCLE": _int_from_env("APP_DB_POOL_RECYCLE"),
+                "SQLALCHEMY_POOL_PRE_PING": bool(int(os.environ.get("APP_DB_POOL_PRE_PING", 1))),
+                "SQLALCHEMY_REPLICA_URIS": [ uri for uri in os.environ.get("APP_DB_REPLICA_ENGINES", "").split(",")
+                                                 if uri ],
+                "REPLICA_PIN_SECONDS": float(os.environ.get("REPLICA_PIN_SECONDS", 5)),
+                "WARMUP_CONNECTIONS": int(os.environ.get("WARMUP_CONNECTIONS", 1)),
                 "PREFERRED_URL_SCHEME": "https",
                 "ERROR_404_HELP": False,
                 "SERVER_NAME": os.environ.get("SERVER_NAME"),
                 "JWT_PUBLIC_KEY_FILE": os.environ.get("JWT_PUBLIC_KEY_FILE"),
                 "JWT_PRIVATE_KEY_FILE": os.environ.get("JWT_PRIVATE_KEY_FILE"),
-                "IS_AUTH_SERVER": os.environ.get("IS_AUTH_SERVER", False)
+                "IS_AUTH_SERVER": os.environ.get("IS_AUTH_SERVER", False),
+                "CURSOR_SECRET_KEY": os.environ.get("CURSOR_SECRET_KEY"),
+                "CURSOR_SECRET_KEY_FILE": os.environ.get("CURSOR_SECRET_KEY_FILE"),
+                "CACHE_PATH": os.environ.get("CACHE_PATH"),
+                "CACHE_MAX_SIZE": int(os.environ.get("CACHE_MAX_SIZE", 1024)),
+                "CACHE_TTL": int(os.environ.get("CACHE_TTL", 300)),
+                "BATCH_MAX_REQUESTS": int(os.environ.get("BATCH_MAX_REQUESTS", 20)),
+                "BULK_MAX_OBJECTS": int(os.environ.get("BULK_MAX_OBJECTS", 500)),
+                "SPEC_CACHE_PATH": os.environ.get("SPEC_CACHE_PATH"),
+                "CODE_VERSION": os.environ.get("CODE_VERSION"),
+                "TIMING_SAMPLE_RATE": float(os.environ.get("TIMING_SAMPLE_RATE", 0.01)),
+                "QUERY_BUDGET": int(os.environ.get("QUERY_BUDGET", 50)),
+                "QUERY_REPEAT_LIMIT": int(os.environ.get("QUERY_REPEAT_LIMIT", 10)),
+                "PROFILE_PATH": os.environ.get("PROFILE_PATH"),
+                "PROFILE_MAX_PROFILES": int(os.environ.get("PROFILE_MAX_PROFILES", 100)),
+                "MEMORY_TRACE": os.environ.get("MEMORY_TRACE", False),
+                "MEMORY_TRACE_FRAMES": int(os.environ.get("MEMORY_TRACE_FRAMES", 1)),
+                "MEMORY_TRACE_TOP": int(os.environ.get("MEMORY_TRACE_TOP", 10)),
+                "DOM_CLIENT_POOL_SIZE": _int_from_env("DOM_CLIENT_POOL_SIZE"),
+                "DOM_CLIENT_CONNECT_TIMEOUT": _float_from_env("DOM_CLIENT_CONNECT_TIMEOUT"),
+                "DOM_CLIENT_READ_TIMEOUT": _float_from_env("DOM_CLIENT_READ_TIMEOUT"),
+                "DOM_CLIENT_RETRIES": _int_from_env("DOM_CLIENT_RETRIES"),
+                "DOM_CLIENT_BACKOFF": _float_from_env("DOM_CLIENT_BACKOFF"),
+                "DOM_CLIENT_BREAKER_FAILURES": _int_from_env("DOM_CLIENT_BREAKER_FAILURES"),
+                "DOM_CLIENT_BREAKER_RESET": _float_from_env("DOM_CLIENT_BREAKER_RESET"),
+                "DOM_CLIENT_UPSTREAMS": os.environ.get("DOM_CLIENT_UPSTREAMS"),
             },
 
             "api_name": os.environ.get("API_NAME"),
@@ -114,7 +173,13 @@ def versioned_api(api_name, version_setter=store_version_in_a_global,
     '''Create a blueprint for a Flask-Restful API which respects a versioning
        convention. Pre-processors can store this information somewhere, the
        default is to store it to the `flask.g` variable for use by other
-       methods.'''
+       methods. Every api gets a `/batch` endpoint for running many requests
+       in one (see :class:`.batch.Batch`), a `/timing` endpoint for
+       request timing stats (see :class:`.diagnostics.Timing`), a `/memory`
+       endpoint for traced memory stats (see :class:`.diagnostics.Memory`) and
+       `/profiles` endpoints for admin profiles of single requests (see
+       :class:`.diagnostics.Profiles`) and a `/transport` endpoint for the
+       stats of DOM clients (see :class:`.diagnostics.Transport`).'''
     blueprint = flask.Blueprint(api_name, __name__, url_prefix="/api/<api_version>/{}".format(api_name))
 
     @blueprint.url_value_preprocessor
@@ -130,4 +195,11 @@ def versioned_api(api_name, version_setter=store_version_in_a_global,
         if "api_version" not in values:
             values["api_version"] = version_getter()
 
-    return flask_restful.Api(blueprint, errors=rest_errors_map)
+    api = flask_restful.Api(blueprint, errors=rest_errors_map)
+    api.add_resource(Batch, "/batch", endpoint="batch_api")
+    api.add_resource(Timing, "/timing", endpoint="timing_api")
+    api.add_resource(Memory, "/memory", endpoint="memory_api")
+    api.add_resource(Profiles, "/profiles", endpoint="profiles_api")
+    api.add_resource(Profile, "/profiles/<string:profile_id>", endpoint="profile_api")
+    api.add_resource(Transport, "/transport", endpoint="transport_api")
+    return api
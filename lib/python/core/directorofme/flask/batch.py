@@ -0,0 +1,166 @@
+import re
+import sys
+
+from itertools import chain
+
+import flask
+import marshmallow
+
+from flask.testing import make_test_environ_builder
+from flask_restful import abort
+
+from .api import Resource, load_with_schema, dump_with_schema
+
+__all__ = [ "Batch", "resolve_references" ]
+
+#: `${<n>.path.to.value}` refers to a value in the result of the n-th (earlier) sub-request
+_reference_pattern = re.compile(r"\$\{(\d+)((?:\.[\w-]+)*)\}")
+
+def _lookup(results, index, path):
+    try:
+        value = results[int(index)]
+        for part in path.split(".")[1:]:
+            value = value[int(part)] if isinstance(value, list) else value[part]
+    except (IndexError, KeyError, TypeError, ValueError):
+        abort(400, message="Invalid reference: ${{{}{}}}".format(index, path))
+    return value
+
+def resolve_references(value, results):
+    """
+    Replace references to earlier results in value. A string that is a single reference is replaced by
+    the value referred to, references within a longer string are formatted into it.
+    """
+    if isinstance(value, dict):
+        return { k: resolve_references(v, results) for k,v in value.items() }
+    elif isinstance(value, list):
+        return [ resolve_references(v, results) for v in value ]
+    elif isinstance(value, str):
+        match = _reference_pattern.fullmatch(value)
+        if match:
+            return _lookup(results, *match.groups())
+        return _reference_pattern.sub(lambda m: str(_lookup(results, *m.groups())), value)
+    return value
+
+
+class SubRequestSchema(marshmallow.Schema):
+    method = marshmallow.fields.String(missing="GET", validate=marshmallow.validate.OneOf(
+        ("GET", "POST", "PUT", "PATCH", "DELETE")
+    ))
+    url = marshmallow.fields.String(required=True)
+    query = marshmallow.fields.Dict(missing=dict)
+    body = marshmallow.fields.Raw(allow_none=True, missing=None)
+
+class SubResponseSchema(marshmallow.Schema):
+    status = marshmallow.fields.Integer()
+    headers = marshmallow.fields.Dict()
+    body = marshmallow.fields.Raw()
+
+class BatchSchema(marshmallow.Schema):
+    requests = marshmallow.fields.Nested(SubRequestSchema, many=True, required=True)
+    #: stop at the first sub-request to fail, keeping the writes of those before it
+    stop_on_error = marshmallow.fields.Boolean(missing=True)
+
+class BatchResultsSchema(marshmallow.Schema):
+    responses = marshmallow.fields.Nested(SubResponseSchema, many=True)
+
+
+class Batch(Resource):
+    """
+    Run an ordered list of sub-requests against this service in a single request. The session is
+    verified once, for the batch, and shared by every sub-request. Each sub-request commits its own
+    writes: when `stop_on_error` stops a batch, the writes of the sub-requests before the error are
+    kept, not rolled back.
+    """
+    @load_with_schema(BatchSchema)
+    @dump_with_schema(BatchResultsSchema)
+    def post(self, batch):
+        max_requests = flask.current_app.config.get("BATCH_MAX_REQUESTS", 20)
+        if len(batch["requests"]) > max_requests:
+            abort(400, message="At most {} requests may be batched".format(max_requests))
+
+        results = []
+        cookies = []
+        for sub_request in batch["requests"]:
+            result, set_cookies = self.dispatch_sub_request(
+                sub_request["method"],
+                resolve_references(sub_request["url"], results),
+                resolve_references(sub_request["query"], results),
+                resolve_references(sub_request["body"], results)
+            )
+            results.append(result)
+            cookies.extend(set_cookies)
+
+            if batch["stop_on_error"] and result["status"] >= 400:
+                break
+
+        return { "responses": results }, 200, [ ("Set-Cookie", c) for c in cookies ]
+
+    @classmethod
+    def dispatch_sub_request(cls, method, url, query, body):
+        """
+        Dispatch a sub-request to its view in a request context of its own, sharing the (verified) session
+        of the batch. The request hooks of the app run once, for the batch, so the time and queries of every
+        sub-request are counted in the batch's, and sessions are saved once. Changes to `flask.g` are undone
+        after each sub-request.
+        """
+        app = flask.current_app._get_current_object()
+        outer_request = flask.request._get_current_object()
+
+        headers = [ (k, v) for k,v in outer_request.headers.items()
+                        if k not in ("Content-Type", "Content-Length") ]
+        environ = make_test_environ_builder(app, path=url, base_url=outer_request.url_root, method=method,
+                                            query_string=query, headers=headers,
+                                            json=body if method != "GET" else None).get_environ()
+
+        ctx = app.request_context(environ)
+        ctx.session = flask.session._get_current_object()
+        outer_g = dict(vars(flask.g))
+        ctx.push()
+        try:
+            response = cls.dispatch_view(app, outer_request)
+            # read the body before the sub-request's context is popped, in case it is streamed
+            return cls.result_from_response(response), response.headers.getlist("Set-Cookie")
+        finally:
+            ctx.pop()
+            vars(flask.g).clear()
+            vars(flask.g).update(outer_g)
+
+    @classmethod
+    def dispatch_view(cls, app, outer_request):
+        """The response of the view of the current (sub-)request, or of the error it raises"""
+        try:
+            try:
+                request = flask.request
+                if request.url_rule is not None and request.url_rule.endpoint == outer_request.endpoint:
+                    abort(400, message="Batches may not be nested")
+
+                # only the url value preprocessors (e.g. of the api version), not the batch's request hooks
+                funcs = app.url_value_preprocessors.get(None, ())
+                if request.blueprint is not None and request.blueprint in app.url_value_preprocessors:
+                    funcs = chain(funcs, app.url_value_preprocessors[request.blueprint])
+                for func in funcs:
+                    func(request.endpoint, request.view_args)
+
+                return app.make_response(app.dispatch_request())
+            except Exception as e:
+                return app.make_response(app.handle_user_exception(e))
+        except Exception:
+            # errors without a handler fail their own sub-request, not the batch
+            app.log_exception(sys.exc_info())
+            response = flask.jsonify(message="Internal Server Error")
+            response.status_code = 500
+            return response
+
+    @classmethod
+    def result_from_response(cls, response):
+        body = None
+        if response.mimetype == "application/json":
+            body = flask.json.loads(response.get_data(as_text=True) or "null")
+        elif response.status_code != 304:
+            body = response.get_data(as_text=True)
+
+        return {
+            "status": response.status_code,
+            "headers": { k: v for k,v in response.headers.items() if k not in ("Set-Cookie", "Content-Length") },
+            "body": body,
+        }
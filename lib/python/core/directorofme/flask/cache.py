@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import flask
+
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+__all__ = [ "MemoryCache", "SQLiteCache", "cache_backend", "watch_tables", "generations", "mark_written" ]
+
+class MemoryCache:
+    """
+    An in-process LRU cache with per-entry TTLs. Entries are not shared between worker processes.
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.counters:
+                return self.counters[key]
+
+            try:
+                value, expires = self.entries[key]
+            except KeyError:
+                return None
+
+            if expires is not None and expires < time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (value, None if ttl is None else time.time() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def incr(self, key):
+        # counters are kept out of the LRU, evicting one would resurrect entries keyed by old values
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteCache:
+    """
+    An LRU cache with per-entry TTLs kept in a local sqlite file, so it can be shared by every worker
+    process on a host. Values must be JSON serializable (with `encoder`, if passed).
+    """
+    def __init__(self, path, max_size=1024, encoder=None):
+        self.path = path
+        self.max_size = max_size
+        self.encoder = encoder
+        self.local = threading.local()
+        self.connection().execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, "
+                                  "expires REAL, used REAL, counter INTEGER DEFAULT 0)")
+
+    def connection(self):
+        # sqlite connections may not be shared between threads (or forked processes)
+        if getattr(self.local, "pid", None) != os.getpid():
+            self.local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.pid = os.getpid()
+        return self.local.conn
+
+    def get(self, key):
+        conn = self.connection()
+        row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        value, expires = row
+        if expires is not None and expires < time.time():
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+
+        conn.execute("UPDATE cache SET used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self.connection()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, expires, used) VALUES (?, ?, ?, ?)",
+                     (key, json.dumps(value, cls=self.encoder), None if ttl is None else now + ttl, now))
+        conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE NOT counter "
+                     "ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_size,))
+
+    def incr(self, key):
+        # counters are kept out of the LRU, evicting one would resurrect entries keyed by old values
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            value = (json.loads(row[0]) if row else 0) + 1
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires, used, counter) "
+                         "VALUES (?, ?, NULL, ?, 1)", (key, json.dumps(value), time.time()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def clear(self):
+        self.connection().execute("DELETE FROM cache WHERE NOT counter")
+
+
+def cache_backend(app=None, processes=1):
+    """
+    Return the cache backend for app (or the current app), creating one from the `CACHE_PATH` and
+    `CACHE_MAX_SIZE` config if it hasn't been set in `app.extensions["dom-cache"]`. A `MemoryCache` is
+    only invalidated by writes from its own process, so without a `CACHE_PATH` this raises ValueError
+    when `processes` (the number of worker processes serving app) is more than one.
+    """
+    app = app or flask.current_app
+    backend = app.extensions.get("dom-cache")
+    if backend is None:
+        max_size = int(app.config.get("CACHE_MAX_SIZE") or 1024)
+        path = app.config.get("CACHE_PATH")
+        if not path and processes > 1:
+            raise ValueError("CACHE_PATH must be set when {} processes serve {}, a MemoryCache is not "
+                             "shared between them".format(processes, app.name))
+        backend = app.extensions["dom-cache"] = SQLiteCache(path, max_size, app.json_encoder) if path \
+                                                    else MemoryCache(max_size)
+    return backend
+
+
+### Invalidation: each watched table has a generation in the cache backend which is part of the cache
+### key for anything built from that table, and is bumped whenever a write to it is committed.
+### Only writes made through an ORM session are seen: raw `engine.execute`/`connection.execute` calls
+### and writes from other services (or hosts) never invalidate, so callers making those must call
+### `mark_written` themselves, or accept entries being stale for up to `CACHE_TTL`.
+_watched_tables = set()
+
+def watch_tables(*tables):
+    _watched_tables.update(tables)
+
+def generations(tables, backend=None):
+    backend = backend or cache_backend()
+    return [backend.get("generation:{}".format(t)) or 0 for t in sorted(tables)]
+
+def _mark(session, mapper, obj=None):
+    tables = set(mapper.tables)
+    if obj is not None:
+        # association tables written through the relationships of obj
+        state, deleted = inspect(obj), obj in session.deleted
+        tables.update(r.secondary for r in mapper.relationships if r.secondary is not None
+                          and (deleted or state.attrs[r.key].history.has_changes()))
+
+    dirty = session.info.setdefault("dom-cache-dirty", set())
+    dirty.update(t.name for t in tables if t.name in _watched_tables)
+
+def mark_written(session, mapper):
+    """Invalidate the tables of mapper on commit, for writes made outside of the unit of work."""
+    _mark(session, mapper)
+
+@event.listens_for(Session, "after_flush")
+def _mark_flushed(session, flush_context):
+    for obj in set(session.new) | set(session.dirty) | set(session.deleted):
+        mapper = getattr(type(obj), "__mapper__", None)
+        if mapper is not None:
+            _mark(session, mapper, obj)
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _mark_bulk(context):
+    _mark(context.session, context.mapper)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate(session):
+    dirty = session.info.pop("dom-cache-dirty", None)
+    if dirty and flask.has_app_context():
+        backend = cache_backend()
+        for table in dirty:
+            backend.incr("generation:{}".format(table))
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("dom-cache-dirty", None)
@@ -0,0 +1,73 @@
+import os
+
+import flask
+
+from flask_restful import abort
+
+from .api import Resource
+from .timing import timing_stats
+from .memory import memory_stats
+from .profiling import list_profiles, load_profile
+from ..authorization import requires
+from ..transport import default_transport
+
+__all__ = [ "Timing", "Memory", "Profiles", "Profile", "Transport" ]
+
+class Timing(Resource):
+    """
+    Per-endpoint timing histograms of the requests sampled by this worker process (see
+    :mod:`.timing`).
+    """
+    @requires.admin
+    def get(self):
+        app = flask.current_app
+        return {
+            "pid": os.getpid(),
+            "sample_rate": app.config.get("TIMING_SAMPLE_RATE") or 0,
+            "endpoints": timing_stats(app).to_dict(),
+        }
+
+
+class Memory(Resource):
+    """
+    Per-endpoint memory retained by the requests served by this worker process, when the `MEMORY_TRACE`
+    config is set (see :mod:`.memory`).
+    """
+    @requires.admin
+    def get(self):
+        stats = memory_stats(flask.current_app)
+        return {
+            "pid": os.getpid(),
+            "tracing": stats is not None,
+            "endpoints": {} if stats is None else stats.to_dict(),
+        }
+
+class Profiles(Resource):
+    """
+    Profiles of single requests, taken when an admin sends an `X-Profile` header (see :mod:`.profiling`).
+    Profiles are stored on the host that served the request.
+    """
+    @requires.admin
+    def get(self):
+        return { "pid": os.getpid(), "profiles": list_profiles() }
+
+class Profile(Resource):
+    """The most expensive functions of a profiled request"""
+    @requires.admin
+    def get(self, profile_id):
+        try:
+            return load_profile(profile_id, limit=int(flask.request.args.get("limit", 50)))
+        except FileNotFoundError:
+            abort(404, message="No profile {} on this host".format(profile_id))
+        except ValueError:
+            abort(400, message="limit must be an integer")
+
+
+class Transport(Resource):
+    """
+    Requests, failures, retries, timeouts and open circuit breakers of the DOM clients in this worker process
+    (see :class:`directorofme.transport.Transport`).
+    """
+    @requires.admin
+    def get(self):
+        return dict(default_transport.to_dict(), pid=os.getpid())
@@ -7,6 +7,7 @@ import flask_jwt_extended as flask_jwt
 
 from flask.sessions import SessionInterface as FlaskSessionInterface
 
+from .timing import timed
 from ..authorization import session, groups, exceptions
 
 
@@ -34,6 +35,7 @@ class JWTSessionInterface(FlaskSessionInterface):
     '''Hooks up our JWT tokens to the session interface so we can use flask
        the way it was intended but also get the benefit of JWTs. Sessions in
        this system are immutable, and may only be written by an application server'''
+    @timed("jwt")
     @empty_if_expired
     def open_session(self, app, request):
         '''Populate the session from the JWT cookies at the start of a request'''
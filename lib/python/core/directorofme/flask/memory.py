@@ -0,0 +1,126 @@
+import threading
+import contextlib
+import tracemalloc
+
+from collections import Counter
+from werkzeug.exceptions import HTTPException
+
+__all__ = [ "MemoryStats", "MemoryTracer", "memory_stats", "trace_memory", "init_app" ]
+
+# allocations made by tracing itself, or by imports, aren't attributed to requests
+_ignored = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+class MemoryStats:
+    """
+    Per-endpoint memory retained after each traced request (the difference between tracemalloc snapshots
+    taken before and after it), the peak traced during it, and the sites that allocated what was retained.
+    """
+    def __init__(self, top=10):
+        self.top = top
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, retained, peak, sites):
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, { "count": 0, "retained": 0, "peak": 0,
+                                                          "sites": Counter() })
+            stats["count"] += 1
+            stats["retained"] += retained
+            stats["peak"] = max(stats["peak"], peak)
+            stats["sites"].update(sites)
+
+    def to_dict(self):
+        with self.lock:
+            return { endpoint: {
+                "count": stats["count"],
+                "retained_bytes": stats["retained"],
+                "max_peak_bytes": stats["peak"],
+                "top_sites": [ [site, size] for site, size in stats["sites"].most_common(self.top) if size > 0 ],
+            } for endpoint, stats in self.endpoints.items() }
+
+
+class MemoryTracer:
+    """
+    WSGI middleware recording the memory each request to app retains into stats. Snapshots are taken
+    outside of the request and app contexts, so objects released when they are torn down (like the
+    session's identity map) aren't counted as retained. Responses are buffered while traced, and taking
+    snapshots is slow, so only trace when needed.
+    """
+    def __init__(self, app, wsgi_app, stats):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.stats = stats
+
+    def endpoint(self, environ):
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+            return rule.endpoint
+        except HTTPException:
+            return "-"
+
+    def __call__(self, environ, start_response):
+        if not tracemalloc.is_tracing():
+            return self.wsgi_app(environ, start_response)
+
+        before = tracemalloc.take_snapshot().filter_traces(_ignored)
+        start, _ = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+        # buffer the response so it is completely produced (and closed) before the second snapshot
+        response = self.wsgi_app(environ, start_response)
+        try:
+            body = list(response)
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+
+        # without reset_peak (python < 3.9), peaks reached by earlier requests hide smaller ones
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(_ignored)
+
+        diffs = after.compare_to(before, "lineno")
+        sites = { "{}:{}".format(d.traceback[0].filename, d.traceback[0].lineno): d.size_diff
+                      for d in diffs if d.size_diff > 0 }
+        self.stats.record(self.endpoint(environ), sum(d.size_diff for d in diffs), max(peak - start, 0), sites)
+        return body
+
+
+def memory_stats(app):
+    return app.extensions.get("dom-memory")
+
+@contextlib.contextmanager
+def trace_memory(app, top=10, frames=1):
+    """
+    Trace the memory retained by every request to app made in the with block, yielding the
+    :class:`MemoryStats` recorded.
+    """
+    stats = MemoryStats(top)
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+
+    wsgi_app = app.wsgi_app
+    app.wsgi_app = MemoryTracer(app, wsgi_app, stats)
+    try:
+        yield stats
+    finally:
+        app.wsgi_app = wsgi_app
+        if started:
+            tracemalloc.stop()
+
+def init_app(app):
+    """Trace the memory retained by every request to app when the `MEMORY_TRACE` config is set"""
+    if not app.config.get("MEMORY_TRACE"):
+        return
+
+    stats = app.extensions["dom-memory"] = MemoryStats(int(app.config.get("MEMORY_TRACE_TOP") or 10))
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(int(app.config.get("MEMORY_TRACE_FRAMES") or 1))
+    app.wsgi_app = MemoryTracer(app, app.wsgi_app, stats)
@@ -0,0 +1,98 @@
+'''
+monolith.py -- run many DOM flask apps in one process ("monolith mode"), as
+               one WSGI app, with DOM clients calling between them in process
+               rather than over the network.
+'''
+import os
+import importlib
+import contextlib
+
+from werkzeug.exceptions import HTTPException, NotFound
+
+from ..transport import default_transport
+
+__all__ = [ "Monolith", "api_names", "package_environ", "DEFAULT_PACKAGES" ]
+
+#: the packages of a monolith without `MONOLITH_PACKAGES`
+DEFAULT_PACKAGES = ( "directorofme_auth", "directorofme_event", "directorofme_slack", "directorofme_calendar" )
+
+def api_names(app):
+    """Names of the versioned apis (see :func:`.versioned_api`) registered on app"""
+    return sorted(name for name, blueprint in app.blueprints.items()
+                      if blueprint.url_prefix == "/api/<api_version>/{}".format(name))
+
+def package_environ(package, environ=os.environ):
+    """
+    The environment variables of package in environ, which are prefixed by its upper cased name and a
+    double underscore, e.g. `DIRECTOROFME_EVENT__APP_DB_ENGINE`, as each app is configured from its own.
+    """
+    prefix = "{}__".format(package.upper())
+    return { k[len(prefix):]: v for k,v in environ.items() if k.startswith(prefix) }
+
+@contextlib.contextmanager
+def _environ(variables):
+    """Set variables in os.environ in the with block"""
+    saved = { k: os.environ.get(k) for k in variables }
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+class Monolith:
+    """
+    A WSGI app serving each of apps, by the api name in `/api/<version>/<name>/` urls, or otherwise by the
+    first app with a url rule matching the request. DOM clients using transport call the apis of apps on
+    `server_name` (by default the `SERVER_NAME` of the first app) by dispatching straight to their WSGI app
+    (see :meth:`.Transport.dispatch`).
+    """
+    def __init__(self, apps, server_name=None, transport=default_transport):
+        self.apps = list(apps)
+        self.apis = { name: app for app in self.apps for name in api_names(app) }
+        self.server_name = server_name or self.apps[0].config.get("SERVER_NAME")
+        self.transport = transport
+        transport.configure(upstreams=dict(transport.upstreams, **self.apis), internal_host=self.server_name)
+
+    @classmethod
+    def from_packages(cls, packages, environ=os.environ, **kwargs):
+        """
+        A monolith of the `app` of each of packages, e.g. `["directorofme_auth", "directorofme_event"]`, each
+        imported with its :func:`package_environ` from environ set.
+        """
+        apps = []
+        for package in packages:
+            with _environ(package_environ(package, environ)):
+                apps.append(importlib.import_module(package).app)
+        return cls(apps, **kwargs)
+
+    @classmethod
+    def from_environ(cls, environ=os.environ, **kwargs):
+        """A monolith of the packages in `MONOLITH_PACKAGES` (comma separated), or :data:`DEFAULT_PACKAGES`"""
+        packages = [ p.strip() for p in environ.get("MONOLITH_PACKAGES", "").split(",") if p.strip() ]
+        return cls.from_packages(packages or DEFAULT_PACKAGES, environ=environ, **kwargs)
+
+    def app_for(self, environ):
+        segments = environ.get("PATH_INFO", "").split("/")
+        if segments[1:2] == [ "api" ] and len(segments) > 3 and segments[3] in self.apis:
+            return self.apis[segments[3]]
+
+        for app in self.apps:
+            adapter = app.url_map.bind_to_environ(environ, server_name=app.config.get("SERVER_NAME"))
+            try:
+                if adapter.match()[0] != "static":
+                    return app
+            except NotFound:
+                continue
+            except HTTPException:
+                # e.g. method not allowed, or a redirect, which the app should answer
+                return app
+
+        return NotFound()
+
+    def __call__(self, environ, start_response):
+        return self.app_for(environ)(environ, start_response)
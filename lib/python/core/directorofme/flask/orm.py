@@ -1,7 +1,13 @@
+import os
+
 import flask
 
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc
+from sqlalchemy.orm import configure_mappers, sessionmaker
+from flask_sqlalchemy import SQLAlchemy, get_state
 
+from . import queries, replicas
+from .timing import timed
 from ..authorization import orm, groups
 
 __all__ = [ "Model" ]
@@ -17,6 +23,11 @@ class Model(orm.Model):
     def load_groups(cls):
         return flask.session.groups
 
+    @classmethod
+    def permissions_criterion(cls, action):
+        with timed("permissions"):
+            return super().permissions_criterion(action)
+
 class DOMSQLAlchemy(SQLAlchemy):
     def __init__(self, app=None, scope_name=None):
         scope_name = scope_name or (None if app is None else app.name)
@@ -28,4 +39,61 @@ class DOMSQLAlchemy(SQLAlchemy):
             __tablename_prefix__ = scope_name
             __scope__ = groups.Scope(display_name=scope_name)
 
+        self._parent_pools = []
         super().__init__(app=app, model_class=ScopedModel, query_class=orm.PermissionedQuery)
+
+    def init_app(self, app):
+        replicas.init_app(app, self)
+        super().init_app(app)
+        queries.init_app(app)
+
+    def create_session(self, options):
+        return sessionmaker(class_=replicas.RoutingSession, db=self, **options)
+
+    def apply_pool_defaults(self, app, options):
+        super().apply_pool_defaults(app, options)
+        options["pool_pre_ping"] = bool(app.config.get("SQLALCHEMY_POOL_PRE_PING", True))
+
+    def get_engine(self, app=None, bind=None):
+        engine = super().get_engine(app=app, bind=bind)
+        if not event.contains(engine, "checkout", _checkout):
+            event.listen(engine, "connect", _connect)
+            event.listen(engine, "checkout", _checkout)
+        return queries.instrument(engine)
+
+    def after_fork(self, app=None):
+        '''
+        Give every engine of app a new, empty pool in a forked worker process. The parent's pools are kept
+        (and never used) rather than disposed, as closing their connections would close the sockets the
+        parent shares with the child.
+        '''
+        for connector in get_state(self.get_app(app)).connectors.values():
+            engine = connector.get_engine()
+            self._parent_pools.append(engine.pool)
+            engine.pool = engine.pool.recreate()
+
+    def warmup(self, app=None, connections=None):
+        '''
+        Configure mappers and open `connections` (or the `WARMUP_CONNECTIONS` config) connections, so the
+        first requests a worker serves don't pay for them.
+        '''
+        app = self.get_app(app)
+        configure_mappers()
+
+        engine = self.get_engine(app)
+        connections = app.config.get("WARMUP_CONNECTIONS", 0) if connections is None else connections
+        opened = [ engine.connect() for _ in range(connections) ]
+        for connection in opened:
+            connection.close()
+
+
+### pooled connections remember the process they were opened in, and are never used by another
+def _connect(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info.get("pid") != os.getpid():
+        # dropped rather than closed, the process that opened it still owns it
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError("Connection opened in process {} checked out by process {}".format(
+            connection_record.info.get("pid"), os.getpid()))
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+
+import flask
+
+from ..authorization import requires
+
+__all__ = [ "PROFILE_HEADER", "PROFILE_ID_HEADER", "profile_directory", "list_profiles", "load_profile",
+            "init_app" ]
+
+#: admins profile a request by sending this header (or a `_profile` query parameter), it is ignored for anyone else
+PROFILE_HEADER = "X-Profile"
+#: the id of the profile taken is returned in this header
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+_id_length = 32
+_local = threading.local()
+
+def profile_directory(app=None):
+    app = app or flask.current_app
+    return app.config.get("PROFILE_PATH") or os.path.join(app.instance_path, "profiles")
+
+def _paths(id_, app=None):
+    if len(id_) != _id_length or not id_.isalnum():
+        raise FileNotFoundError(id_)
+    base = os.path.join(profile_directory(app), id_)
+    return base + ".prof", base + ".json"
+
+def list_profiles(app=None):
+    """Metadata of every stored profile, newest first"""
+    directory = profile_directory(app)
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(".json")]
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name)) as metadata:
+                profiles.append(json.load(metadata))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda p: p["created"], reverse=True)
+
+def load_profile(id_, limit=50, app=None):
+    """
+    Metadata of a stored profile, with its `limit` most expensive functions by cumulative time. Raises
+    FileNotFoundError if there is no profile with id_.
+    """
+    stats_path, metadata_path = _paths(id_, app)
+    with open(metadata_path) as metadata:
+        profile = json.load(metadata)
+
+    stats = pstats.Stats(stats_path)
+    functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    profile["functions"] = [{
+        "function": "{}:{}({})".format(*key),
+        "calls": calls,
+        "total_ms": round(total * 1000, 3),
+        "cumulative_ms": round(cumulative * 1000, 3),
+    } for key, (_, calls, total, cumulative, _) in functions]
+    return profile
+
+def _prune(max_profiles, app=None):
+    for profile in list_profiles(app)[max_profiles:]:
+        for stale in _paths(profile["id"], app):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def _profiles():
+    """The profiles being taken in this thread, of requests dispatched within one another, outermost first"""
+    try:
+        return _local.profiles
+    except AttributeError:
+        _local.profiles = []
+        return _local.profiles
+
+def _owned():
+    # the profile of this request, and not of one it is dispatched within (e.g. a batch, or a monolith app)
+    request = flask.request._get_current_object()
+    return next((profile for profile in _profiles() if profile[0] is request), None)
+
+def _stop(profile):
+    profile[-1].disable()
+    _profiles().remove(profile)
+
+def _start():
+    request = flask.request
+    if PROFILE_HEADER not in request.headers and "_profile" not in request.args:
+        return
+
+    # requests dispatched within a profiled request (batched, or in process) are profiled with it
+    if _profiles():
+        return
+
+    # anyone else asking is served as usual, unprofiled
+    if not requires.admin.test():
+        return
+
+    profiler = cProfile.Profile()
+    _profiles().append((request._get_current_object(), uuid.uuid4().hex, time.time(), time.perf_counter(),
+                        profiler))
+    profiler.enable()
+
+def _finish(response):
+    profile = _owned()
+    if profile is None:
+        return response
+
+    _, id_, created, start, profiler = profile
+    _stop(profile)
+
+    app = flask.current_app
+    directory = profile_directory(app)
+    # profiles show the code and data of requests, so only the app may read them
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    stats_path, metadata_path = _paths(id_, app)
+    profiler.dump_stats(stats_path)
+    with open(metadata_path, "w") as metadata:
+        json.dump({
+            "id": id_,
+            "created": created,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            "method": flask.request.method,
+            "path": flask.request.full_path.rstrip("?"),
+            "endpoint": flask.request.endpoint,
+            "status": response.status_code,
+            "pid": os.getpid(),
+        }, metadata)
+    _prune(int(app.config.get("PROFILE_MAX_PROFILES") or 100), app)
+
+    response.headers[PROFILE_ID_HEADER] = id_
+    return response
+
+def _discard(exc):
+    # a request that failed before its response was made still stops profiling
+    profile = _owned()
+    if profile is not None:
+        _stop(profile)
+
+def init_app(app):
+    """Let admins profile single requests to app (see :data:`PROFILE_HEADER`)"""
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_discard)
@@ -0,0 +1,146 @@
+import re
+import time
+import functools
+import contextlib
+
+import flask
+
+from collections import Counter
+from sqlalchemy import event
+
+from .timing import current_timings
+
+__all__ = [ "QueryLog", "QueryBudgetExceeded", "statement_shape", "query_budget", "current_queries",
+            "instrument", "enforce_budgets", "init_app" ]
+
+_whitespace = re.compile(r"\s+")
+_placeholder_lists = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_numbers = re.compile(r"\b\d+\b")
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def statement_shape(statement):
+    """
+    Normalize a SQL statement so that statements differing only by parameters (including the length of
+    `IN` lists and literal numbers) have the same shape.
+    """
+    statement = _whitespace.sub(" ", statement).strip()
+    statement = _placeholder_lists.sub("(?)", statement)
+    return _numbers.sub("?", statement)
+
+
+class QueryLog:
+    """
+    Number of queries, time spent running them and the number of times each statement shape was
+    executed, for one request.
+    """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+        self.shapes = Counter()
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def problems(self, max_queries=None, repeat_limit=None):
+        """Descriptions of every way this log goes over budget"""
+        problems = []
+        if max_queries is not None and self.count > max_queries:
+            problems.append("{} queries ({:.2f}ms) run, budget is {}".format(self.count, self.seconds * 1000,
+                                                                          max_queries))
+        if repeat_limit is not None:
+            problems.extend("statement run {} times (possible N+1): {}".format(count, shape)
+                                for shape, count in self.shapes.most_common() if count > repeat_limit)
+        return problems
+
+
+def current_queries():
+    """The :class:`QueryLog` of the current request, or None outside of an instrumented request"""
+    if not flask.has_request_context():
+        return None
+    return flask.g.get("dom_queries")
+
+def query_budget(max_queries=None, repeat_limit=None):
+    """
+    Set the query budget of the decorated view (or resource method), overriding the `QUERY_BUDGET`
+    and `QUERY_REPEAT_LIMIT` config.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            flask.g.dom_query_budget = (max_queries, repeat_limit)
+            return fn(*args, **kwargs)
+        return inner
+    return decorator
+
+
+### Engines are instrumented by :class:`.orm.DOMSQLAlchemy` as they are created, for query logs and `sql` timing
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and (current_queries() is not None or current_timings() is not None):
+        context._dom_queries_start = time.perf_counter()
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_dom_queries_start", None)
+    if start is None:
+        return
+
+    seconds = time.perf_counter() - start
+    log = current_queries()
+    if log is not None:
+        log.add(statement, seconds)
+    timings = current_timings()
+    if timings is not None:
+        timings.add("sql", seconds)
+
+def instrument(engine):
+    if not event.contains(engine, "after_cursor_execute", _after_execute):
+        event.listen(engine, "before_cursor_execute", _before_execute)
+        event.listen(engine, "after_cursor_execute", _after_execute)
+    return engine
+
+
+### Budgets are logged, or collected and raised when enforced (see `directorofme.testing.db`)
+_enforcing = []
+
+@contextlib.contextmanager
+def enforce_budgets():
+    """Raise :class:`QueryBudgetExceeded` on exit if any request run in the with block went over budget"""
+    violations = []
+    _enforcing.append(violations)
+    try:
+        yield violations
+    finally:
+        _enforcing.remove(violations)
+
+    if violations:
+        raise QueryBudgetExceeded("\n".join(violations))
+
+def _start():
+    flask.g.dom_queries = QueryLog()
+
+def _finish(response):
+    log = current_queries()
+    if log is None:
+        return response
+
+    config = flask.current_app.config
+    max_queries, repeat_limit = flask.g.get("dom_query_budget") or (None, None)
+    problems = log.problems(config.get("QUERY_BUDGET") if max_queries is None else max_queries,
+                            config.get("QUERY_REPEAT_LIMIT") if repeat_limit is None else repeat_limit)
+
+    endpoint = "{} {}".format(flask.request.method, flask.request.endpoint or flask.request.path)
+    for problem in problems:
+        flask.current_app.logger.warning("query budget exceeded by %s: %s", endpoint, problem)
+        if _enforcing:
+            _enforcing[-1].append("{}: {}".format(endpoint, problem))
+
+    return response
+
+def init_app(app):
+    """Count the queries run by each request to app, and check them against its budget"""
+    app.before_request(_start)
+    app.after_request(_finish)
@@ -0,0 +1,88 @@
+import time
+import random
+import functools
+
+import flask
+
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+from flask_sqlalchemy import SignallingSession, get_state
+
+__all__ = [ "PIN_COOKIE", "RoutingSession", "replica_reads", "replica_binds", "init_app" ]
+
+#: clients that wrote recently send this cookie (holding the time their pin ends) back with each request
+PIN_COOKIE = "dom-primary-until"
+
+def replica_binds(app):
+    """Bind keys of the replicas of app (see the `SQLALCHEMY_REPLICA_URIS` config)"""
+    return sorted(k for k in (app.config.get("SQLALCHEMY_BINDS") or {}) if k.startswith("replica-"))
+
+def replica_reads(fn):
+    """
+    Let the SELECTs of the decorated view (or resource method) be routed to a replica, unless the client
+    is pinned to the primary by a recent write.
+    """
+    @functools.wraps(fn)
+    def inner(*args, **kwargs):
+        flask.g.dom_replica_reads = True
+        return fn(*args, **kwargs)
+    return inner
+
+def _pinned():
+    try:
+        return float(flask.request.cookies.get(PIN_COOKIE) or 0) > time.time()
+    except ValueError:
+        return False
+
+
+class RoutingSession(SignallingSession):
+    """
+    A session that routes the queries of mapped classes (i.e. :class:`PermissionedQuery` SELECTs) to a
+    replica in views that opted in with :func:`replica_reads`. Once a session writes, all of its queries
+    go to the primary.
+    """
+    def get_bind(self, mapper=None, clause=None):
+        if clause is not None and not isinstance(clause, Select):
+            self.info["dom-wrote"] = True
+        elif mapper is not None and isinstance(clause, Select) and clause._for_update_arg is None \
+                and self.use_replica():
+            return self.replica()
+
+        return super().get_bind(mapper, clause)
+
+    def use_replica(self):
+        return not self.info.get("dom-wrote") and flask.has_request_context() \
+                   and flask.g.get("dom_replica_reads", False) and not _pinned()
+
+    def replica(self):
+        # one replica per session, so reads within a request see a consistent replica
+        if "dom-replica" not in self.info:
+            binds = replica_binds(self.app)
+            self.info["dom-replica"] = random.choice(binds) if binds else None
+
+        bind = self.info["dom-replica"]
+        return super().get_bind() if bind is None else get_state(self.app).db.get_engine(self.app, bind=bind)
+
+@event.listens_for(RoutingSession, "after_flush")
+def _wrote(session, flush_context):
+    session.info["dom-wrote"] = True
+
+
+def init_app(app, db):
+    """
+    Add the `SQLALCHEMY_REPLICA_URIS` of app as binds of db, and pin clients that write to the primary
+    for `REPLICA_PIN_SECONDS` after.
+    """
+    replicas = app.config.get("SQLALCHEMY_REPLICA_URIS") or ()
+    if replicas:
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        binds.update(("replica-{}".format(i), uri) for i, uri in enumerate(replicas))
+        app.config["SQLALCHEMY_BINDS"] = binds
+
+    @app.after_request
+    def pin_writers(response):
+        if replica_binds(app) and db.session.registry.has() and db.session().info.get("dom-wrote"):
+            window = float(app.config.get("REPLICA_PIN_SECONDS") or 0)
+            response.set_cookie(PIN_COOKIE, "{:.3f}".format(time.time() + window), max_age=int(window) + 1,
+                                httponly=True)
+        return response
@@ -0,0 +1,95 @@
+import time
+import random
+import bisect
+import threading
+
+import flask
+
+from ..timing import Timings, timed, add_timings_source
+
+__all__ = [ "Timings", "Histogram", "TimingStats", "timed", "current_timings", "timing_stats", "init_app" ]
+
+#: upper bounds (in ms) of the buckets of every histogram
+BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total_ms = 0
+        self.max_ms = 0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": [ ["+Inf" if bound == float("inf") else bound, count]
+                             for bound, count in zip(BUCKETS, self.counts) ],
+        }
+
+
+class TimingStats:
+    """
+    Per-endpoint, per-phase histograms of sampled requests. Stats are kept per worker process.
+    """
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, phases):
+        with self.lock:
+            histograms = self.endpoints.setdefault(endpoint, {})
+            for phase, seconds in phases.items():
+                histograms.setdefault(phase, Histogram()).add(seconds * 1000)
+
+    def to_dict(self):
+        with self.lock:
+            return { endpoint: { phase: histogram.to_dict() for phase, histogram in histograms.items() }
+                         for endpoint, histograms in self.endpoints.items() }
+
+
+def current_timings():
+    """
+    The :class:`Timings` of the current request, or None if there is no request or it wasn't sampled
+    (see the `TIMING_SAMPLE_RATE` config). Requests are sampled when first timed.
+    """
+    if not flask.has_request_context():
+        return None
+
+    try:
+        return flask.g.dom_timings
+    except AttributeError:
+        rate = flask.current_app.config.get("TIMING_SAMPLE_RATE") or 0
+        flask.g.dom_timings = Timings() if rate and random.random() < rate else None
+        return flask.g.dom_timings
+
+add_timings_source(current_timings)
+
+def timing_stats(app=None):
+    app = app or flask.current_app
+    return app.extensions.setdefault("dom-timing", TimingStats())
+
+
+def _start():
+    current_timings()
+
+def _finish(response):
+    timings = current_timings()
+    if timings is not None:
+        total = time.perf_counter() - timings.start
+        response.headers["Server-Timing"] = timings.server_timing(total)
+        timing_stats().record(flask.request.endpoint or "-", dict(timings.phases, total=total))
+    return response
+
+def init_app(app):
+    """Sample and time requests to app (see :func:`timed`)"""
+    app.before_request(_start)
+    app.after_request(_finish)
+    timing_stats(app)
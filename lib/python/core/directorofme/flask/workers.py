@@ -0,0 +1,45 @@
+'''
+workers.py -- worker process setup for DOM flask apps. Also a gunicorn config
+              module (`gunicorn -c python:directorofme.flask.workers`) which
+              warms up every worker it boots.
+'''
+import time
+
+from .api import Spec
+from .orm import DOMSQLAlchemy
+from .cache import cache_backend
+
+__all__ = [ "warmup", "post_worker_init" ]
+
+def warmup(app, workers=1):
+    """
+    Prepare a freshly forked worker process for app: re-create the database pools inherited from the
+    parent, open the `WARMUP_CONNECTIONS` config connections, create the cache backend (shared if there
+    are several `workers`, see :func:`.cache.cache_backend`), build the spec and instantiate the schemas
+    registered with it.
+    """
+    state = app.extensions.get("sqlalchemy")
+    if state is not None and isinstance(state.db, DOMSQLAlchemy):
+        state.db.after_fork(app)
+        state.db.warmup(app)
+
+    with app.app_context():
+        cache_backend(app, workers)
+
+        spec = app.extensions.get(Spec.name)
+        if spec is not None:
+            spec.to_dict()
+            # specs read from `SPEC_CACHE_PATH` build no schemas, so one which can't be built fails the
+            # worker here, rather than its first requests
+            for definition in spec.definitions:
+                definition.schema()
+
+def post_worker_init(worker):
+    """gunicorn hook, called in each worker once it has loaded the app (or the apps of a :class:`.Monolith`)"""
+    for app in getattr(worker.wsgi, "apps", [ worker.wsgi ]):
+        if not hasattr(app, "extensions"):
+            continue
+
+        start = time.perf_counter()
+        warmup(app, worker.cfg.workers)
+        worker.log.info("Warmed up %s in %.2fms", app.name, (time.perf_counter() - start) * 1000)
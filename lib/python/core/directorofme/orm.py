@@ -28,6 +28,8 @@ def slugify_on_change(src, target, default=True):
         cls.__init__ = __init__
 
         listen(getattr(cls, src), "set", lambda obj, v, x, y: setattr(obj, target, slugify(v)))
+        # recorded so that updates which skip attribute events can slug for themselves
+        cls.__slugified__ = dict(getattr(cls, "__slugified__", {}), **{ src: target })
         return cls
 
     return inner
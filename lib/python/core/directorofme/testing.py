@@ -8,20 +8,31 @@ import sqlalchemy
 from unittest import mock
 from .authorization.orm import Model
 from .authorization import groups
+from .flask.cache import cache_backend
+from .flask.queries import enforce_budgets
+from .flask.memory import trace_memory
 
 # TODO ironically, tests
 __all__ = [ "db", "existing", "commit_with_integrity_error", "dict_from_response", "dump_and_load",
             "comparable_links", "profile_id", "group_of_one", "unscoped_identity", "scoped_identity",
-            "token_mock" ]
+            "token_mock", "trace_memory" ]
 
 def db(real_db):
     def inner():
-        yield real_db
-
-        real_db.session.rollback()
-        for table in reversed(Model.metadata.sorted_tables):
-            real_db.engine.execute(table.delete())
-        real_db.session.commit()
+        # requests made by the test fail it (after cleaning up) if they go over their query budget
+        with enforce_budgets():
+            yield real_db
+
+            real_db.session.rollback()
+            for table in reversed(Model.metadata.sorted_tables):
+                real_db.engine.execute(table.delete())
+            real_db.session.commit()
+
+            # deletes above bypass the session, so cached responses aren't invalidated
+            try:
+                cache_backend(real_db.get_app()).clear()
+            except RuntimeError:
+                pass
 
     inner.__name__ = "db"
     return inner
@@ -0,0 +1,59 @@
+import time
+import contextlib
+
+__all__ = [ "Timings", "timed", "current_timings", "add_timings_source" ]
+
+class Timings:
+    """
+    Time spent in each phase (`jwt`, `permissions`, `sql`, `marshmallow`, `dom`) of a sampled request.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.active = set()
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def server_timing(self, total):
+        """Value for a `Server-Timing` header"""
+        return ", ".join("{};dur={:.2f}".format(phase, seconds * 1000)
+                             for phase, seconds in sorted(self.phases.items()) + [("total", total)])
+
+
+_sources = []
+
+def add_timings_source(source):
+    """
+    Register source, a callable returning the :class:`Timings` of whatever is being timed in the calling
+    thread or None (see :mod:`.flask.timing` for flask requests).
+    """
+    if source not in _sources:
+        _sources.append(source)
+
+def current_timings():
+    """The :class:`Timings` from the first source timing the calling thread, or None"""
+    for source in _sources:
+        timings = source()
+        if timings is not None:
+            return timings
+    return None
+
+@contextlib.contextmanager
+def timed(phase):
+    """
+    Add the time spent in the with block (or decorated function) to `phase` of the current request, if
+    it is sampled. Nested blocks timing the same phase are only counted once.
+    """
+    timings = current_timings()
+    if timings is None or phase in timings.active:
+        yield
+        return
+
+    timings.active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - start)
+        timings.active.discard(phase)
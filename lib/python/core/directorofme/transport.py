@@ -0,0 +1,346 @@
+import io
+import time
+import random
+import socket
+import threading
+import http.client
+
+from collections import Counter
+from urllib.parse import urlsplit, urlunsplit, quote, unquote
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.response import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+__all__ = [ "CircuitOpen", "Transport", "UnixHTTPConnectionPool", "parse_upstreams", "default_transport",
+            "configure_transport" ]
+
+#: scheme of upstream urls for Unix domain sockets, the (quoted) socket path is their host
+UNIX_SCHEME = "http+unix"
+
+class CircuitOpen(ConnectionError):
+    """Raised without sending a request, while the circuit breaker for its host is open"""
+    pass
+
+
+def parse_upstreams(upstreams):
+    """
+    Parse a map of api names to the upstreams serving them, from `<api>=<upstream>,...` where upstream is
+    `unix:<socket path>` or an `http://<host>:<port>` url, e.g. `auth=unix:/run/auth.sock,event=http://127.0.0.1:5556`.
+    Upstreams may also be given as a dict, whose values may be WSGI apps to call in this process.
+    """
+    if not isinstance(upstreams, dict):
+        pairs = [ p.partition("=") for p in (p.strip() for p in (upstreams or "").split(",")) if p ]
+        for api, _, upstream in pairs:
+            if not upstream:
+                raise ValueError("Upstreams must be `<api>=<upstream>`, not: {}".format(api))
+        upstreams = { api.strip(): upstream for api, _, upstream in pairs }
+
+    parsed = {}
+    for api, upstream in upstreams.items():
+        if not callable(upstream):
+            upstream = upstream.strip().rstrip("/")
+            if upstream.startswith("unix:"):
+                upstream = "{}://{}".format(UNIX_SCHEME, quote(upstream[len("unix:"):], safe=""))
+        parsed[api] = upstream
+    return parsed
+
+
+class _DispatchedResponse:
+    """Stands in for the `http.client` response of a request dispatched in process (for cookie handling)"""
+    def __init__(self, msg):
+        self.msg = msg
+
+    def isclosed(self):
+        return True
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """An HTTP connection over the Unix domain socket at `socket_path`"""
+    def __init__(self, socket_path, *args, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        # the socket factory of both urllib3 1.x and 2.x, whose connect() wraps it differently
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    """Keep-alive connections to the Unix domain socket at socket_path"""
+    def __init__(self, socket_path, **kwargs):
+        self.socket_path = socket_path
+        super().__init__("localhost", **kwargs)
+
+    def _new_conn(self):
+        self.num_connections += 1
+        return UnixHTTPConnection(self.socket_path, host=self.host, port=self.port,
+                                  timeout=self.timeout.connect_timeout, **self.conn_kw)
+
+
+class Transport(HTTPAdapter):
+    """
+    The transport settings of DOM clients, as a `requests` transport adapter: a pool of up to `pool_size`
+    keep-alive connections per host, connect and read timeouts, retries of idempotent requests that fail
+    to connect, time out or get a 502, 503 or 504 (after a jittered exponential backoff) and a per-host
+    circuit breaker, which fails requests to a host immediately for `breaker_reset` seconds once
+    `breaker_failures` requests to it failed in a row, retries and all. One request is let through after that, to probe
+    whether the host has recovered.
+
+    Requests to the apis in `upstreams` (see :func:`parse_upstreams`) on `internal_host` skip the public
+    proxy and go straight to their upstream, over a Unix domain socket or loopback HTTP, keeping the Host
+    header and cookies of the public url. Upstreams which are WSGI apps are called in this process instead
+    (see :meth:`dispatch`).
+    """
+    idempotent_methods = frozenset(( "GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE" ))
+    retry_statuses = frozenset(( 502, 503, 504 ))
+    settings = ( "connect_timeout", "read_timeout", "retries", "backoff", "breaker_failures", "breaker_reset",
+                 "upstreams", "internal_host" )
+
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=30, retries=2, backoff=0.1,
+                 breaker_failures=5, breaker_reset=30, upstreams=None, internal_host=None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.upstreams = parse_upstreams(upstreams)
+        self.internal_host = internal_host
+        self.stats = Counter()
+        self.breakers = {}
+        self.unix_pools = {}
+        self.lock = threading.Lock()
+        super().__init__(pool_maxsize=pool_size, max_retries=0)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def configure(self, pool_size=None, **settings):
+        """Change settings (as passed to the constructor), resizing the connection pools if needed"""
+        for name, value in settings.items():
+            if name not in self.settings:
+                raise TypeError("Unknown transport setting: {}".format(name))
+            setattr(self, name, parse_upstreams(value) if name == "upstreams" else value)
+
+        if pool_size is not None and pool_size != self.pool_size:
+            self.pool_size = pool_size
+            self.close()
+            self.init_poolmanager(self._pool_connections, pool_size, block=self._pool_block)
+
+    def upstream(self, url):
+        """
+        The split url of the upstream for url (or its WSGI app), if it is for an internal api with an upstream
+        """
+        url = urlsplit(url)
+        segments = url.path.split("/")
+        if not self.upstreams or url.netloc != self.internal_host or segments[1:2] != [ "api" ] \
+                or len(segments) < 4 or segments[3] not in self.upstreams:
+            return None
+
+        upstream = self.upstreams[segments[3]]
+        return upstream if callable(upstream) else urlsplit(upstream)
+
+    def route(self, request):
+        """A copy of request addressed to its upstream server (see :meth:`upstream`), or None"""
+        upstream = self.upstream(request.url)
+        if upstream is None or callable(upstream):
+            return None
+
+        url = urlsplit(request.url)
+        routed = request.copy()
+        routed.url = urlunsplit((upstream.scheme, upstream.netloc, url.path, url.query, ""))
+        routed.headers["Host"] = url.netloc
+        routed.headers["X-Forwarded-Proto"] = url.scheme
+        self.count("routed")
+        return routed
+
+    def unix_pool(self, netloc):
+        """The pool of connections to the Unix domain socket at (quoted) netloc"""
+        with self.lock:
+            pool = self.unix_pools.get(netloc)
+            if pool is None:
+                pool = self.unix_pools[netloc] = UnixHTTPConnectionPool(
+                    unquote(netloc), maxsize=self.pool_size, block=self._pool_block)
+            return pool
+
+    def get_connection(self, url, proxies=None):
+        url = urlsplit(url)
+        if url.scheme != UNIX_SCHEME:
+            return super().get_connection(url.geturl(), proxies)
+        return self.unix_pool(url.netloc)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        # requests >= 2.32 gets connections here instead of from get_connection
+        url = urlsplit(request.url)
+        if url.scheme != UNIX_SCHEME:
+            return super().get_connection_with_tls_context(request, verify, proxies=proxies, cert=cert)
+        return self.unix_pool(url.netloc)
+
+    def close(self):
+        super().close()
+        with self.lock:
+            for pool in self.unix_pools.values():
+                pool.close()
+            self.unix_pools = {}
+
+    def dispatch(self, app, request):
+        """
+        Handle request with the WSGI app app in this process, as if it were sent to the app's server, returning
+        its response.
+        """
+        url = urlsplit(request.url)
+        body = request.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        elif body is not None and not isinstance(body, bytes):
+            body = body.read() if hasattr(body, "read") else b"".join(body)
+
+        environ = EnvironBuilder(path=url.path, query_string=url.query, method=request.method,
+                                 base_url="{}://{}".format(url.scheme, url.netloc),
+                                 headers=list(request.headers.items()), data=body).get_environ()
+        app_iter, status, headers = run_wsgi_app(app, environ, buffered=True)
+        try:
+            content = b"".join(app_iter)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+        message = http.client.HTTPMessage()
+        for name, value in headers:
+            message[name] = value
+
+        self.count("requests", "dispatched")
+        return self.build_response(request, HTTPResponse(
+            body=io.BytesIO(content), headers=HTTPHeaderDict(list(headers)), status=int(status[:3]),
+            reason=status[4:], preload_content=False, original_response=_DispatchedResponse(message)))
+
+    def send(self, request, timeout=None, **kwargs):
+        upstream = self.upstream(request.url)
+        if callable(upstream):
+            return self.dispatch(upstream, request)
+
+        routed = self.route(request)
+        if routed is not None:
+            # internal traffic never goes through proxies
+            kwargs["proxies"] = {}
+
+        host = urlsplit((routed or request).url).netloc
+        timeout = self.timeout if timeout is None else timeout
+        attempt = 0
+        while True:
+            self.admit(host)
+            self.count("attempts")
+            error, response = None, None
+            try:
+                response = super().send(routed or request, timeout=timeout, **kwargs)
+            except (ConnectionError, Timeout) as e:
+                error = e
+                if isinstance(e, Timeout):
+                    self.count("timeouts")
+
+            if response is not None and routed is not None:
+                response.request, response.url = request, request.url
+
+            if response is not None and response.status_code not in self.retry_statuses:
+                self.succeeded(host)
+                return response
+
+            # streamed bodies can't be resent
+            if not (request.body is None or isinstance(request.body, (bytes, str))) or \
+                    not self.retryable(request.method, attempt):
+                # the breaker counts requests failing for good, not every attempt at them
+                self.failed(host)
+                if error is not None:
+                    raise error
+                return response
+
+            if response is not None:
+                response.close()
+            time.sleep(self.delay(attempt))
+            attempt += 1
+
+    ### shared with the async client
+    def count(self, *names):
+        # the transport is shared by the threads of a worker (and those of e.g. `iter_collection`)
+        with self.lock:
+            for name in names:
+                self.stats[name] += 1
+
+    def retryable(self, method, attempt):
+        if method.upper() in self.idempotent_methods and attempt < self.retries:
+            self.count("retries")
+            return True
+        return False
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt, with full jitter"""
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def admit(self, host):
+        """Raise :class:`CircuitOpen` if the breaker for host is open"""
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None or breaker["opened"] is None:
+                return
+            if time.time() - breaker["opened"] < self.breaker_reset:
+                self.stats["rejected"] += 1
+                raise CircuitOpen("Circuit open for {} after {} failures".format(host, breaker["failures"]))
+            # let this request probe the host, failing others until it's done
+            breaker["opened"] = time.time()
+
+    def succeeded(self, host):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.breakers.pop(host, None)
+
+    def failed(self, host):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["failures"] += 1
+            breaker = self.breakers.setdefault(host, { "failures": 0, "opened": None })
+            breaker["failures"] += 1
+            if breaker["failures"] >= self.breaker_failures:
+                if breaker["opened"] is None:
+                    self.stats["breaker_opens"] += 1
+                breaker["opened"] = time.time()
+
+    def to_dict(self):
+        with self.lock:
+            open_breakers = sorted(host for host, breaker in self.breakers.items()
+                                       if breaker["opened"] is not None)
+            stats = { k: self.stats[k] for k in ("requests", "attempts", "routed", "dispatched", "failures",
+                                                 "retries", "timeouts", "rejected", "breaker_opens") }
+        stats["open_breakers"] = open_breakers
+        return stats
+
+
+#: shared by all DOM clients in this process, so connections and breakers are shared between them too
+default_transport = Transport()
+
+def configure_transport(config, transport=default_transport):
+    """
+    Apply the `DOM_CLIENT_*` settings in config to transport. Upstreams (`DOM_CLIENT_UPSTREAMS`) are used
+    for requests to the `SERVER_NAME` of config.
+    """
+    transport.configure(**{ name: config[key] for name, key in (
+        ("pool_size", "DOM_CLIENT_POOL_SIZE"),
+        ("connect_timeout", "DOM_CLIENT_CONNECT_TIMEOUT"),
+        ("read_timeout", "DOM_CLIENT_READ_TIMEOUT"),
+        ("retries", "DOM_CLIENT_RETRIES"),
+        ("backoff", "DOM_CLIENT_BACKOFF"),
+        ("breaker_failures", "DOM_CLIENT_BREAKER_FAILURES"),
+        ("breaker_reset", "DOM_CLIENT_BREAKER_RESET"),
+        ("upstreams", "DOM_CLIENT_UPSTREAMS"),
+        ("internal_host", "SERVER_NAME"),
+    ) if config.get(key) is not None })
@@ -28,6 +28,24 @@ class TestSessionInterface(SessionInterface):
         return session.Session(save=False, app=None, profile=None, groups=[groups.everybody],
                                environment={}, default_object_perms={})
 
+class GroupsSessionInterface(SessionInterface):
+    """Sessions in the groups of the interface, e.g. `[ groups.admin ]` for admin only endpoints"""
+    def __init__(self, groups=()):
+        self.groups = list(groups)
+
+    def open_session(self, *args):
+        return session.Session(save=False, app=None, profile=None, groups=self.groups,
+                               environment={}, default_object_perms={})
+
+    def save_session(self, *args):
+        pass
+
+@pytest.fixture
+def groups_session(app):
+    """Install a :class:`GroupsSessionInterface` (with no groups) on app"""
+    app.session_interface = GroupsSessionInterface()
+    return app.session_interface
+
 @pytest.fixture
 def request_context_with_session(app):
     app.session_interface = TestSessionInterface()
@@ -0,0 +1,233 @@
+import io
+import json
+import time
+import base64
+import asyncio
+import http.client
+
+import pytest
+
+from directorofme import client
+from directorofme.aioclient import AsyncDOM, run
+from directorofme.transport import Transport
+
+def jwt(exp):
+    claims = base64.urlsafe_b64encode(json.dumps({ "exp": exp }).encode("utf-8")).decode("utf-8").rstrip("=")
+    return "header.{}.signature".format(claims)
+
+class StandIn:
+    """A local HTTP/1.1 server standing in for a DOM api"""
+    def __init__(self):
+        self.connections = 0
+        self.requests = []
+        self.refreshes = 0
+        self.active = 0
+        self.max_active = 0
+        self.handlers = []
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.handlers.append(asyncio.Task.current_task())
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b"\r\n")
+                except asyncio.IncompleteReadError:
+                    return
+                method, path, _ = line.decode("latin-1").split(" ")
+                headers = http.client.parse_headers(io.BytesIO(await reader.readuntil(b"\r\n\r\n")))
+                body = await reader.readexactly(int(headers.get("Content-Length", 0)))
+                self.requests.append((method, path, headers, body))
+
+                self.active += 1
+                self.max_active = max(self.active, self.max_active)
+                try:
+                    writer.write(await self.respond(method, path, headers, body))
+                finally:
+                    self.active -= 1
+                await writer.drain()
+                if path.endswith("/close"):
+                    writer.close()
+                    return
+        finally:
+            writer.close()
+
+    async def respond(self, method, path, headers, body):
+        cookies = headers.get("Cookie", "")
+        extra, chunked = [], False
+        if path == "/api/-/auth/session":
+            self.refreshes += 1
+            await asyncio.sleep(0.01)
+            status, payload = 200, { "refreshed": self.refreshes }
+            extra.append("Set-Cookie: access_token_cookie={}; Path=/".format(jwt(time.time() + 3600)))
+            extra.append("Set-Cookie: csrf_access_token=new-csrf; Path=/")
+        elif path == "/api/-/private" and "access_token_cookie=header" not in cookies:
+            status, payload = 401, { "message": "expired" }
+        elif path.startswith("/api/-/status/"):
+            status, payload = int(path.split("/")[-1]), { "message": "status" }
+        else:
+            await asyncio.sleep(0.2 if path.endswith("/slow") else 0.01)
+            chunked = path.endswith("/chunked")
+            if path.endswith("/close"):
+                extra.append("Connection: close")
+            status, payload = 200, { "method": method, "path": path, "cookies": cookies,
+                                     "csrf": headers.get("X-CSRF-TOKEN"),
+                                     "body": json.loads(body.decode("utf-8")) if body else None }
+
+        content = b"" if status in (204, 304) else json.dumps(payload).encode("utf-8")
+        head = [ "HTTP/1.1 {} {}".format(status, http.client.responses[status]),
+                 "Content-Type: application/json" ] + extra
+        if chunked:
+            head.append("Transfer-Encoding: chunked")
+            half = len(content) // 2
+            content = b"".join(b"%x\r\n%s\r\n" % (len(c), c) for c in (content[:half], content[half:])) + b"0\r\n\r\n"
+        elif status not in (204, 304):
+            head.append("Content-Length: {}".format(len(content)))
+
+        return "\r\n".join(head).encode("latin-1") + b"\r\n\r\n" + content
+
+def serving(test):
+    """Run the coroutine test(stand_in, domain) in a new loop, with a stand in server"""
+    async def main():
+        stand_in = StandIn()
+        server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+        try:
+            port = server.sockets[0].getsockname()[1]
+            return await test(stand_in, "127.0.0.1:{}".format(port))
+        finally:
+            server.close()
+            await server.wait_closed()
+            for handler in stand_in.handlers:
+                handler.cancel()
+            await asyncio.gather(*stand_in.handlers, return_exceptions=True)
+
+    return run(main())
+
+class TestAsyncDOM:
+    def test__init__(self):
+        dom = AsyncDOM("test.directorof.me", access_token="access", access_csrf_token="csrf",
+                       refresh_token="refresh", refresh_csrf_token="refresh-csrf")
+        assert dom.url("a/b") == "https://test.directorof.me/api/-/a/b", "urls built like DOM's"
+        assert dom.headers["X-CSRF-TOKEN"] == "csrf", "csrf header"
+        assert dom.headers["X-CSRF-REFRESH-TOKEN"] == "refresh-csrf", "refresh csrf header"
+        assert dom.token("access_token_cookie") == "access", "tokens kept as cookies"
+        assert AsyncDOM("localhost:8000", scheme="http").url("a") == "http://localhost:8000/api/-/a", \
+               "domains may have ports"
+
+    def test__requests(self):
+        async def test(stand_in, domain):
+            async with AsyncDOM(domain, access_token="access", access_csrf_token="csrf", scheme="http") as dom:
+                response = await dom.post("echo", { "a": 1 }, params={ "q": "x" })
+                assert response["method"] == "POST" and response["body"] == { "a": 1 }, "json body sent"
+                assert response["path"] == "/api/-/echo?q=x", "params sent"
+                assert response["cookies"] == "access_token_cookie=access", "cookies sent"
+                assert response["csrf"] == "csrf", "csrf header sent"
+
+                assert (await dom.get("echo/chunked"))["method"] == "GET", "chunked responses read"
+                assert await dom.delete("status/204") is None, "no content"
+
+                for status, error in ((400, client.BadRequest), (401, client.Unauthorized),
+                                      (403, client.PermissionDenied), (404, client.NotFound),
+                                      (409, client.Conflict), (500, client.ServerError)):
+                    with pytest.raises(error):
+                        await dom.get("status/{}".format(status))
+
+            assert stand_in.connections == 1, "requests share a keep-alive connection"
+
+        serving(test)
+
+    def test__concurrency(self):
+        async def test(stand_in, domain):
+            dom = AsyncDOM(domain, scheme="http", max_workers=3)
+            responses = await asyncio.gather(*(dom.get("echo/{}".format(i)) for i in range(10)))
+            assert [ r["path"] for r in responses ] == [ "/api/-/echo/{}".format(i) for i in range(10) ], \
+                   "concurrent requests"
+            assert stand_in.max_active == 3, "requests in flight limited to max_workers"
+            assert stand_in.connections == 3, "connections kept alive and reused"
+            dom.close()
+
+        serving(test)
+
+    def test__loops(self):
+        dom = AsyncDOM("test.directorof.me", access_token="expired")
+        for _ in range(2):
+            assert run(dom.call("token", "access_token_cookie")) == "expired", "usable from more than one loop"
+        dom.close()
+
+    def test__transport(self):
+        async def test(stand_in, domain):
+            transport = Transport(read_timeout=0.05, retries=1, backoff=0, breaker_failures=2)
+            dom = AsyncDOM(domain, scheme="http", transport=transport)
+            with pytest.raises(client.Unavailable):
+                await dom.get("echo/slow")
+            assert len(stand_in.requests) == 2, "timed out GETs retried"
+
+            with pytest.raises(client.Unavailable):
+                await dom.post("echo/slow")
+            assert len(stand_in.requests) == 3, "POSTs aren't retried"
+            assert transport.to_dict()["timeouts"] == 3, "timeouts counted"
+
+            with pytest.raises(client.Unavailable):
+                await dom.get("echo")
+            assert len(stand_in.requests) == 3, "open breakers fail fast"
+            dom.close()
+
+        serving(test)
+
+    def test__upstreams(self, tmpdir):
+        async def test(stand_in, domain):
+            path = str(tmpdir.join("auth.sock"))
+            routed = StandIn()
+            server = await asyncio.start_unix_server(routed.handle, path)
+            try:
+                transport = Transport(internal_host="test.directorof.me", upstreams="auth=unix:{}".format(path))
+                dom = AsyncDOM("test.directorof.me", access_token="token", transport=transport)
+                response = await dom.get("auth/echo")
+                assert response["path"] == "/api/-/auth/echo", "routed over the socket"
+                assert response["cookies"] == "access_token_cookie=token", "cookies sent"
+
+                method, _, headers, _ = routed.requests[0]
+                assert headers["Host"] == "test.directorof.me", "host kept"
+                assert headers["X-Forwarded-Proto"] == "https", "scheme forwarded"
+                dom.close()
+            finally:
+                server.close()
+                await server.wait_closed()
+                for handler in routed.handlers:
+                    handler.cancel()
+                await asyncio.gather(*routed.handlers, return_exceptions=True)
+
+        serving(test)
+
+    def test__refresh(self):
+        async def test(stand_in, domain):
+            dom = AsyncDOM(domain, access_token="expired", refresh_token=jwt(time.time() + 3600), scheme="http")
+            responses = await asyncio.gather(*(dom.get("private") for _ in range(5)))
+            assert all(r["method"] == "GET" for r in responses), "401s refreshed and resent"
+            assert stand_in.refreshes == 1 and dom.refreshes == 1, "concurrent refreshes shared"
+            assert dom.headers["X-CSRF-TOKEN"] == "new-csrf", "csrf updated from refresh"
+
+            dom.cookies.clear()
+            dom.cookies["access_token_cookie"] = jwt(time.time() + 5)
+            dom.cookies["refresh_token_cookie"] = jwt(time.time() + 3600)
+            await dom.get("echo")
+            assert stand_in.refreshes == 2, "refreshed before sending when close to expiring"
+
+            with pytest.raises(client.Unauthorized):
+                await AsyncDOM(domain, access_token="expired", scheme="http").get("private")
+            dom.close()
+
+        serving(test)
+
+    def test__from_installed_app(self):
+        class Cipher:
+            def decrypt(self, value):
+                return value[::-1]
+
+        installed_app = { "id": "app-id", "config": { "integrations": { "directorofme": {
+            "refresh_token": { "value": "hserfer" }, "refresh_csrf_token": { "value": "frsc" } } } } }
+
+        dom = AsyncDOM.from_installed_app("test.directorof.me", Cipher(), installed_app, cache=None)
+        assert isinstance(dom, AsyncDOM), "async client built"
+        assert dom.token("refresh_token_cookie") == "refresh", "tokens decrypted"
+        assert dom.headers["X-CSRF-REFRESH-TOKEN"] == "csrf", "csrf decrypted"
@@ -1,3 +1,7 @@
+import time
+import base64
+import threading
+
 import pytest
 import json
 import requests
@@ -7,11 +11,20 @@ from directorofme import client
 
 DOM = client.DOM
 
+def jwt(exp):
+    claims = base64.urlsafe_b64encode(json.dumps({ "exp": exp }).encode("utf-8")).decode("utf-8").rstrip("=")
+    return "header.{}.signature".format(claims)
+
 @pytest.fixture
 def dom_client():
     yield DOM("test.directorof.me")
 
 class TestDOM:
+    def test__token_expires(self):
+        assert client.token_expires(jwt(12.5)) == 12.5, "exp read from claims"
+        for token in (None, "", "a.b.c", "header.{}.sig".format(base64.b64encode(b"[]").decode("utf-8"))):
+            assert client.token_expires(token) is None, "unreadable tokens have no expiry"
+
     def test__init__(self):
         assert "X-CSRF-TOKEN" not in DOM("test.directorof.me").headers, "no headers set if no CSRF passed"
         assert "X-CSRF-REFRESH-TOKEN" not in DOM("test.directorof.me").headers, "no headers set if no CSRF passed"
@@ -84,6 +97,70 @@ class TestDOM:
                     kwargs["json"] = None
                 mock_method.assert_called_with(**kwargs)
 
+    def test__iter_collection_paged(self, dom_client):
+        requested = []
+        prefetched = threading.Event()
+
+        def get(url, params):
+            page, per_page = params.get("page", 1), params["results_per_page"]
+            requested.append(page)
+            if page == 2:
+                prefetched.set()
+            objs = list(range((page - 1) * per_page, min(page * per_page, 7)))
+            return { "page": page, "results_per_page": per_page, "collection": objs, "_links": {
+                "self": "/api/-/test/?page={}".format(page), "next": "/api/-/test/?page={}".format(page + 1) } }
+
+        with mock.patch.object(dom_client, "get", side_effect=get) as mock_get:
+            items = dom_client.iter_collection("test/", page_size=3, pages_in_flight=2, q="x")
+            assert next(items) == 0, "items yielded lazily"
+            assert prefetched.wait(1), "next page prefetched while the first is consumed"
+            assert list(items) == list(range(1, 7)), "all pages yielded in order"
+            assert sorted(requested)[:3] == [ 1, 2, 3 ], "pages fetched by number"
+            assert mock_get.call_args_list[0] == mock.call("test/", params={ "q": "x", "results_per_page": 3 }), \
+                   "params passed along"
+
+    def test__iter_collection_links(self, dom_client):
+        feed = { None: ([ 1, 2 ], "a"), "a": ([ 3, 4 ], "b"), "b": ([ 5 ], "c") }
+
+        def get(url, params):
+            assert url == "event/events/", "links converted to api paths"
+            objs, next_cursor = feed[params.get("cursor")]
+            return { "results_per_page": 2, "collection": objs, "_links": {
+                "next": "/api/-/event/events/?cursor={}&results_per_page=2".format(next_cursor) } }
+
+        with mock.patch.object(dom_client, "get", side_effect=get) as mock_get:
+            assert list(dom_client.iter_collection("event/events/", page_size=2)) == [ 1, 2, 3, 4, 5 ], \
+                   "_links.next followed until a short page"
+            assert mock_get.call_count == 3, "no requests past the end"
+
+        assert dom_client.link_path("https://test.directorof.me/api/v1/auth/groups/?page=2") == \
+               ("auth/groups/", { "page": "2" }), "links parsed"
+
+    def test__batch(self, dom_client):
+        with pytest.raises(ValueError):
+            dom_client.batch([("get", "auth/apps"), ("get", "event/events")])
+
+        with mock.patch.object(dom_client, "post") as mock_post:
+            mock_post.return_value = { "responses": [
+                { "status": 200, "headers": {}, "body": { "slug": "a" } },
+                { "status": 204, "headers": {}, "body": None },
+            ] }
+            results = dom_client.batch([("get", "auth/apps/a"), ("delete", "auth/apps/${0.body.slug}", { "b": 1 })])
+            assert results == [{ "slug": "a" }, None], "results checked and returned"
+            mock_post.assert_called_with("auth/batch", {
+                "stop_on_error": True,
+                "requests": [
+                    { "method": "GET", "url": "/api/-/auth/apps/a", "body": None },
+                    { "method": "DELETE", "url": "/api/-/auth/apps/${0.body.slug}", "body": { "b": 1 } },
+                ]
+            })
+
+            mock_post.return_value = { "responses": [
+                { "status": 404, "headers": {}, "body": { "message": "not found" } },
+            ] }
+            with pytest.raises(client.NotFound, match=r".*not found.*"):
+                dom_client.batch([("get", "auth/apps/a")])
+
     def test__refresh(self, dom_client):
         def mock_put_side_effect(*args, **kwargs):
             dom_client.cookies["csrf_access_token"] = "csrf_access_token"
@@ -97,6 +174,81 @@ class TestDOM:
             assert dom_client.headers["X-CSRF-TOKEN"] == "csrf_access_token"
             assert dom_client.headers["X-CSRF-REFRESH-TOKEN"] == "csrf_refresh_token"
 
+    def test__refresh_shared(self, dom_client):
+        started, release = threading.Event(), threading.Event()
+        def mock_put_side_effect(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return { "session": mock_put.call_count }
+
+        results = []
+        with mock.patch.object(dom_client, "put") as mock_put:
+            mock_put.side_effect = mock_put_side_effect
+            first = threading.Thread(target=lambda: results.append(dom_client.refresh()))
+            first.start()
+            started.wait(5)
+
+            second = threading.Thread(target=lambda: results.append(dom_client.refresh()))
+            second.start()
+            release.set()
+            first.join(5)
+            second.join(5)
+
+            assert mock_put.call_count == 1, "concurrent callers share one refresh"
+            assert results == [{ "session": 1 }] * 2, "refresh result shared"
+
+            dom_client.refresh()
+            assert mock_put.call_count == 2, "later callers refresh again"
+            dom_client.refresh(seen=1)
+            assert mock_put.call_count == 2, "callers that saw an older token share a newer refresh"
+
+    def test__send_refreshes(self, dom_client):
+        now = time.time()
+        sent = []
+        def mock_send(request, **kwargs):
+            sent.append((request.method, request.url.split("/api/-/")[1], request.headers.get("Cookie")))
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b"{}"
+            response._content_consumed = True
+            if request.url.endswith("auth/session"):
+                dom_client.cookies.set("access_token_cookie", jwt(now + 900), domain="test.directorof.me")
+                dom_client.cookies.set("csrf_access_token", "csrf", domain="test.directorof.me")
+            elif "access_token_cookie={}".format(jwt(now - 1)) in request.headers.get("Cookie", ""):
+                response.status_code = 401
+            return response
+
+        with mock.patch("requests.Session.send", side_effect=mock_send):
+            with pytest.raises(client.Unauthorized):
+                DOM("test.directorof.me", access_token=jwt(now - 1)).get("a/b")
+            assert [ method for method, *_ in sent ] == ["GET"], "no refresh without a refresh token"
+
+            del sent[:]
+            dom_client.cookies["refresh_token_cookie"] = "refresh"
+            dom_client.cookies["access_token_cookie"] = jwt(now + 10)
+            assert dom_client.access_expires() == pytest.approx(now + 10), "expiry read from claims"
+            dom_client.get("a/b")
+            assert [ url for _, url, _ in sent ] == ["auth/session", "a/b"], "refreshed when near expiry"
+            assert jwt(now + 900) in sent[-1][2] and jwt(now + 10) not in sent[-1][2], "new token sent"
+            assert dom_client.headers["X-CSRF-TOKEN"] == "csrf", "csrf header updated"
+
+            del sent[:]
+            dom_client.get("a/c")
+            assert [ url for _, url, _ in sent ] == ["a/c"], "not refreshed when fresh"
+
+            del sent[:]
+            dom_client.cookies.clear()
+            dom_client.cookies["refresh_token_cookie"] = "refresh"
+            dom_client.cookies["access_token_cookie"] = "opaque"
+            dom_client.post("a/d", { "x": 1 })
+            assert [ url for _, url, _ in sent ] == ["a/d"], "tokens of unknown expiry are used"
+
+            del sent[:]
+            dom_client.cookies["access_token_cookie"] = jwt(now - 1)
+            dom_client.refresh_margin = -3600
+            dom_client.post("a/e", { "x": 1 })
+            assert [ url for _, url, _ in sent ] == ["a/e", "auth/session", "a/e"], "refreshed and resent on a 401"
+
     def test__from_request(self, app):
         class MockRequest:
             def __init__(self, host, access_token, csrf_token, refresh_token, refresh_csrf_token):
@@ -161,7 +313,8 @@ class TestDOM:
         with mock.patch.object(DOM, "refresh") as mock_refresh:
             client = DOM.from_installed_app("test.example.com", Cipher(), installed_app)
 
-            assert mock_refresh.called, "client refreshed"
+            assert not mock_refresh.called, "client refreshed lazily"
+            assert client.access_expires() == 0, "no access token yet"
             assert client.cookies["refresh_token_cookie"] == "encrypted refresh_token", "refresh cookie works"
             assert client.headers["X-CSRF-REFRESH-TOKEN"] == "encrypted refresh_csrf_token", "refresh csrf works"
 
@@ -171,3 +324,57 @@ class TestDOM:
         del installed_app["config"]["integrations"]["directorofme"]["refresh_token"]["value"]
         with pytest.raises(ValueError):
             DOM.from_installed_app("test.example.com", Cipher(), installed_app)
+
+    def test__from_installed_app_cached(self):
+        decrypted = []
+        class Cipher:
+            def decrypt(self, value):
+                decrypted.append(value)
+                return value
+
+        def installed_app(id_, refresh_token):
+            return { "id": id_, "config": { "integrations": { "directorofme": {
+                "refresh_token": { "value": refresh_token },
+                "refresh_csrf_token": { "value": "csrf" },
+            } } } }
+
+        cache = client.ClientCache(max_size=2)
+        now = time.time()
+        app_1 = installed_app("1", jwt(now + 3600))
+
+        first = DOM.from_installed_app("test.example.com", Cipher(), app_1, cache=cache)
+        assert DOM.from_installed_app("test.example.com", Cipher(), app_1, cache=cache) is first, "client cached"
+        assert len(decrypted) == 2, "tokens decrypted once"
+
+        rotated = installed_app("1", jwt(now + 7200))
+        assert DOM.from_installed_app("test.example.com", Cipher(), rotated, cache=cache) is not first, \
+               "new tokens make new clients"
+        assert DOM.from_installed_app("other.example.com", Cipher(), app_1, cache=cache) is not first, \
+               "clients cached per domain"
+        assert DOM.from_installed_app("test.example.com", Cipher(), app_1, cache=cache) is not first, \
+               "least recently used clients evicted"
+
+        expiring = installed_app("2", jwt(now + DOM.refresh_margin - 1))
+        assert DOM.from_installed_app("test.example.com", Cipher(), expiring, cache=cache) is not \
+               DOM.from_installed_app("test.example.com", Cipher(), expiring, cache=cache), \
+               "clients expire with their refresh token"
+
+        del decrypted[:]
+        assert DOM.from_installed_app("test.example.com", Cipher(), app_1, cache=None) is not first, \
+               "caching can be skipped"
+        assert len(decrypted) == 2, "uncached clients decrypt tokens"
+
+    def test__ClientCache(self):
+        cache = client.ClientCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2, time.time() - 1)
+        assert cache.get("a") == 1, "cached"
+        assert cache.get("b") is None and "b" not in cache.entries, "expired entries dropped"
+
+        cache.set("c", 3)
+        cache.get("a")
+        cache.set("d", 4)
+        assert sorted(cache.entries) == ["a", "d"], "least recently used evicted"
+
+        cache.clear()
+        assert cache.get("a") is None, "cleared"
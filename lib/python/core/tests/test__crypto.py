@@ -1,6 +1,28 @@
+import io
+
+from base64 import b64encode, urlsafe_b64decode
+from unittest import mock
+
 import pytest
 
-from directorofme.crypto import RSACipher
+from cryptography.fernet import Fernet
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric.padding import OAEP, MGF1
+from cryptography.hazmat.primitives.hashes import SHA256
+
+from directorofme.crypto import RSACipher, KeyCache, TEXT_PREFIX, ENVELOPE_PREFIX, load_key, read_header, benchmark
+
+def header(value):
+    """The binary envelope header of an encrypted value's text form"""
+    encoded = value[len(TEXT_PREFIX):]
+    return read_header(io.BytesIO(urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))))
+
+class ShortReads(io.BytesIO):
+    """A stream returning at most 5 bytes per read, like a pipe or socket might"""
+    def read(self, size=-1):
+        return super().read(5 if size < 0 else min(size, 5))
 
 @pytest.fixture
 def private_key():
@@ -51,3 +73,111 @@ class TestRSACipher:
 
 
         assert RSACipher(private_key=private_key).decrypt(encrypted) == "secret", "decryption works"
+
+    def test__envelope(self, public_key, private_key):
+        cache, data_keys = KeyCache(), KeyCache()
+        encrypted = [ RSACipher(public_key, data_keys=data_keys).encrypt(value) for value in ("a", "b", "c") ]
+
+        assert all(value.startswith(TEXT_PREFIX) and not value.endswith("=") for value in encrypted), "text form"
+        headers = [ header(value) for value in encrypted ]
+        assert len({ h.wrapped_key for h in headers }) == 1, "one wrapped data key shared by values for the same key"
+        assert len({ h.nonce_prefix for h in headers }) == 3, "a nonce prefix per value"
+        assert headers[0].key_id == RSACipher(public_key).key_id, "envelope carries the key id"
+
+        with mock.patch.object(RSACipher, "_RSACipher__unwrap", autospec=True,
+                               side_effect=RSACipher._RSACipher__unwrap) as unwrap:
+            assert [ RSACipher(private_key=private_key, cache=cache).decrypt(value) for value in encrypted ] == \
+                   [ "a", "b", "c" ], "values decrypted"
+            assert unwrap.call_count == 1, "data key unwrapped once"
+
+            RSACipher(private_key=private_key, cache=None).decrypt(encrypted[0])
+            assert unwrap.call_count == 2, "caching is optional"
+
+    def test__envelope_rotation(self, public_key, private_key):
+        data_keys = KeyCache()
+        with mock.patch.object(RSACipher, "data_key_uses", 2):
+            cipher = RSACipher(public_key, data_keys=data_keys)
+            headers = [ header(cipher.encrypt("secret")).wrapped_key for _ in range(3) ]
+        assert headers[0] == headers[1] and headers[1] != headers[2], "data keys replaced after data_key_uses"
+
+        cache = KeyCache()
+        paired = RSACipher(public_key, private_key, cache=cache, data_keys=KeyCache())
+        assert paired.decrypt(paired.encrypt("secret")) == "secret", "round trip"
+        assert len(cache.entries) == 1, "data keys made with a matching private key are cached up front"
+
+    def test__envelope_keys(self, public_key, private_key):
+        cache = KeyCache()
+        encrypted = RSACipher(public_key, data_keys=KeyCache()).encrypt("secret")
+        assert RSACipher(private_key=private_key, cache=cache).decrypt(encrypted) == "secret", "data key cached"
+
+        other_key = rsa.generate_private_key(65537, 1024, default_backend()).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption())
+        with pytest.raises(ValueError):
+            RSACipher(private_key=other_key, cache=cache).decrypt(encrypted)
+        with pytest.raises(AttributeError):
+            RSACipher(public_key, cache=cache).decrypt(encrypted)
+
+    def test__decrypt_original_format(self, public_key, private_key):
+        fernet_key = Fernet.generate_key()
+        wrapped = RSACipher(public_key).public_key.encrypt(
+            fernet_key, OAEP(mgf=MGF1(algorithm=SHA256()), algorithm=SHA256(), label=None))
+        encrypted = ";".join([ b64encode(wrapped).decode("utf-8"), Fernet(fernet_key).encrypt(b"secret").decode("utf-8") ])
+
+        assert RSACipher(private_key=private_key).decrypt(encrypted) == "secret", "original format still decrypts"
+
+        cipher = RSACipher(private_key=private_key, cache=KeyCache())
+        encrypted = "{}{}:{}".format(ENVELOPE_PREFIX, cipher.key_id, encrypted)
+        assert cipher.decrypt(encrypted) == "secret", "wrapped key envelopes still decrypt"
+        with pytest.raises(ValueError):
+            cipher.decrypt(encrypted.replace(cipher.key_id, "0" * 16))
+
+    def test__streams(self, public_key, private_key):
+        encrypter = RSACipher(public_key, data_keys=KeyCache())
+        decrypter = RSACipher(private_key=private_key, cache=KeyCache())
+        data = bytes(range(256)) * 4
+
+        encrypted = io.BytesIO()
+        written = encrypter.encrypt_stream(ShortReads(data), encrypted, chunk_size=100)
+        envelope = encrypted.getvalue()
+        assert written == len(envelope), "bytes written returned"
+        assert len(envelope) - len(read_header(io.BytesIO(envelope)).raw) == len(data) + 11 * 16, "a tag per 100 byte chunk"
+
+        decrypted = io.BytesIO()
+        decrypter.decrypt_stream(ShortReads(envelope), decrypted)
+        assert decrypted.getvalue() == data, "streams round trip, however they are read"
+        assert decrypter.decrypt_bytes(encrypter.encrypt_bytes(b"")) == b"", "empty values round trip"
+
+        size = len(read_header(io.BytesIO(envelope)).raw) + 116
+        first, second = envelope[size - 116:size], envelope[size:size + 116]
+        for broken in (envelope[:-1], envelope[:size], envelope[:size] + second + first + envelope[size + 116:],
+                       envelope[:-1] + bytes([ envelope[-1] ^ 1 ]), envelope + b"x", b"nope"):
+            with pytest.raises(ValueError):
+                decrypter.decrypt_bytes(broken)
+
+
+def test__load_key(public_key, private_key):
+    keys = KeyCache(max_size=2)
+    key, key_id = load_key(public_key, keys=keys)
+    assert load_key(public_key.encode("utf-8"), keys=keys) == (key, key_id), "parsed keys reused by fingerprint"
+    assert load_key(public_key, keys=None)[0] is not key, "parsed again without a registry"
+    assert load_key(private_key, private=True, keys=keys)[1] == key_id, "private keys have their public key's id"
+
+    assert RSACipher(public_key, private_key, keys=keys).public_key is key, "ciphers use the registry"
+    load_key(public_key.replace("\n", "\r\n"), keys=keys)
+    assert len(keys.entries) == 2, "registry bounded"
+
+def test__private_keys_not_kept(public_key, private_key):
+    keys = KeyCache()
+    RSACipher(public_key, private_key, keys=keys)
+    assert [ kind for kind, _ in keys.entries ] == [ "public" ], "private keys are not kept by default"
+
+    private_keys = KeyCache()
+    cipher = RSACipher(private_key=private_key, keys=keys, private_keys=private_keys)
+    assert [ kind for kind, _ in private_keys.entries ] == [ "private" ], "unless a registry is given for them"
+    assert RSACipher(private_key=private_key, private_keys=private_keys).private_key is cipher.private_key, \
+           "and are reused from it"
+
+def test__benchmark():
+    results = benchmark(values=2, key_size=1024)
+    assert set(results) == { "with_registry", "without_registry" }, "with and without the registry"
+    assert all(rates["encrypt"] > 0 and rates["decrypt"] > 0 for rates in results.values()), "throughput measured"
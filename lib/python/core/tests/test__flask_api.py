@@ -1,4 +1,7 @@
+import gzip
 import uuid
+from datetime import datetime
+from types import SimpleNamespace
 import flask
 import flask_restful
 from flask_marshmallow import Marshmallow
@@ -8,11 +11,15 @@ import marshmallow
 
 from unittest import mock
 from apispec import APISpec
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, ColumnDefault, String, Integer, event, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy_utils import Timestamp
 from werkzeug.exceptions import NotFound, BadRequest, Conflict
+from itsdangerous import URLSafeSerializer
 
 from directorofme.flask import api
-from directorofme.authorization import orm
+from directorofme.authorization import orm, groups
+from directorofme.authorization.exceptions import PermissionDeniedError, MisconfiguredAuthError
 from directorofme.testing import comparable_links
 
 class FixtureSchema(marshmallow.Schema):
@@ -27,7 +34,7 @@ def flask_api(app):
 def ma(app):
     return Marshmallow(app)
 
-class Fixture(orm.PermissionedBase):
+class Fixture(orm.PermissionedBase, Timestamp):
     __tablename__ = "fixture"
     __table_args = {"sqlite_autoincrement": True}
     id = Column(Integer, primary_key=True)
@@ -64,6 +71,48 @@ def FixtureResource(bound_session_with_fixture, flask_api):
 
     return FixtureResource
 
+class BulkFixture(orm.Model):
+    __tablename__ = "bulk_fixture"
+    name = Column(String(), unique=True)
+    desc = Column(String())
+
+    @classmethod
+    def load_groups(cls):
+        return [ groups.root ]
+
+@pytest.fixture
+def BulkFixtureResource(bound_session, engine, flask_api):
+    @flask_api.resource("/bulk/<name>", endpoint="bulk")
+    class BulkFixtureResource(api.Resource):
+        pass
+
+    BulkFixture.__table__.create(engine)
+    try:
+        for name in ("bulk-1", "bulk-denied", "bulk-other"):
+            bound_session.add(BulkFixture(name=name))
+        bound_session.commit()
+        yield BulkFixtureResource
+    finally:
+        bound_session.rollback()
+        BulkFixture.__table__.drop(engine)
+
+class PermedFixture(orm.PermissionedModel):
+    __tablename__ = "permed_fixture"
+    id = Column(Integer, primary_key=True)
+    bar = Column(String())
+
+@pytest.fixture
+def permed_fixture(db, engine):
+    PermedFixture.__table__.create(engine)
+    try:
+        with PermedFixture.disable_permissions():
+            db.session.add(PermedFixture(id=1, bar="bar"))
+            db.session.commit()
+        yield PermedFixture
+    finally:
+        db.session.rollback()
+        PermedFixture.__table__.drop(engine)
+
 @pytest.fixture
 def FixtureAltResource(flask_api):
     @flask_api.resource("/test_id/<id>", endpoint="<id>")
@@ -116,6 +165,39 @@ def test__load_with_schema(request_context_with_session):
         assert get_json_mock.called, "json_ mock called"
         loaded.assert_called_with({ "bar": 1 })
 
+def test__load_with_schema_bulk(request_context_with_session):
+    loaded = mock.Mock()
+    decorated = api.load_with_schema(FixtureSchema, bulk=True)(loaded)
+    with mock.patch.object(flask.request, "get_json") as get_json_mock:
+        get_json_mock.return_value = [{ "foo": 1 }, { "foo": 2, "bar": 3 }]
+        decorated()
+        loaded.assert_called_with([{ "foo": 1 }, { "foo": 2, "bar": 3 }])
+
+        get_json_mock.return_value = { "foo": 1 }
+        decorated()
+        loaded.assert_called_with({ "foo": 1 })
+
+        get_json_mock.return_value = [{ "foo": 1 }, { "bar": 1 }]
+        with pytest.raises(BadRequest):
+            decorated()
+
+        flask.current_app.config["BULK_MAX_OBJECTS"] = 1
+        get_json_mock.return_value = [{ "foo": 1 }, { "foo": 2 }]
+        with pytest.raises(BadRequest):
+            decorated()
+        del flask.current_app.config["BULK_MAX_OBJECTS"]
+
+    decorated = api.load_with_schema(FixtureSchema, bulk_key="key", partial=True)(loaded)
+    with mock.patch.object(flask.request, "get_json") as get_json_mock:
+        get_json_mock.return_value = [{ "key": "a", "bar": 1 }, { "key": "b", "foo": 2 }]
+        decorated()
+        loaded.assert_called_with([("a", { "bar": 1 }), ("b", { "foo": 2 })])
+
+        for body in ({ "key": "a", "bar": 1 }, [{ "bar": 1 }]):
+            get_json_mock.return_value = body
+            with pytest.raises(BadRequest):
+                decorated()
+
 def test__dump_with_schema():
     @api.dump_with_schema(FixtureSchema)
     def dumped():
@@ -150,6 +232,233 @@ def test__dump_with_schema():
 
     assert return_tuple() == ({ "foo": 2 }, 404), "tuple works"
 
+    @api.dump_with_schema(FixtureSchema)
+    def bulk():
+        return api.BulkResults([
+            api.BulkResult(201, { "Location": "/1" }, { "foo": "1" }),
+            api.BulkResult(404, {}, { "message": "Could not find object" }),
+            api.BulkResult(204, {}, None),
+        ])
+
+    assert bulk() == ({ "results": [
+        { "status": 201, "headers": { "Location": "/1" }, "body": { "foo": 1 } },
+        { "status": 404, "headers": {}, "body": { "message": "Could not find object" } },
+        { "status": 204, "headers": {}, "body": None },
+    ]}, 207), "bulk results are dumped per-object, with a multi-status if only some succeeded"
+
+def test__BulkResults_status():
+    ok, not_found, denied = api.BulkResult(200, {}, None), api.BulkResult(404, {}, None), api.BulkResult(403, {}, None)
+    assert api.BulkResults([ ok, ok ]).status == 200, "all succeeded"
+    assert api.BulkResults([]).status == 200, "nothing failed"
+    assert api.BulkResults([ ok, not_found ]).status == 207, "some succeeded"
+    assert api.BulkResults([ not_found, not_found ]).status == 404, "all failed the same way"
+    assert api.BulkResults([ not_found, denied ]).status == 400, "all failed in different ways"
+
+def test__requested_fields(app):
+    assert api.requested_fields() is None, "no fields outside of a request"
+    with app.test_request_context("/"):
+        assert api.requested_fields() is None, "no fields if not requested"
+    with app.test_request_context("/?fields=foo,%20bar,"):
+        assert api.requested_fields() == ("foo", "bar"), "fields are split and stripped"
+
+def test__sparse_schema(app, ma):
+    schema, attributes = api.sparse_schema(FixtureSchema, None)
+    assert attributes is None, "all attributes needed if all fields requested"
+    assert schema.dump({ "foo": 1, "bar": 2 }).data == { "foo": 1, "bar": 2 }, "all fields dumped"
+
+    schema, attributes = api.sparse_schema(FixtureSchema, ("bar",))
+    assert attributes == { "bar" }, "only requested attributes needed"
+    assert schema.dump({ "foo": 1, "bar": 2 }).data == { "bar": 2 }, "only requested fields dumped"
+
+    class LinkedSchema(FixtureSchema):
+        baz = marshmallow.fields.Integer(attribute="bar")
+        _links = ma.Hyperlinks({ "self": ma.URLFor("test", id="<foo>") })
+
+    CollectionSchema = api.Spec(ma, title="test", version="1").paginated_collection_schema(LinkedSchema, "test")
+    schema, attributes = api.sparse_schema(CollectionSchema, ("baz", "_links"))
+    assert attributes == { "bar", "_links", "foo" }, "attributes include source attributes and link params"
+    assert set(schema.only) == { "page", "results_per_page", "_links", "collection" }, \
+           "collection metadata is not restricted"
+    assert set(schema.fields["collection"].schema.only) == { "baz", "_links" }, "collection fields are restricted"
+
+    with app.test_request_context("/"), pytest.raises(BadRequest):
+        api.sparse_schema(FixtureSchema, ("foo", "nope"))
+
+def test__dump_with_schema_fields(app):
+    @api.dump_with_schema(FixtureSchema)
+    def dumped():
+        return { "foo": "1", "bar": "2" }
+
+    with app.test_request_context("/?fields=bar"):
+        assert dumped() == { "bar": 2 }, "only requested fields are dumped"
+        assert flask.g.sparse_attributes == { "bar" }, "needed attributes stored for the request"
+
+    with app.test_request_context("/"):
+        assert dumped() == { "foo": 1, "bar": 2 }, "all fields dumped by default"
+        assert flask.g.sparse_attributes is None, "all attributes needed by default"
+
+    with app.test_request_context("/?fields=nope"), pytest.raises(BadRequest):
+        dumped()
+
+def test__dump_with_schema_etag(app):
+    obj = SimpleNamespace(id=1, foo=1, bar=2, updated=datetime(2018, 1, 1))
+
+    @api.dump_with_schema(FixtureSchema)
+    def dumped():
+        return obj
+
+    with app.test_request_context("/"):
+        body, status_code, headers = dumped()
+        assert body == { "foo": 1, "bar": 2 } and status_code == 200, "object dumped"
+        assert headers["ETag"].startswith('W/"'), "weak etag returned"
+        etag = headers["ETag"]
+
+    with app.test_request_context("/", headers={ "If-None-Match": etag }):
+        with pytest.raises(api.NotModified) as e:
+            dumped()
+        assert e.value.code == 304, "not modified when etag matches"
+        assert dict(e.value.get_headers())["ETag"] == etag, "etag returned with 304"
+
+    with app.test_request_context("/?fields=foo", headers={ "If-None-Match": etag }):
+        assert dumped()[2]["ETag"] != etag, "etag varies by fields"
+
+    obj.updated = datetime(2018, 1, 2)
+    with app.test_request_context("/", headers={ "If-None-Match": etag }):
+        assert dumped()[2]["ETag"] != etag, "etag changes when updated changes"
+
+    with app.test_request_context("/", method="POST"):
+        assert dumped() == { "foo": 1, "bar": 2 }, "no etag for writes"
+
+    del obj.updated
+    with app.test_request_context("/"):
+        assert dumped() == { "foo": 1, "bar": 2 }, "no etag without an updated timestamp"
+
+def test__dump_with_schema_etag_relationships(app):
+    class Related(SimpleNamespace):
+        etag_relationships = ("parent",)
+
+    parent = SimpleNamespace(id=2, updated=datetime(2018, 1, 1))
+    obj = Related(id=1, foo=1, bar=2, updated=datetime(2018, 1, 1), parent=parent)
+
+    @api.dump_with_schema(FixtureSchema)
+    def dumped():
+        return obj
+
+    with app.test_request_context("/"):
+        etag = dumped()[2]["ETag"]
+
+    parent.updated = datetime(2018, 1, 2)
+    with app.test_request_context("/", headers={ "If-None-Match": etag }):
+        assert dumped()[2]["ETag"] != etag, "etag changes when a related row changes"
+
+    del parent.updated
+    with app.test_request_context("/"):
+        assert dumped() == { "foo": 1, "bar": 2 }, "no etag without updated timestamps on related rows"
+
+    class MethodSchema(FixtureSchema):
+        baz = marshmallow.fields.Method("get_baz")
+
+        def get_baz(self, obj):
+            return 3
+
+    with app.test_request_context("/"):
+        dumped = api.dump_with_schema(MethodSchema)(lambda: SimpleNamespace(foo=1, updated=datetime(2018, 1, 1)))
+        assert dumped() == { "foo": 1, "baz": 3 }, "no etag for schemas with method fields"
+
+def test__first_or_abort_conditional(app, engine, db, FixtureResource):
+    class FixtureStringSchema(marshmallow.Schema):
+        foo = marshmallow.fields.String()
+        bar = marshmallow.fields.String()
+
+    @api.dump_with_schema(FixtureStringSchema)
+    def get(foo, Schema=FixtureStringSchema):
+        return api.first_or_abort(db.session.query(Fixture).filter(Fixture.foo == foo), Schema=Schema)
+
+    with app.test_request_context("/"):
+        etag = get("foo-1")[2]["ETag"]
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with app.test_request_context("/", headers={ "If-None-Match": etag }), pytest.raises(api.NotModified):
+            get("foo-1")
+        assert len(statements) == 1 and "bar" not in statements[0], "only updated is queried to check freshness"
+
+        with app.test_request_context("/", headers={ "If-None-Match": etag }):
+            assert get("foo-2")[0] == { "foo": "foo-2", "bar": "bar" }, "modified objects are loaded and dumped"
+
+        del statements[:]
+        with app.test_request_context("/", headers={ "If-None-Match": etag }), pytest.raises(api.NotModified):
+            get("foo-1", Schema=None)
+        assert len(statements) == 1 and "bar" in statements[0], "full row loaded without a Schema"
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+def test__cached_with_schema(app, db, FixtureResource):
+    calls = []
+
+    @api.cached_with_schema(FixtureSchema, Fixture, ttl=10)
+    def get(foo):
+        calls.append(foo)
+        return { "foo": foo }
+
+    with app.test_request_context("/"):
+        assert get(foo="1") == { "foo": 1 }, "dumped response returned"
+        assert get(foo="1") == ({ "foo": 1 }, 200, {}), "cached response returned"
+        assert calls == ["1"], "cached response not rebuilt"
+
+        get(foo="2")
+        assert calls == ["1", "2"], "view args are part of the key"
+
+    with app.test_request_context("/?page=2"):
+        get(foo="1")
+        assert calls == ["1", "2", "1"], "query args are part of the key"
+
+    with app.test_request_context("/"):
+        flask.g.api_version = "1"
+        get(foo="1")
+        assert calls == ["1", "2", "1", "1"], "api version is part of the key"
+
+    with app.test_request_context("/"), \
+            mock.patch.object(flask, "session", SimpleNamespace(groups=[orm.groups.admin])):
+        get(foo="1")
+        assert calls == ["1", "2", "1", "1", "1"], "groups are part of the key"
+
+    with app.test_request_context("/", method="POST"):
+        get(foo="1")
+        assert calls == ["1", "2", "1", "1", "1", "1"], "writes are never cached"
+
+    with app.app_context():
+        db.session.add(Fixture(foo="foo-3", bar="bar"))
+        db.session.commit()
+
+    with app.test_request_context("/"):
+        get(foo="1")
+        assert calls == ["1", "2", "1", "1", "1", "1", "1"], "cache invalidated by commits to the table"
+
+def test__stream_with_schema(app, db, FixtureResource):
+    class FixtureRowSchema(marshmallow.Schema):
+        foo = marshmallow.fields.String()
+
+    @api.stream_with_schema(FixtureRowSchema, yield_per=1)
+    def streamed():
+        return db.session.query(Fixture).order_by(Fixture.id)
+
+    with app.test_request_context():
+        response = streamed()
+        assert response.mimetype == "application/x-ndjson", "ndjson mimetype"
+        assert "Content-Encoding" not in response.headers, "not gzipped unless accepted"
+        assert response.get_data() == b'{"foo": "foo-1"}\n{"foo": "foo-2"}\n', "one object per line"
+
+    with app.test_request_context(headers={ "Accept-Encoding": "gzip, deflate" }):
+        response = streamed()
+        assert response.headers["Content-Encoding"] == "gzip", "gzipped when accepted"
+        assert gzip.decompress(response.get_data()) == b'{"foo": "foo-1"}\n{"foo": "foo-2"}\n', \
+               "gzipped body decompresses to the same lines"
+
 def test__load_query_params(request_context_with_session):
     loaded_mock = mock.MagicMock()
     decorated = api.load_query_params(FixtureSchema)(loaded_mock)
@@ -214,6 +523,55 @@ def test__with_cursor_params(request_context_with_session):
         decorated()
     assert not cursor_mock.called, "cursor mock not called"
 
+    flask.current_app.config["CURSOR_SECRET_KEY"] = "secret"
+    with mock.patch.object(flask.request, "values", { "cursor": api.dump_cursor(since=10, slug="a") }):
+        decorated()
+        cursor_mock.assert_called_with(cursor={ "since": 10, "slug": "a" }, results_per_page=50)
+
+    cursor_mock.reset_mock()
+    with pytest.raises(BadRequest), \
+            mock.patch.object(flask.request, "values", { "cursor": api.dump_cursor(), "since_id": str(uuid_) }):
+        decorated()
+    assert not cursor_mock.called, "cursor mock not called"
+
+def test__dump_and_load_cursor(request_context_with_session):
+    flask.current_app.config["CURSOR_SECRET_KEY"] = "secret"
+    token = api.dump_cursor(since=10, max=None, event_type_slug="slug")
+
+    assert "slug" not in token, "token is opaque"
+    assert api.load_cursor(token) == { "since": 10, "event_type_slug": "slug" }, "None values are dropped"
+
+    with pytest.raises(BadRequest):
+        api.load_cursor(token[:-1])
+
+    flask.current_app.config["CURSOR_SECRET_KEY"] = "another secret"
+    with pytest.raises(BadRequest):
+        api.load_cursor(token)
+
+    del flask.current_app.config["CURSOR_SECRET_KEY"]
+    flask.current_app.config["JWT_PUBLIC_KEY"] = "public key"
+    with pytest.raises(MisconfiguredAuthError):
+        api.dump_cursor(since=1)
+
+    flask.current_app.config["SECRET_KEY"] = "app secret"
+    assert api.load_cursor(api.dump_cursor(since=1)) == { "since": 1 }, "falls back to the app's secret key"
+
+def test__load_cursor_payloads(request_context_with_session):
+    flask.current_app.config["CURSOR_SECRET_KEY"] = "secret"
+    serializer = URLSafeSerializer("secret", salt="dom-cursor")
+
+    class CursorSchema(marshmallow.Schema):
+        since = marshmallow.fields.Integer()
+
+    for payload in ([ 1 ], "since", { "since": [ 1 ] }, { "since": { "a": 1 } }, { "since": True }):
+        with pytest.raises(BadRequest):
+            api.load_cursor(serializer.dumps(payload))
+
+    assert api.load_cursor(serializer.dumps({ "since": 2 }), CursorSchema) == { "since": 2 }, "schemas load cursors"
+    for payload in ({ "since": "x" }, { "since": [ 1 ] }):
+        with pytest.raises(BadRequest):
+            api.load_cursor(serializer.dumps(payload), CursorSchema)
+
 
 class TestResource:
     class DB:
@@ -240,6 +598,22 @@ class TestResource:
         assert collection_dict["next_page"] == 2, "if there are no more objects, next page is same as page"
         assert collection_dict["prev_page"] == 1, "when there is a previous page"
 
+        db.session.expunge_all()
+        collection_dict = FixtureResource.paged(db.session.query(Fixture), 1, 50, Fixture.id, fields={ "foo" })
+        obj = collection_dict["collection"][0]
+        assert obj.foo == "foo-1", "requested column loaded"
+        assert "bar" not in obj.__dict__, "unrequested column deferred"
+        assert "id" in obj.__dict__, "primary key always loaded"
+
+    def test__sparse(self, db, app, FixtureResource):
+        query = db.session.query(Fixture)
+        assert FixtureResource.sparse(query) is query, "nothing deferred outside of a request"
+        with app.test_request_context("/"):
+            flask.g.sparse_attributes = { "bar" }
+            db.session.expunge_all()
+            obj = FixtureResource.sparse(query).first()
+            assert "bar" in obj.__dict__ and "foo" not in obj.__dict__, "attributes for the request are used"
+
     def test__generic_insert(self, db, app, flask_api, FixtureResource, FixtureAltResource):
         with app.test_request_context():
             data = { "foo": "foo-0", "bar": "bar" }
@@ -297,6 +671,164 @@ class TestResource:
             with pytest.raises(BadRequest):
                 FixtureResource.generic_update(db, flask_api, Fixture, "foo", "foo-3", { "foo": "foo-2" })
 
+    def test__generic_update_returning(self, db, app, engine, flask_api, FixtureResource):
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            with app.test_request_context():
+                fixture = FixtureResource.generic_update(db, flask_api, Fixture, "foo", "foo-1", { "bar": "baz" })
+                assert fixture.bar == "baz" and fixture.updated is not None, "object is returned"
+                assert statements[0].startswith("UPDATE fixture SET"), "updated with a single statement"
+                assert not any(s.startswith("SELECT") for s in statements[:1]), "object is not loaded first"
+
+                statements[:] = []
+                assert fixture.bar == "baz", "object is usable after commit"
+                assert not statements, "returned values are not reloaded after commit"
+
+                with mock.patch.object(Fixture, "__slugified__", { "bar": "foo" }, create=True):
+                    fixture, status_code, headers = FixtureResource.generic_update(
+                        db, flask_api, Fixture, "foo", "foo-1", { "bar": "Slug Me" }
+                    )
+                assert fixture.foo == "slug-me", "slugified columns are set"
+                assert (status_code, headers) == (301, { "Location": "/test/slug-me" }), "slug change redirects"
+
+                with pytest.raises(NotFound):
+                    FixtureResource.generic_update(db, flask_api, Fixture, "foo", "foo-1", { "bar": "baz" })
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+    def test__generic_update_returning_permissions(self, db, app, flask_api, FixtureResource, permed_fixture):
+        criterion = lambda action: and_(action == "select")
+        with app.test_request_context(), mock.patch.object(PermedFixture, "permissions_criterion", criterion):
+            with pytest.raises(PermissionDeniedError):
+                FixtureResource.generic_update(db, flask_api, PermedFixture, "id", 1, { "bar": "baz" })
+
+            with pytest.raises(NotFound):
+                FixtureResource.generic_update(db, flask_api, PermedFixture, "id", 2, { "bar": "baz" })
+
+        with PermedFixture.disable_permissions():
+            assert db.session.query(PermedFixture).get(1).bar == "bar", "denied update is not written"
+
+    def test__is_simple_update(self):
+        assert api.Resource.is_simple_update(Fixture, { "foo": "foo", "bar": "bar" }), "columns are simple"
+        assert not api.Resource.is_simple_update(Fixture, {}), "empty updates are not"
+        assert not api.Resource.is_simple_update(Fixture, { "nope": 1 }), "non-columns are not"
+
+        listener = lambda *args: None
+        event.listen(Fixture.foo, "set", listener)
+        try:
+            assert not api.Resource.is_simple_update(Fixture, { "foo": "foo" }), "columns with listeners are not"
+            with mock.patch.object(Fixture, "__slugified__", { "foo": "bar" }, create=True):
+                assert api.Resource.is_simple_update(Fixture, { "foo": "foo" }), "unless they are slugified"
+        finally:
+            event.remove(Fixture.foo, "set", listener)
+
+        for identifier in ("before_update", "after_update"):
+            event.listen(Fixture, identifier, listener)
+            try:
+                assert not api.Resource.is_simple_update(Fixture, { "foo": "foo" }), \
+                       "models with {} listeners are not".format(identifier)
+            finally:
+                event.remove(Fixture, identifier, listener)
+        assert api.Resource.is_simple_update(Fixture, { "foo": "foo" }), "permissions and timestamp handlers are"
+
+    def test__bulk_insert(self, db, app, engine, flask_api, BulkFixtureResource):
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            with app.test_request_context():
+                results = BulkFixtureResource.bulk_insert(db, flask_api, BulkFixture, [
+                    { "name": "bulk-2" }, { "name": "bulk-3" }
+                ], "name")
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+        assert [ (r.status, r.headers, r.body.name) for r in results ] == [
+            (201, { "Location": "/bulk/bulk-2" }, "bulk-2"),
+            (201, { "Location": "/bulk/bulk-3" }, "bulk-3"),
+        ], "objects are created in order"
+        assert all(r.body.id is not None and r.body.created is not None for r in results), "defaults are set"
+        inserts = [ s for s in statements if s.startswith("INSERT") ]
+        assert len(inserts) == 1 and "), (" in inserts[0], "one multi-row INSERT"
+
+        with app.test_request_context(), pytest.raises(BadRequest):
+            BulkFixtureResource.bulk_insert(db, flask_api, BulkFixture, [
+                { "name": "bulk-4" }, { "name": "bulk-1" }
+            ], "name")
+        assert db.session.query(BulkFixture).filter(BulkFixture.name == "bulk-4").first() is None, \
+               "nothing is inserted if any insert fails"
+
+        with app.test_request_context(), pytest.raises(PermissionDeniedError), \
+                mock.patch.object(BulkFixture, "load_groups", return_value=[]):
+            BulkFixtureResource.bulk_insert(db, flask_api, BulkFixture, [{ "name": "bulk-4" }], "name")
+
+    def test__is_simple_insert(self, BulkFixtureResource):
+        objs = [ BulkFixture(name="bulk-2") ]
+        assert api.Resource.is_simple_insert(BulkFixture, objs), "permissions handlers are bypassed for"
+
+        listener = lambda mapper, connection, target: None
+        for identifier in ("before_insert", "after_insert"):
+            event.listen(BulkFixture, identifier, listener)
+            try:
+                assert not api.Resource.is_simple_insert(BulkFixture, objs), \
+                       "other {} listeners need the unit of work".format(identifier)
+            finally:
+                event.remove(BulkFixture, identifier, listener)
+
+        with mock.patch.object(BulkFixture.__table__.c.desc, "default", ColumnDefault(lambda ctx: "desc")):
+            assert not api.Resource.is_simple_insert(BulkFixture, objs), "context defaults need the unit of work"
+
+    def test__bulk_update(self, db, app, flask_api, BulkFixtureResource):
+        denied = db.session.query(BulkFixture).filter(BulkFixture.name == "bulk-denied").first()
+        check = BulkFixture.permissions_check
+        with app.test_request_context(), mock.patch.object(
+                BulkFixture, "permissions_check", lambda self, action: self is not denied and check(self, action)):
+            results = BulkFixtureResource.bulk_update(db, flask_api, BulkFixture, "name", [
+                ("bulk-1", { "desc": "updated" }),
+                ("bulk-missing", { "desc": "updated" }),
+                ("bulk-denied", { "desc": "updated" }),
+                ("bulk-other", { "name": "bulk-renamed", "desc": "renamed" }),
+            ])
+
+        assert [ r.status for r in results ] == [ 200, 404, 403, 301 ], "per object statuses"
+        assert results[0].body.desc == "updated", "object is updated"
+        assert results[3].headers == { "Location": "/bulk/bulk-renamed" }, "renames redirect"
+        assert db.session.query(BulkFixture).filter(BulkFixture.name == "bulk-denied").first().desc is None, \
+               "denied objects are not updated"
+
+    def test__bulk_delete(self, db, app, engine, flask_api, BulkFixtureResource):
+        denied = db.session.query(BulkFixture).filter(BulkFixture.name == "bulk-denied").first()
+        check = BulkFixture.permissions_check
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            with app.test_request_context(), mock.patch.object(
+                    BulkFixture, "permissions_check", lambda self, action: self is not denied and check(self, action)):
+                results = BulkFixtureResource.bulk_delete(db, BulkFixture, "name", [
+                    "bulk-1", "bulk-missing", "bulk-denied", "bulk-other"
+                ])
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+        assert [ r.status for r in results ] == [ 204, 404, 403, 204 ], "per object statuses"
+        assert len([ s for s in statements if s.startswith("DELETE") ]) == 1, "one DELETE"
+        assert [ o.name for o in db.session.query(BulkFixture) ] == [ "bulk-denied" ], "only allowed deletes"
+
+        with app.test_request_context(), pytest.raises(Conflict), \
+                mock.patch.object(db.session, "commit", side_effect=IntegrityError("DELETE", {}, None)):
+            BulkFixtureResource.bulk_delete(db, BulkFixture, "name", [ "bulk-denied" ])
+        assert [ o.name for o in db.session.query(BulkFixture) ] == [ "bulk-denied" ], \
+               "referenced objects are not deleted"
+
     def test__generic_delete(self, db, app, flask_api, FixtureResource):
         with app.test_request_context():
             obj, status_code = FixtureResource.generic_delete(db, Fixture, "foo", "foo-1")
@@ -321,12 +853,14 @@ class TestSpec:
 
         spec = api.Spec(ma, title="Test Spec", version="0.0.1")
         assert "Error" in spec.to_dict()["definitions"], "added to spec"
+        assert "BulkResults" in spec.to_dict()["definitions"], "added to spec"
         assert set(spec.to_dict()["parameters"].keys()) == \
-               {"api_version", "slug", "email", "id", "page", "results_per_page", "service"}, "parameters set by __init__"
+               {"api_version", "slug", "email", "id", "page", "results_per_page", "cursor", "fields", "service"}, \
+               "parameters set by __init__"
 
     def test__getattr__(self, ma):
         spec = api.Spec(ma, title="Test Spec", version="0.0.1")
-        assert spec.to_dict == spec.spec.to_dict, "to_dict passes through"
+        assert spec.add_parameter == spec.spec.add_parameter, "add_parameter passes through"
         with pytest.raises(AttributeError):
             spec.no_this_does_not_exist_on_spec
 
@@ -345,21 +879,27 @@ class TestSpec:
 
         spec = SubSpec(ma, title="Sub", version="0.0.1")
         spec.add_path("a path", fake="argument")
-
-        assert paths.pop() == [("a path",), { "fake": "argument" }], "subspec add path works"
+        spec.to_dict()
+        assert paths == [], "paths are not added without an app"
 
         assert app.extensions.get(spec.name) is None, "not installed yet"
         spec.test_current_app = True
         spec.init_app(app)
 
-        assert current_app_mock.called, "test for current app was executed"
-        assert paths == [[("a path",), { "fake": "argument" }]], "init_app calls paths"
+        assert paths == [], "init_app does not add paths"
         assert app.extensions[spec.name] is spec, "installed to app"
         assert spec.app is None, "app is still None"
 
-        paths = []
+        with app.app_context():
+            spec.to_dict()
+        assert current_app_mock.called, "test for current app was executed"
+        assert paths == [[("a path",), { "fake": "argument" }]], "paths added on first use"
+
+        paths.clear()
         spec.init_app(app)
-        assert paths == [], "init_app a second time does not re-call add paths"
+        with app.app_context():
+            spec.to_dict()
+        assert paths == [], "paths are only added once"
 
     def test__add_path(self, app, ma):
         @app.route("/test")
@@ -371,7 +911,42 @@ class TestSpec:
 
         spec.add_path(view=test)
         assert len(spec.paths) == 1, "appended to paths"
-        assert list(spec.to_dict()["paths"].keys()) == ["/test"], "path installed immediately"
+        assert list(spec.to_dict()["paths"].keys()) == ["/test"], "path installed on first use"
+
+        spec.add_path(view=test, operations={ "get": {} })
+        assert spec.to_dict()["paths"]["/test"] == { "get": {} }, "paths registered later are added"
+
+    def test__to_dict_cached(self, app, ma, tmpdir):
+        @app.route("/test")
+        def test(request):
+            pass
+
+        app.config["SPEC_CACHE_PATH"] = str(tmpdir)
+        spec = api.Spec(ma, app, title="A", version="0.0.1")
+        spec.add_path(view=test)
+
+        with mock.patch.object(spec.spec, "add_path", wraps=spec.spec.add_path) as add_path:
+            first = spec.to_dict()
+            assert spec.to_dict() is first, "spec is kept in memory"
+            assert add_path.call_count == 1, "paths are added once"
+
+        assert len(tmpdir.listdir()) == 1, "spec written to disk"
+        assert tmpdir.listdir()[0].basename == "spec-{}.json".format(spec.code_version(app)), "keyed by version"
+
+        del app.extensions[api.Spec.name]
+        spec = api.Spec(ma, title="A", version="0.0.1")
+        spec.add_path(view=test)
+        spec.init_app(app)
+        with mock.patch.object(spec.spec, "add_path") as add_path, app.app_context():
+            assert spec.to_dict()["paths"] == first["paths"], "spec read from disk"
+            assert not add_path.called, "spec is not built when cached"
+
+        app.config["CODE_VERSION"] = "abc"
+        assert spec.code_version(app) == "abc", "CODE_VERSION config is used as the version"
+
+        spec.add_path(view=test, operations={ "get": {} })
+        del app.config["CODE_VERSION"]
+        assert spec.code_version(app) != tmpdir.listdir()[0].purebasename[5:], "registered paths change the version"
 
 
     def test__real_add_path(self, app, ma, flask_api):
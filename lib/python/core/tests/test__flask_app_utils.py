@@ -1,8 +1,10 @@
 import os
+import json
 import pytest
 
 import flask
 import flask_restful
+from flask.sessions import SessionInterface, SecureCookieSession
 from werkzeug.contrib.fixers import ProxyFix
 
 from unittest import mock
@@ -34,6 +36,7 @@ def test__directorofme_app_basic(clear_env):
     app = directorofme_app("app", {
         "app": {
             "JWT_PUBLIC_KEY_FILE": "public_key",
+            "CURSOR_SECRET_KEY_FILE": "cursor_secret_key",
             "PUSH_REFRESH_TOKEN_FILE": "push_refresh_token",
             "PUSH_REFRESH_CSRF_TOKEN_FILE": "push_refresh_csrf_token",
         }
@@ -46,6 +49,7 @@ def test__directorofme_app_basic(clear_env):
     assert app.name == "app", "name set"
     assert app.config["PREFERRED_URL_SCHEME"] == "https", "empty app keys don't override defaults"
     assert app.config["JWT_PUBLIC_KEY"] == "public_key", "public key read"
+    assert app.config["CURSOR_SECRET_KEY"] == "cursor_secret_key", "cursor secret read"
     assert app.config["PUSH_REFRESH_TOKEN_FILE"] == "push_refresh_token", "push refresh token file read"
     assert app.config["PUSH_REFRESH_CSRF_TOKEN_FILE"] == "push_refresh_csrf_token", \
            "push refresh csrf token file read"
@@ -56,6 +60,7 @@ def test__directorofme_app_push_token_file_errors(clear_env):
     app = directorofme_app("app", {
         "app": {
             "JWT_PUBLIC_KEY_FILE": "public_key",
+            "CURSOR_SECRET_KEY_FILE": "cursor_secret_key",
             "PUSH_REFRESH_TOKEN_FILE": "push_refresh_token",
             "PUSH_REFRESH_CSRF_TOKEN_FILE": "push_refresh_csrf_token",
         }
@@ -109,7 +114,16 @@ def test__directorofme_app_keys(clear_env):
     open_mock.reset_mock()
 
     open_mock.not_found = None
-    app = directorofme_app("app", { "app": { "JWT_PUBLIC_KEY_FILE": "public_key" }})
+    with pytest.raises(MisconfiguredAuthError):
+        directorofme_app("app", { "app": { "JWT_PUBLIC_KEY_FILE": "public_key" } })
+
+    open_mock.not_found = "cursor_secret_key"
+    with pytest.raises(MisconfiguredAuthError):
+        directorofme_app("app", { "app": { "JWT_PUBLIC_KEY_FILE": "public_key",
+                                           "CURSOR_SECRET_KEY_FILE": "cursor_secret_key" } })
+
+    open_mock.not_found = None
+    app = directorofme_app("app", { "app": { "JWT_PUBLIC_KEY_FILE": "public_key", "SECRET_KEY": "secret" }})
     assert app.config["JWT_PUBLIC_KEY"] == "public_key", "public key set correctly for non-auth server"
     open_mock.reset_mock()
 
@@ -123,7 +137,8 @@ def test__directorofme_app_keys(clear_env):
         "app": {
             "JWT_PUBLIC_KEY_FILE": "public_key",
             "IS_AUTH_SERVER": True,
-            "JWT_PRIVATE_KEY_FILE": "private_key"
+            "JWT_PRIVATE_KEY_FILE": "private_key",
+            "CURSOR_SECRET_KEY_FILE": "cursor_secret_key"
         }
     }
 
@@ -255,3 +270,80 @@ class TestVersionedApi:
         with app.test_client() as client:
             resp = client.get("api/2/test/error")
             assert resp.status_code == 403, "Permission denied returns a 401"
+
+    def test__batch(self, app, v_api):
+        @v_api.resource("/things/<slug>", endpoint="thing")
+        class Thing(flask_restful.Resource):
+            def get(self, slug):
+                return { "slug": slug, "version": flask.g.api_version, "q": flask.request.args.get("q") }
+
+            def put(self, slug):
+                flask.g.leak = True
+                return { "slug": slug, "data": flask.request.get_json() }, 201, { "Set-Cookie": "a=b" }
+
+            def delete(self, slug):
+                assert "leak" not in flask.g, "g is not shared between sub-requests"
+                raise PermissionDeniedError()
+
+        class CountingSessionInterface(SessionInterface):
+            opened = 0
+            def open_session(self, app, request):
+                CountingSessionInterface.opened += 1
+                return SecureCookieSession()
+
+            def save_session(self, *args):
+                pass
+
+        app.session_interface = CountingSessionInterface()
+        requests = [
+            { "url": "/api/2/test/things/a", "query": { "q": "1" } },
+            { "method": "PUT", "url": "/api/2/test/things/${0.body.slug}-b", "body": { "got": "${0.body}" } },
+            { "method": "DELETE", "url": "/api/2/test/things/c" },
+            { "url": "/api/2/test/things/d" },
+        ]
+        with app.test_client() as client:
+            resp = client.post("/api/2/test/batch", data=json.dumps({ "requests": requests }),
+                               content_type="application/json")
+            assert resp.status_code == 200, "batch returns a 200"
+            assert CountingSessionInterface.opened == 1, "session opened once"
+            assert resp.headers.getlist("Set-Cookie") == ["a=b"], "cookies set by sub-requests are returned"
+
+            responses = dict_from_response(resp)["responses"]
+            assert [r["status"] for r in responses] == [200, 201, 403], "sub-requests run in order until an error"
+            assert responses[0]["body"] == { "slug": "a", "version": "2", "q": "1" }, "get sub-request dispatched"
+            assert responses[1]["body"] == { "slug": "a-b", "data": { "got": responses[0]["body"] } }, \
+                   "references to earlier results are resolved"
+            assert "message" in responses[2]["body"], "errors are returned"
+
+            resp = client.post("/api/2/test/batch", data=json.dumps({ "requests": requests, "stop_on_error": False }),
+                               content_type="application/json")
+            assert [r["status"] for r in dict_from_response(resp)["responses"]] == [200, 201, 403, 200], \
+                   "all sub-requests run if not stopping on error"
+
+            for sub_request in ({ "url": "/api/2/test/batch", "method": "POST" },
+                                { "url": "/api/2/test/things/${5.body.slug}" }):
+                resp = client.post("/api/2/test/batch", data=json.dumps({ "requests": [sub_request] }),
+                                   content_type="application/json")
+                assert resp.status_code == 400 or dict_from_response(resp)["responses"][0]["status"] == 400, \
+                       "nested batches and invalid references are rejected"
+
+            hooks = mock.MagicMock(return_value=None)
+            app.before_request(hooks)
+
+            @app.route("/api/2/test/broken")
+            def broken():
+                raise RuntimeError("broken")
+
+            resp = client.post("/api/2/test/batch", content_type="application/json", data=json.dumps({
+                "requests": [ { "url": "/api/2/test/broken" }, { "url": "/api/2/test/things/e" } ],
+                "stop_on_error": False,
+            }))
+            assert resp.status_code == 200, "unhandled errors don't fail the batch"
+            assert [r["status"] for r in dict_from_response(resp)["responses"]] == [500, 200], \
+                   "but the sub-request raising them"
+            assert hooks.call_count == 1, "request hooks run once, for the batch"
+
+            app.config["BATCH_MAX_REQUESTS"] = 2
+            resp = client.post("/api/2/test/batch", data=json.dumps({ "requests": requests }),
+                               content_type="application/json")
+            assert resp.status_code == 400, "too many requests returns a 400"
@@ -0,0 +1,123 @@
+import os
+import time
+import pytest
+
+from unittest import mock
+from sqlalchemy import Table, Column, Integer, String, ForeignKey
+from sqlalchemy.orm import relationship
+
+from directorofme.flask import cache
+from directorofme.authorization import orm
+
+cached_fixture_tags = Table(
+    "cached_fixture_tags",
+    orm.PermissionedBase.metadata,
+    Column("fixture_id", Integer, ForeignKey("cached_fixture.id")),
+    Column("tag_id", Integer, ForeignKey("cached_tag.id")))
+
+class CachedTag(orm.PermissionedBase):
+    __tablename__ = "cached_tag"
+    id = Column(Integer, primary_key=True)
+
+class CachedFixture(orm.PermissionedBase):
+    __tablename__ = "cached_fixture"
+    id = Column(Integer, primary_key=True)
+    name = Column(String())
+    tags = relationship(CachedTag, secondary=cached_fixture_tags)
+
+@pytest.fixture
+def session_with_fixture(engine, bound_session):
+    tables = [ CachedFixture.__table__, CachedTag.__table__, cached_fixture_tags ]
+    for table in tables:
+        table.create(engine)
+    cache.watch_tables("cached_fixture", "cached_fixture_tags")
+    try:
+        yield bound_session
+    finally:
+        for table in reversed(tables):
+            table.drop(engine)
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmpdir):
+    if request.param == "memory":
+        return cache.MemoryCache(max_size=2)
+    return cache.SQLiteCache(os.path.join(str(tmpdir), "cache.db"), max_size=2)
+
+def test__backend(backend):
+    assert backend.get("a") is None, "missing key returns None"
+
+    backend.set("a", [1, { "b": "c" }])
+    assert backend.get("a") == [1, { "b": "c" }], "set value returned"
+
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+    assert backend.get("b") is None, "least recently used value evicted"
+    assert backend.get("a") == [1, { "b": "c" }] and backend.get("c") == 3, "recently used values kept"
+
+    now = time.time()
+    with mock.patch("time.time", return_value=now):
+        backend.set("d", 4, ttl=10)
+    with mock.patch("time.time", return_value=now + 5):
+        assert backend.get("d") == 4, "value returned before ttl"
+    with mock.patch("time.time", return_value=now + 11):
+        assert backend.get("d") is None, "value expired after ttl"
+
+    assert backend.incr("counter") == 1, "counters start at 1"
+    assert backend.incr("counter") == 2, "counters are incremented"
+    for key in ("e", "f", "g"):
+        backend.set(key, key, ttl=10)
+    assert backend.get("counter") == 2, "counters are never evicted"
+
+def test__sqlite_cache_is_shared(tmpdir):
+    path = os.path.join(str(tmpdir), "cache.db")
+    cache.SQLiteCache(path).set("a", 1)
+    assert cache.SQLiteCache(path).get("a") == 1, "values are shared between instances on the same file"
+
+def test__cache_backend(app, tmpdir):
+    backend = cache.cache_backend(app)
+    assert isinstance(backend, cache.MemoryCache), "memory cache by default"
+    assert cache.cache_backend(app) is backend, "backend is reused"
+
+    del app.extensions["dom-cache"]
+    with pytest.raises(ValueError):
+        cache.cache_backend(app, processes=2)
+
+    app.config["CACHE_PATH"] = os.path.join(str(tmpdir), "cache.db")
+    with app.app_context():
+        assert isinstance(cache.cache_backend(processes=2), cache.SQLiteCache), \
+               "sqlite cache if a path is configured"
+
+def test__invalidation(app, session_with_fixture):
+    with app.app_context():
+        assert cache.generations({ "cached_fixture" }) == [0], "generation starts at 0"
+
+        session_with_fixture.add(CachedFixture(name="a"))
+        session_with_fixture.commit()
+        assert cache.generations({ "cached_fixture" }) == [1], "insert bumps generation on commit"
+
+        session_with_fixture.query(CachedFixture).first().name = "b"
+        session_with_fixture.flush()
+        assert cache.generations({ "cached_fixture" }) == [1], "flush does not bump generation"
+        session_with_fixture.rollback()
+        session_with_fixture.commit()
+        assert cache.generations({ "cached_fixture" }) == [1], "rolled back writes do not bump generation"
+
+        session_with_fixture.query(CachedFixture).delete()
+        session_with_fixture.commit()
+        assert cache.generations({ "cached_fixture" }) == [2], "bulk writes bump generation"
+
+def test__invalidation_of_association_tables(app, session_with_fixture):
+    with app.app_context():
+        fixture = CachedFixture(name="a")
+        session_with_fixture.add(fixture)
+        session_with_fixture.commit()
+        assert cache.generations({ "cached_fixture_tags" }) == [0], "untouched association tables not bumped"
+
+        fixture.tags.append(CachedTag())
+        session_with_fixture.commit()
+        assert cache.generations({ "cached_fixture_tags" }) == [1], "writes through relationships bump them"
+
+        session_with_fixture.delete(fixture)
+        session_with_fixture.commit()
+        assert cache.generations({ "cached_fixture_tags" }) == [2], "as do deletes of their rows"
@@ -0,0 +1,64 @@
+import tracemalloc
+
+import pytest
+
+from directorofme.flask import memory, versioned_api
+from directorofme.testing import trace_memory, dict_from_response
+from directorofme.authorization import groups
+
+leaked = []
+
+@pytest.fixture
+def leaky_app(app):
+    del leaked[:]
+
+    @app.route("/leak")
+    def leak():
+        leaked.append(bytearray(100000))
+        return "ok"
+
+    @app.route("/temporary")
+    def temporary():
+        return str(len(bytearray(100000)))
+
+    return app
+
+def test__trace_memory(leaky_app):
+    with trace_memory(leaky_app, top=3) as stats:
+        assert tracemalloc.is_tracing(), "tracing while in block"
+        with leaky_app.test_client() as client:
+            for _ in range(3):
+                assert client.get("/leak").get_data() == b"ok", "responses are returned"
+            client.get("/temporary")
+            client.get("/nope")
+
+    assert not tracemalloc.is_tracing(), "tracing stopped after the block"
+    assert not isinstance(leaky_app.wsgi_app, memory.MemoryTracer), "tracer removed after the block"
+
+    result = stats.to_dict()
+    assert set(result) == { "leak", "temporary", "-" }, "stats kept by endpoint"
+    assert result["leak"]["count"] == 3, "requests counted"
+    assert result["leak"]["retained_bytes"] >= 300000, "retained memory recorded"
+    assert result["temporary"]["retained_bytes"] < 100000, "released memory isn't retained"
+    assert result["leak"]["max_peak_bytes"] >= 100000, "peak recorded"
+
+    site, size = result["leak"]["top_sites"][0]
+    assert "test__flask_memory.py:" in site and size >= 300000, "allocating line reported"
+
+def test__memory_endpoint(leaky_app, groups_session):
+    groups_session.groups = [ groups.admin ]
+    leaky_app.register_blueprint(versioned_api("test").blueprint)
+    with leaky_app.test_client() as client:
+        response = client.get("/api/-/test/memory")
+        assert dict_from_response(response)["tracing"] is False, "not traced by default"
+
+    leaky_app.config["MEMORY_TRACE"] = True
+    memory.init_app(leaky_app)
+    try:
+        with leaky_app.test_client() as client:
+            client.get("/leak")
+            response = client.get("/api/-/test/memory")
+            assert response.status_code == 200, "stats returned"
+            assert dict_from_response(response)["endpoints"]["leak"]["count"] == 1, "requests traced"
+    finally:
+        tracemalloc.stop()
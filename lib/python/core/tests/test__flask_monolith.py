@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+
+import flask
+import pytest
+
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from directorofme.client import DOM
+from directorofme.aioclient import AsyncDOM, run
+from directorofme.transport import default_transport
+from directorofme.flask import monolith
+
+BASE_URL = "https://test.directorof.me"
+
+def api_app(name):
+    app = flask.Flask(name)
+    app.config["SERVER_NAME"] = "test.directorof.me"
+    blueprint = flask.Blueprint(name, name, url_prefix="/api/<api_version>/{}".format(name))
+    app.register_blueprint(blueprint)
+    return app
+
+@pytest.fixture
+def apps():
+    auth, event, slack = api_app("auth"), api_app("event"), flask.Flask("slack")
+    slack.config["SERVER_NAME"] = "test.directorof.me"
+
+    @auth.route("/api/<api_version>/auth/session", methods=[ "PUT" ])
+    def session(api_version):
+        response = flask.jsonify({ "refreshed": True })
+        response.set_cookie("access_token_cookie", "refreshed", secure=True)
+        return response
+
+    @auth.route("/api/<api_version>/auth/whoami", methods=[ "GET", "POST" ])
+    def whoami(api_version):
+        return flask.jsonify({ "token": flask.request.cookies.get("access_token_cookie"), "url": flask.request.url,
+                               "body": flask.request.get_json(silent=True) })
+
+    @event.route("/api/<api_version>/event/events/")
+    def events(api_version):
+        client = DOM.from_request(flask.request)
+        return flask.jsonify({ "whoami": client.get("auth/whoami"), "app": flask.current_app.name })
+
+    @slack.route("/app/slack/hello")
+    def hello():
+        return "hello"
+
+    upstreams, internal_host = default_transport.upstreams, default_transport.internal_host
+    yield auth, event, slack
+    default_transport.configure(upstreams=upstreams, internal_host=internal_host)
+
+def test__api_names(apps):
+    assert monolith.api_names(apps[0]) == [ "auth" ], "versioned apis found"
+    assert monolith.api_names(apps[2]) == [], "apps without apis"
+
+def test__Monolith(apps):
+    auth, event, slack = apps
+    app = monolith.Monolith([ auth, event, slack ])
+    assert app.apis == { "auth": auth, "event": event }, "apps by api name"
+    assert default_transport.upstreams["auth"] is auth, "apis called in process"
+
+    client = Client(app, BaseResponse)
+    client.set_cookie("test.directorof.me", "access_token_cookie", "token")
+    response = client.get("/api/-/event/events/", base_url=BASE_URL)
+    assert response.status_code == 200, "dispatched by api name"
+    assert json.loads(response.get_data(as_text=True)) == { "app": "event", "whoami": {
+        "token": "token", "url": "https://test.directorof.me/api/-/auth/whoami", "body": None } }, \
+           "clients call other apps in process, with their cookies and url"
+
+    assert client.get("/app/slack/hello", base_url=BASE_URL).get_data() == b"hello", \
+           "other urls dispatched by url rule"
+    assert client.get("/nope", base_url=BASE_URL).status_code == 404, "unknown urls not found"
+
+def test__Transport_dispatch(apps):
+    auth, event, slack = apps
+    monolith.Monolith([ auth, event ])
+    dispatched = default_transport.stats["dispatched"]
+
+    dom = DOM("test.directorof.me", access_token="token")
+    assert dom.post("auth/whoami", { "a": 1 })["body"] == { "a": 1 }, "bodies sent"
+    dom.put("auth/session")
+    assert dom.cookies.get("access_token_cookie", domain="test.directorof.me") == "refreshed", "cookies set by in process apps"
+    assert default_transport.stats["dispatched"] == dispatched + 2, "dispatches counted"
+
+    async_dom = AsyncDOM("test.directorof.me", access_token="token")
+    assert run(async_dom.get("auth/whoami"))["token"] == "token", "async clients dispatch in process too"
+    run(async_dom.put("auth/session"))
+    assert async_dom.cookies.get("access_token_cookie", domain="test.directorof.me") == "refreshed", "cookies set for async clients"
+
+def test__package_environ():
+    environ = { "DIRECTOROFME_EVENT__API_NAME": "event", "DIRECTOROFME_AUTH__API_NAME": "auth", "HOME": "/" }
+    assert monolith.package_environ("directorofme_event", environ) == { "API_NAME": "event" }, \
+           "only the variables of the package, unprefixed"
+
+def test__from_packages(apps, tmpdir, monkeypatch):
+    tmpdir.join("monolith_test_api.py").write("\n".join([
+        "import os, flask",
+        "app = flask.Flask(__name__)",
+        "app.config['API_NAME'] = os.environ['API_NAME']",
+        "name = os.environ['API_NAME']",
+        "app.register_blueprint(flask.Blueprint(name, __name__, url_prefix='/api/<api_version>/' + name))",
+    ]))
+    monkeypatch.syspath_prepend(str(tmpdir))
+    monkeypatch.delitem(sys.modules, "monolith_test_api", raising=False)
+    monkeypatch.delenv("API_NAME", raising=False)
+
+    app = monolith.Monolith.from_packages([ "monolith_test_api" ], { "MONOLITH_TEST_API__API_NAME": "thing" })
+    assert app.apis["thing"].config["API_NAME"] == "thing", "packages imported with their own environment"
+    assert "API_NAME" not in os.environ, "and the environment restored"
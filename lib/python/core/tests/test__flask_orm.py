@@ -2,6 +2,7 @@ import pytest
 import flask
 
 from unittest import mock
+from sqlalchemy.pool import QueuePool
 
 from directorofme.authorization import groups
 from directorofme.flask import Model, DOMSQLAlchemy
@@ -24,3 +25,30 @@ def test__DOMSQLAlchemy():
 
     with pytest.raises(ValueError):
         DOMSQLAlchemy()
+
+def test__DOMSQLAlchemy_pool(tmpdir):
+    test_app = flask.Flask("test")
+    test_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///{}".format(tmpdir.join("test.db"))
+    test_app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    test_app.config["SQLALCHEMY_POOL_SIZE"] = 2
+    test_app.config["WARMUP_CONNECTIONS"] = 2
+    db = DOMSQLAlchemy(test_app)
+
+    # sqlite file databases aren't pooled by default
+    with test_app.app_context(), mock.patch.object(db, "apply_driver_hacks",
+                                                   lambda app, info, options: options.update(poolclass=QueuePool)):
+        engine = db.get_engine()
+        assert engine.pool._pre_ping, "connections pre-pinged"
+        assert engine.pool.size() == 2, "pool sized from config"
+
+        db.warmup()
+        assert engine.pool.checkedin() == 2, "warmup opens connections"
+
+        with mock.patch("os.getpid", return_value=-1):
+            assert engine.execute("SELECT 1").scalar() == 1, "connections from another process are replaced"
+        assert engine.pool.checkedin() == 2, "replaced connection returned to the pool"
+
+        pool = engine.pool
+        db.after_fork()
+        assert engine.pool is not pool and engine.pool.checkedin() == 0, "pool re-created after fork"
+        assert db._parent_pools == [pool], "parent pool isn't disposed"
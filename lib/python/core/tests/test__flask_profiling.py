@@ -0,0 +1,106 @@
+import flask
+import pytest
+
+from directorofme.flask import profiling, versioned_api
+from directorofme.testing import dict_from_response
+from directorofme.authorization import groups
+
+@pytest.fixture
+def profiled_app(app, tmpdir, groups_session):
+    app.config.update(PROFILE_PATH=str(tmpdir), PROFILE_MAX_PROFILES=2)
+    profiling.init_app(app)
+
+    v_api = versioned_api("test")
+    app.register_blueprint(v_api.blueprint)
+
+    @app.route("/slow")
+    def slow():
+        return str(sum(range(1000)))
+
+    return app
+
+def test__profile_request(profiled_app, groups_session):
+    with profiled_app.test_client() as client:
+        response = client.get("/slow")
+        assert response.status_code == 200, "requests run without profiling"
+        assert profiling.PROFILE_ID_HEADER not in response.headers, "not profiled by default"
+
+        response = client.get("/slow", headers={ profiling.PROFILE_HEADER: "1" })
+        assert response.status_code == 200, "non-admins are served"
+        assert profiling.PROFILE_ID_HEADER not in response.headers, "but not profiled"
+        assert profiling.list_profiles(profiled_app) == [], "and nothing is stored"
+
+        groups_session.groups = [ groups.admin ]
+        response = client.get("/slow", headers={ profiling.PROFILE_HEADER: "1" })
+        assert response.status_code == 200, "profiled request runs"
+        profile_id = response.headers[profiling.PROFILE_ID_HEADER]
+
+        profile = profiling.load_profile(profile_id, app=profiled_app)
+        assert profile["endpoint"] == "slow" and profile["status"] == 200, "request metadata stored"
+        assert profile["functions"], "profiled functions stored"
+
+        response = client.get("/slow?_profile")
+        assert profiling.PROFILE_ID_HEADER in response.headers, "query parameter also triggers a profile"
+        client.get("/slow?_profile")
+        assert len(profiling.list_profiles(profiled_app)) == 2, "old profiles are pruned"
+        assert profile_id not in [p["id"] for p in profiling.list_profiles(profiled_app)], "oldest pruned"
+
+        with pytest.raises(FileNotFoundError):
+            profiling.load_profile("../" + "a" * 29, app=profiled_app)
+
+def test__nested_requests(profiled_app, groups_session, tmpdir):
+    inner = flask.Flask("inner")
+    inner.config.update(PROFILE_PATH=str(tmpdir.join("inner")))
+    inner.session_interface = profiled_app.session_interface
+    profiling.init_app(inner)
+
+    @inner.route("/inner")
+    def inner_view():
+        return str(sum(range(1000)))
+
+    @profiled_app.route("/outer")
+    def outer():
+        # an app called in process, as in a monolith
+        with inner.test_client() as client:
+            response = client.get("/inner", headers={ profiling.PROFILE_HEADER: "1" })
+        return response.headers.get(profiling.PROFILE_ID_HEADER, "")
+
+    groups_session.groups = [ groups.admin ]
+    with profiled_app.test_client() as client:
+        response = client.get("/outer", headers={ profiling.PROFILE_HEADER: "1" })
+        assert response.get_data() == b"", "requests within a profiled request are not profiled apart"
+        profile_id = response.headers[profiling.PROFILE_ID_HEADER]
+        assert profiling.load_profile(profile_id, app=profiled_app)["endpoint"] == "outer", \
+               "the outer profile is kept"
+    assert profiling.list_profiles(inner) == [], "nothing stored for the inner app"
+
+def test__profile_directory(app, tmpdir):
+    app.instance_path = str(tmpdir.join("instance"))
+    assert profiling.profile_directory(app) == str(tmpdir.join("instance", "profiles")), "in the instance path"
+
+    app.config["PROFILE_PATH"] = str(tmpdir)
+    assert profiling.profile_directory(app) == str(tmpdir), "unless configured"
+
+def test__profile_directory_created(profiled_app, groups_session, tmpdir):
+    profiled_app.config["PROFILE_PATH"] = str(tmpdir.join("profiles"))
+    groups_session.groups = [ groups.admin ]
+    with profiled_app.test_client() as client:
+        client.get("/slow", headers={ profiling.PROFILE_HEADER: "1" })
+    assert tmpdir.join("profiles").stat().mode & 0o777 == 0o700, "profiles are private to the app"
+
+def test__profile_endpoints(profiled_app, groups_session):
+    with profiled_app.test_client() as client:
+        assert client.get("/api/-/test/profiles").status_code == 403, "admin only"
+
+        groups_session.groups = [ groups.admin ]
+        profile_id = client.get("/slow", headers={ profiling.PROFILE_HEADER: "1" }).headers["X-Profile-Id"]
+
+        response = client.get("/api/-/test/profiles")
+        assert response.status_code == 200, "admins can list profiles"
+        assert [p["id"] for p in dict_from_response(response)["profiles"]] == [profile_id], "profiles listed"
+
+        response = client.get("/api/-/test/profiles/{}?limit=3".format(profile_id))
+        assert response.status_code == 200, "admins can read profiles"
+        assert len(dict_from_response(response)["functions"]) <= 3, "functions limited"
+
+        assert client.get("/api/-/test/profiles/{}".format("a" * 32)).status_code == 404, "missing profile"
@@ -0,0 +1,79 @@
+import pytest
+
+from sqlalchemy import event
+
+from directorofme.flask import queries
+
+@pytest.fixture
+def counted_app(app, engine):
+    app.config.update(QUERY_BUDGET=3, QUERY_REPEAT_LIMIT=2)
+    queries.init_app(app)
+    queries.instrument(engine)
+
+    @app.route("/few")
+    def few():
+        engine.execute("SELECT 1")
+        return "ok"
+
+    @app.route("/many")
+    def many():
+        for i in range(4):
+            engine.execute("SELECT {}".format(i))
+        return "ok"
+
+    @app.route("/budgeted")
+    @queries.query_budget(5, repeat_limit=5)
+    def budgeted():
+        return many()
+
+    return app
+
+def test__statement_shape():
+    assert queries.statement_shape("SELECT a\n  FROM b WHERE c = ?") == "SELECT a FROM b WHERE c = ?", \
+           "whitespace collapsed"
+    assert queries.statement_shape("SELECT a FROM b WHERE c IN (?, ?, ?)") == \
+           queries.statement_shape("SELECT a FROM b WHERE c IN (?)"), "in lists have one shape"
+    assert queries.statement_shape("SELECT a FROM b WHERE c IN (%(c_1)s, %(c_2)s) LIMIT 10") == \
+           "SELECT a FROM b WHERE c IN (?) LIMIT ?", "named placeholders and numbers normalized"
+    assert queries.statement_shape("SELECT a FROM b") != queries.statement_shape("SELECT a FROM c"), \
+           "statements differ"
+
+def test__query_log():
+    log = queries.QueryLog()
+    for i in range(3):
+        log.add("SELECT * FROM a WHERE id = {}".format(i), 0.001)
+    log.add("SELECT * FROM b", 0.001)
+
+    assert log.count == 4 and log.seconds == pytest.approx(0.004), "queries and time counted"
+    assert log.problems() == [], "no budget, no problems"
+    assert log.problems(max_queries=4, repeat_limit=3) == [], "within budget"
+    assert len(log.problems(max_queries=3)) == 1, "too many queries"
+    assert log.problems(repeat_limit=2) == ["statement run 3 times (possible N+1): SELECT * FROM a WHERE id = ?"], \
+           "repeated shapes flagged"
+
+def test__instrument(engine):
+    queries.instrument(engine)
+    queries.instrument(engine)
+    assert event.contains(engine, "after_cursor_execute", queries._after_execute), "engine instrumented"
+
+    engine.execute("SELECT 1")
+    assert queries.current_queries() is None, "nothing counted outside of a request"
+
+def test__budgets(counted_app):
+    with counted_app.test_client() as client:
+        with queries.enforce_budgets() as violations:
+            client.get("/few")
+            assert queries.current_queries().count == 1, "queries counted per request"
+            client.get("/budgeted")
+            assert queries.current_queries().count == 4, "queries counted per request"
+            assert violations == [], "within budget"
+
+        with pytest.raises(queries.QueryBudgetExceeded) as excinfo:
+            with queries.enforce_budgets():
+                assert client.get("/many").status_code == 200, "budgets don't change the response"
+
+    assert "4 queries" in str(excinfo.value) and "budget is 3" in str(excinfo.value), "budget exceeded"
+    assert "possible N+1" in str(excinfo.value), "repeated statements flagged"
+
+    with counted_app.test_client() as client:
+        assert client.get("/many").status_code == 200, "budgets are only logged when not enforced"
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+import flask
+
+from unittest import mock
+from sqlalchemy import Column, String
+
+from directorofme.authorization import groups
+from directorofme.flask import DOMSQLAlchemy, replicas
+
+db = DOMSQLAlchemy(scope_name="replicas")
+
+class Named(db.Model):
+    __tablename__ = "named"
+    name = Column(String())
+
+    @classmethod
+    def load_groups(cls):
+        return [ groups.root ]
+
+    @classmethod
+    def default_perms(cls, perm_name):
+        return ( groups.root.name, )
+
+@pytest.fixture
+def replicated_app(tmpdir):
+    app = flask.Flask("replicas")
+    app.config.update(SQLALCHEMY_DATABASE_URI="sqlite:///{}".format(tmpdir.join("primary.db")),
+                      SQLALCHEMY_REPLICA_URIS=[ "sqlite:///{}".format(tmpdir.join("replica.db")) ],
+                      SQLALCHEMY_TRACK_MODIFICATIONS=False, REPLICA_PIN_SECONDS=5)
+    db.init_app(app)
+
+    with app.app_context():
+        for bind, name in ((None, "primary"), ("replica-0", "replica")):
+            engine = db.get_engine(app, bind=bind)
+            Named.__table__.create(engine)
+            engine.execute(Named.__table__.insert().values(name=name))
+
+    @app.route("/read")
+    @replicas.replica_reads
+    def read():
+        return ",".join(n.name for n in Named.query.order_by(Named.name))
+
+    @app.route("/read-primary")
+    def read_primary():
+        return read.__wrapped__()
+
+    @app.route("/write")
+    @replicas.replica_reads
+    def write():
+        db.session.add(Named(name="written"))
+        db.session.commit()
+        return read.__wrapped__()
+
+    return app
+
+def test__replica_binds(replicated_app):
+    assert replicas.replica_binds(replicated_app) == [ "replica-0" ], "replicas added as binds"
+    assert replicas.replica_binds(flask.Flask("other")) == [], "no replicas by default"
+
+def test__routing(replicated_app):
+    with replicated_app.test_client() as client:
+        assert client.get("/read").get_data() == b"replica", "opted in views read from a replica"
+        assert client.get("/read-primary").get_data() == b"primary", "other views read from the primary"
+
+        response = client.get("/write")
+        assert response.get_data() == b"primary,written", "reads after a write go to the primary"
+        assert replicas.PIN_COOKIE in response.headers["Set-Cookie"], "writers are pinned"
+
+        assert client.get("/read").get_data() == b"primary,written", "pinned clients read from the primary"
+        with mock.patch("time.time", return_value=time.time() + 10):
+            assert client.get("/read").get_data() == b"replica", "pins expire"
+
+    with replicated_app.test_client() as client:
+        assert "Set-Cookie" not in client.get("/read").headers, "readers aren't pinned"
@@ -0,0 +1,89 @@
+import pytest
+
+from unittest import mock
+
+from directorofme.flask import timing, queries
+from directorofme.testing import dict_from_response
+from directorofme.authorization import groups
+
+@pytest.fixture
+def timed_app(app, engine):
+    app.config["TIMING_SAMPLE_RATE"] = 1
+    timing.init_app(app)
+    # as DOMSQLAlchemy does for its engines
+    queries.instrument(engine)
+
+    @app.route("/timed")
+    def timed():
+        with timing.timed("marshmallow"):
+            with timing.timed("marshmallow"):
+                pass
+            engine.execute("SELECT 1")
+        return "ok"
+
+    return app
+
+def test__timed(app):
+    with timing.timed("sql"):
+        assert timing.current_timings() is None, "nothing is timed outside of a request"
+
+    with app.test_request_context():
+        with timing.timed("sql"):
+            pass
+        assert timing.current_timings() is None, "requests are not sampled by default"
+
+    app.config["TIMING_SAMPLE_RATE"] = 0.5
+    with app.test_request_context(), mock.patch("random.random", return_value=0.4):
+        with timing.timed("sql"):
+            pass
+        with timing.timed("sql"):
+            pass
+        timings = timing.current_timings()
+        assert set(timings.phases) == { "sql" }, "sampled requests are timed"
+        assert not timings.active, "no phases left active"
+
+    with app.test_request_context(), mock.patch("random.random", return_value=0.6):
+        assert timing.current_timings() is None, "requests are sampled at TIMING_SAMPLE_RATE"
+
+def test__server_timing(timed_app):
+    with timed_app.test_client() as client:
+        response = client.get("/timed")
+        header = response.headers["Server-Timing"]
+        assert [ entry.split(";")[0] for entry in header.split(", ") ] == ["marshmallow", "sql", "total"], \
+               "phases and total are returned"
+        assert all(entry.split(";")[1].startswith("dur=") for entry in header.split(", ")), "durations set"
+
+        timed_app.config["TIMING_SAMPLE_RATE"] = 0
+        assert "Server-Timing" not in client.get("/timed").headers, "no header for requests not sampled"
+
+    stats = timing.timing_stats(timed_app).to_dict()
+    assert set(stats) == { "timed" }, "stats kept by endpoint"
+    assert set(stats["timed"]) == { "marshmallow", "sql", "total" }, "stats kept by phase"
+    assert stats["timed"]["total"]["count"] == 1, "only sampled requests are counted"
+    assert sum(count for _, count in stats["timed"]["sql"]["buckets"]) == 1, "histogram counted"
+    assert stats["timed"]["sql"]["buckets"][-1][0] == "+Inf", "last bucket is unbounded"
+
+def test__histogram():
+    histogram = timing.Histogram()
+    for ms in (0.5, 1, 3, 20000):
+        histogram.add(ms)
+
+    result = histogram.to_dict()
+    assert result["count"] == 4 and result["max_ms"] == 20000, "count and max kept"
+    assert [ count for _, count in result["buckets"] ] == [2, 0, 1] + [0] * 10 + [1], "bucketed by upper bound"
+
+def test__timing_endpoint(timed_app, groups_session):
+    from directorofme.flask import versioned_api
+
+    v_api = versioned_api("test")
+    timed_app.register_blueprint(v_api.blueprint)
+
+    with timed_app.test_client() as client:
+        client.get("/timed")
+        assert client.get("/api/-/test/timing").status_code == 403, "admin only"
+
+        groups_session.groups = [ groups.admin ]
+        response = client.get("/api/-/test/timing")
+        assert response.status_code == 200, "admins can read stats"
+        assert dict_from_response(response)["sample_rate"] == 1, "sample rate returned"
+        assert "timed" in dict_from_response(response)["endpoints"], "stats returned"
@@ -0,0 +1,37 @@
+import flask
+import marshmallow
+
+from types import SimpleNamespace
+from unittest import mock
+
+from flask_marshmallow import Marshmallow
+
+from directorofme.flask import workers, monolith
+from directorofme.flask.api import Spec
+from directorofme.transport import Transport
+
+def test__warmup(app):
+    built = []
+    spec = Spec(Marshmallow(app), app, title="test", version="1")
+
+    @spec.register_schema("WarmSchema")
+    class WarmSchema(marshmallow.Schema):
+        name = marshmallow.fields.String()
+
+        def __init__(self, *args, **kwargs):
+            built.append(self)
+            super().__init__(*args, **kwargs)
+
+    workers.warmup(app)
+    assert "WarmSchema" in spec.to_dict()["definitions"], "spec built"
+    assert built, "registered schemas instantiated"
+    assert "dom-cache" in app.extensions, "cache backend created"
+
+def test__post_worker_init(app):
+    other = flask.Flask("other")
+    worker = SimpleNamespace(wsgi=monolith.Monolith([ app, other ], transport=Transport()),
+                             cfg=SimpleNamespace(workers=1), log=mock.Mock())
+
+    workers.post_worker_init(worker)
+    assert "dom-cache" in app.extensions and "dom-cache" in other.extensions, "every app of a monolith warmed up"
+    assert worker.log.info.call_count == 2, "and logged"
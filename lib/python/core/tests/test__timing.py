@@ -0,0 +1,27 @@
+from directorofme import timing
+
+def test__timed():
+    with timing.timed("dom"):
+        assert timing.current_timings() is None, "nothing is timed without a source"
+
+    timings = timing.Timings()
+    current = [ None ]
+    source = lambda: current[0]
+    timing.add_timings_source(source)
+    timing.add_timings_source(source)
+    try:
+        assert timing._sources.count(source) == 1, "sources are added once"
+
+        current[0] = timings
+        with timing.timed("dom"):
+            with timing.timed("dom"):
+                assert timing.current_timings() is timings, "timings from the source"
+        assert set(timings.phases) == { "dom" } and not timings.active, "phase timed once"
+    finally:
+        timing._sources.remove(source)
+
+def test__server_timing():
+    timings = timing.Timings()
+    timings.add("sql", 0.001)
+    timings.add("sql", 0.002)
+    assert timings.server_timing(0.01) == "sql;dur=3.00, total;dur=10.00", "phases and total"
@@ -0,0 +1,190 @@
+import json
+import time
+import threading
+
+import pytest
+import requests
+
+from unittest import mock
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from directorofme import client
+from directorofme.transport import Transport, CircuitOpen, configure_transport, parse_upstreams
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def respond(self):
+        self.server.requests.append((self.command, self.path))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        if self.path.startswith("/api/-/slow"):
+            time.sleep(0.5)
+        status = int(self.path.split("/")[-1]) if self.path.startswith("/api/-/status/") else 200
+        body = json.dumps({ "path": self.path, "host": self.headers.get("Host"), "cookie": self.headers.get("Cookie"),
+                            "proto": self.headers.get("X-Forwarded-Proto") }).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path.endswith("/set-cookie"):
+            self.send_header("Set-Cookie", "set=1; Path=/; Secure")
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = respond
+
+    def address_string(self):
+        return "-"
+
+    def log_message(self, *args):
+        pass
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class UnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def serve(httpd):
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd
+
+@pytest.fixture
+def server():
+    httpd = serve(Server(("127.0.0.1", 0), Handler))
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def unix_server(tmpdir):
+    httpd = serve(UnixServer(str(tmpdir.join("api.sock")), Handler))
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def dom(server, transport):
+    dom = client.DOM("127.0.0.1", transport=transport)
+    dom.url = lambda url: "http://127.0.0.1:{}/api/-/{}".format(server.server_address[1], url)
+    return dom
+
+def test__Transport_pool(server):
+    transport = Transport(pool_size=3)
+    assert client.DOM("test.directorof.me").transport is client.default_transport, "shared transport by default"
+    assert client.DOM("test.directorof.me").get_adapter("https://x") is client.default_transport, "mounted"
+
+    session = dom(server, transport)
+    for _ in range(3):
+        assert session.get("ok")["path"] == "/api/-/ok", "requests sent"
+
+    pool = transport.get_connection("http://127.0.0.1:{}/".format(server.server_address[1]))
+    assert pool.pool.maxsize == 3 and pool.num_connections == 1, "connections kept alive and reused"
+    assert transport.to_dict()["requests"] == 3, "requests counted"
+
+    transport.configure(pool_size=5, read_timeout=1)
+    assert transport.timeout == (3.05, 1), "timeouts configured"
+    assert transport.get_connection("http://example.com/").pool.maxsize == 5, "pools resized"
+    with pytest.raises(TypeError):
+        transport.configure(stats=None)
+
+def test__Transport_timeouts_and_retries(server):
+    transport = Transport(read_timeout=0.1, retries=2, backoff=0.01, breaker_failures=100)
+    session = dom(server, transport)
+
+    with pytest.raises(client.Unavailable):
+        session.get("slow")
+    assert [ m for m, _ in server.requests ] == [ "GET" ] * 3, "timed out GETs retried"
+
+    del server.requests[:]
+    with pytest.raises(client.Unavailable):
+        session.post("slow")
+    assert len(server.requests) == 1, "POSTs aren't retried"
+
+    del server.requests[:]
+    with pytest.raises(client.ServerError):
+        session.put("status/503")
+    assert len(server.requests) == 3, "idempotent requests retried on 503s"
+
+    delays = [ transport.delay(2) for _ in range(100) ]
+    assert all(0 <= d <= 0.04 for d in delays) and len(set(delays)) > 1, "jittered exponential backoff"
+
+    stats = transport.to_dict()
+    assert stats["timeouts"] == 4 and stats["retries"] == 4, "timeouts and retries counted"
+    assert stats["requests"] == 3 and stats["failures"] == 3, "requests counted once, however often retried"
+    assert stats["attempts"] == 7, "attempts counted apart"
+
+def test__Transport_breaker(server):
+    transport = Transport(retries=0, breaker_failures=2, breaker_reset=10)
+    session = dom(server, transport)
+    host = "127.0.0.1:{}".format(server.server_address[1])
+
+    for _ in range(2):
+        with pytest.raises(client.ServerError):
+            session.get("status/502")
+    assert transport.to_dict()["open_breakers"] == [ host ], "breaker opened after repeated failures"
+
+    with pytest.raises(client.Unavailable):
+        session.get("ok")
+    assert len(server.requests) == 2, "requests fail fast while the breaker is open"
+    with pytest.raises(CircuitOpen):
+        transport.admit(host)
+
+    with mock.patch("time.time", return_value=time.time() + 11):
+        assert session.get("ok")["path"] == "/api/-/ok", "a request probes the host once the breaker resets"
+    assert transport.to_dict()["open_breakers"] == [], "breaker closed once the host recovers"
+
+    stats = transport.to_dict()
+    assert stats["breaker_opens"] == 1 and stats["rejected"] == 2, "breaker stats recorded"
+
+    transport = Transport(retries=2, backoff=0.01, breaker_failures=2)
+    with pytest.raises(client.ServerError):
+        dom(server, transport).get("status/502")
+    assert transport.to_dict()["open_breakers"] == [], "retried requests fail once for the breaker"
+
+def test__parse_upstreams():
+    assert parse_upstreams("auth=unix:/run/dom auth.sock, event=http://127.0.0.1:5556/") == {
+        "auth": "http+unix://%2Frun%2Fdom%20auth.sock",
+        "event": "http://127.0.0.1:5556"
+    }, "sockets and loopback urls parsed"
+    assert parse_upstreams(None) == {} and parse_upstreams("") == {}, "no upstreams by default"
+    with pytest.raises(ValueError):
+        parse_upstreams("auth")
+
+def test__Transport_upstreams(server, unix_server):
+    transport = Transport(internal_host="test.directorof.me", upstreams="auth=unix:{},event=http://127.0.0.1:{}".format(
+        unix_server.server_address, server.server_address[1]))
+    session = client.DOM("test.directorof.me", transport=transport, access_token="token")
+
+    response = session.get("auth/set-cookie")
+    assert response == { "path": "/api/-/auth/set-cookie", "host": "test.directorof.me", "proto": "https",
+                         "cookie": "access_token_cookie=token" }, "routed over the socket with host and cookies"
+    assert session.cookies.get("set", domain="test.directorof.me") == "1", "cookies kept for the public host"
+    assert unix_server.requests == [ ("GET", "/api/-/auth/set-cookie") ], "served by the socket upstream"
+
+    assert session.post("event/events/", { "a": 1 })["host"] == "test.directorof.me", "routed over loopback"
+    assert server.requests == [ ("POST", "/api/-/event/events/") ], "served by the loopback upstream"
+    assert transport.to_dict()["routed"] == 2, "routed requests counted"
+
+    for url in ("https://test.directorof.me/api/-/slack/x", "https://other.example.com/api/-/auth/x",
+                "https://test.directorof.me/auth/x"):
+        assert transport.upstream(url) is None, "only internal apis with upstreams are routed"
+
+    routed = transport.route(requests.Request("GET", "https://test.directorof.me/api/-/auth/x").prepare())
+    pool = transport.get_connection(routed.url)
+    assert transport.get_connection_with_tls_context(routed, True) is pool, \
+           "requests >= 2.32 gets the same socket pool"
+
+def test__configure_transport():
+    transport = Transport()
+    configure_transport({ "DOM_CLIENT_READ_TIMEOUT": 5.0, "DOM_CLIENT_RETRIES": None,
+                          "DOM_CLIENT_BREAKER_FAILURES": 3, "DOM_CLIENT_UPSTREAMS": "auth=unix:/run/auth.sock",
+                          "SERVER_NAME": "test.directorof.me" }, transport)
+    assert transport.read_timeout == 5.0 and transport.breaker_failures == 3, "settings applied"
+    assert transport.upstreams == { "auth": "http+unix://%2Frun%2Fauth.sock" }, "upstreams parsed"
+    assert transport.internal_host == "test.directorof.me", "upstreams used for the server name"
+    assert transport.retries == 2, "unset settings keep their defaults"
@@ -0,0 +1,11 @@
+'''
+The `directorofme_monolith` package, serving the DOM apis and apps from one
+process (see :class:`directorofme.flask.monolith.Monolith`), e.g. for small
+installs and development. Each app is configured from its own prefixed
+environment variables (see :func:`directorofme.flask.monolith.package_environ`).
+'''
+from directorofme.flask.monolith import Monolith
+
+__all__ = [ "app" ]
+
+app = Monolith.from_environ()
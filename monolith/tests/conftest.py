@@ -0,0 +1,61 @@
+import os
+import atexit
+import shutil
+import tempfile
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from directorofme.flask.monolith import DEFAULT_PACKAGES
+
+SERVER_NAME = "test.directorof.me"
+
+def write_keys(directory, name, private_key):
+    private_path, public_path = os.path.join(directory, name + ".pem"), os.path.join(directory, name + "_pub.pem")
+    with open(private_path, "wb") as private_file:
+        private_file.write(private_key.private_bytes(serialization.Encoding.PEM,
+                                                     serialization.PrivateFormat.TraditionalOpenSSL,
+                                                     serialization.NoEncryption()))
+    with open(public_path, "wb") as public_file:
+        public_file.write(private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                                serialization.PublicFormat.SubjectPublicKeyInfo))
+    return private_path, public_path
+
+def write_file(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, "w") as written:
+        written.write(content)
+    return path
+
+def monolith_environ(directory):
+    """The environment of every app in the monolith, as its Makefile would set it up (see `monolith-env`)"""
+    jwt_key, jwt_public_key = write_keys(directory, "jwt", ec.generate_private_key(ec.SECP521R1(), default_backend()))
+    app_key, app_public_key = write_keys(directory, "app", rsa.generate_private_key(65537, 2048, default_backend()))
+
+    common = {
+        "SERVER_NAME": SERVER_NAME,
+        "APP_DB_ENGINE": "sqlite://",
+        "JWT_PUBLIC_KEY_FILE": jwt_public_key,
+        "CURSOR_SECRET_KEY": "monolith-test",
+    }
+    apps = {
+        "directorofme_auth": { "API_NAME": "auth", "JWT_PRIVATE_KEY_FILE": jwt_key },
+        "directorofme_event": {
+            "API_NAME": "event",
+            "APP_DB_ENGINE": "sqlite:///{}".format(os.path.join(directory, "event.db")),
+            "PUSH_REFRESH_TOKEN_FILE": write_file(directory, "push_refresh_token", "refresh"),
+            "PUSH_REFRESH_CSRF_TOKEN_FILE": write_file(directory, "push_refresh_csrf_token", "csrf"),
+        },
+        "directorofme_slack": { "API_NAME": "slack", "SLACK_PRIVATE_KEY_FILE": app_key,
+                                "SLACK_PUBLIC_KEY_FILE": app_public_key },
+        "directorofme_calendar": { "API_NAME": "calendar", "CALENDAR_PRIVATE_KEY_FILE": app_key,
+                                   "CALENDAR_PUBLIC_KEY_FILE": app_public_key },
+    }
+    return { "{}__{}".format(package.upper(), k): v
+                 for package in DEFAULT_PACKAGES for k,v in dict(common, **apps[package]).items() }
+
+# the apps are configured when the monolith is imported
+_directory = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, _directory, True)
+os.environ.update(monolith_environ(_directory))
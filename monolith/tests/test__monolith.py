@@ -0,0 +1,47 @@
+import json
+
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from directorofme.client import DOM
+from directorofme.transport import default_transport
+# the monolith imports (and so configures) each app
+from directorofme_monolith import app
+
+import directorofme_auth
+import directorofme_event
+import directorofme_slack
+import directorofme_calendar
+
+BASE_URL = "https://{}".format(directorofme_event.app.config["SERVER_NAME"])
+
+def test__apps():
+    assert app.apis == {
+        "auth": directorofme_auth.app,
+        "event": directorofme_event.app,
+        "slack": directorofme_slack.app,
+        "calendar": directorofme_calendar.app,
+    }, "every package is served by its api"
+    assert directorofme_event.app.config["PUSH_REFRESH_TOKEN"] == "refresh", "apps configured from their environment"
+    assert directorofme_auth.app.config.get("JWT_PRIVATE_KEY"), "only the auth app has the private key"
+    assert not directorofme_event.app.config.get("JWT_PRIVATE_KEY"), "and no other"
+
+def test__dispatch():
+    client = Client(app, BaseResponse)
+    for api in ("auth", "event", "slack", "calendar"):
+        response = client.get("/api/-/{}/swagger.json".format(api), base_url=BASE_URL)
+        assert response.status_code == 200, "{} api served".format(api)
+        assert any(path.startswith("/api/{{api_version}}/{}/".format(api))
+                       for path in json.loads(response.get_data(as_text=True))["paths"]), \
+               "by the {} app".format(api)
+
+    with directorofme_event.app.app_context():
+        directorofme_event.models.EventType.__table__.create(directorofme_event.db.get_engine())
+    response = client.get("/api/-/event/event_types/", base_url=BASE_URL)
+    assert response.status_code == 200, "apis query their own database"
+    assert json.loads(response.get_data(as_text=True))["collection"] == [], "nothing visible without a session"
+
+def test__in_process_clients():
+    dispatched = default_transport.stats["dispatched"]
+    assert "paths" in DOM(directorofme_event.app.config["SERVER_NAME"]).get("event/swagger.json"), "clients call apis in process"
+    assert default_transport.stats["dispatched"] == dispatched + 1, "without the network"